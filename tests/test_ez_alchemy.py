@@ -1,6 +1,9 @@
 import os
 import unittest
+import warnings
+from types import SimpleNamespace
 from toolbox.ez_alchemy import EZOracle, ez_query, _Examples
+from toolbox.ez_alchemy import ez_alchemy
 import pandas as pd
 from sqlalchemy import engine
 from toolbox.simple_password import get_credentials
@@ -63,6 +66,14 @@ class TestEZQuery(unittest.TestCase):
         df = ez_query(sql = "select sysdate from dual", host = self.host,
                       user = self.usr, pw = self.pw)
 
+    def test_ez_query_many(self):
+        r = ez_alchemy.ez_query_many("select 1 as n from dual", hosts = [self.host, 'NO_SUCH_DB'],
+                                     user = self.usr, pw = self.pw)
+        self.assertEqual(list(r.result.columns), ['host', 'n'])
+        self.assertEqual(list(r.result['host']), [self.host])
+        self.assertEqual(sorted(r.timings), sorted([self.host, 'NO_SUCH_DB']))
+        self.assertEqual(list(r.errors), ['NO_SUCH_DB'])
+
 class TestEZOracle(unittest.TestCase):
     def setUp(self):
         print ("\nCalling TestOSWrapper.setUp()...")
@@ -122,6 +133,273 @@ class TestEZOracle(unittest.TestCase):
         pass
 
 
+class TestEngineRegistry(unittest.TestCase):
+    """ Uses sqlite, so no database login is needed. """
+    def setUp(self):
+        self.url = 'sqlite:///' + os.path.join(os.environ['temp'], 'test_ez_alchemy.db')
+
+    def tearDown(self):
+        ez_alchemy.dispose_engines()
+
+    def test_engine_key(self):
+        self.assertEqual(ez_alchemy.engine_key('oracle+cx_oracle://Me:pw@MYPRD'),
+                         ('oracle', 'cx_oracle', 'myprd', 'me'))
+
+    def test_get_engine_is_shared(self):
+        e1 = ez_alchemy.get_engine(self.url)
+        e2 = ez_alchemy.get_engine(self.url)
+        self.assertIs(e1, e2)
+        self.assertEqual(e1.pool.size(), tb_cfg['EZ_ALCHEMY']['POOL_SIZE'])
+        ez_alchemy.dispose_engine(e1)
+        self.assertIsNot(e1, ez_alchemy.get_engine(self.url))
+
+    def test_get_engine_warns_on_different_kwargs(self):
+        e1 = ez_alchemy.get_engine(self.url, pool_size = 2)
+        with warnings.catch_warnings(record = True) as caught:
+            warnings.simplefilter('always')
+            self.assertIs(ez_alchemy.get_engine(self.url), e1)
+            self.assertIs(ez_alchemy.get_engine(self.url, pool_size = 2), e1)
+            self.assertEqual(caught, [])
+            self.assertIs(ez_alchemy.get_engine(self.url, pool_size = 3), e1)
+        self.assertEqual(len(caught), 1)
+        self.assertEqual(e1.pool.size(), 2)
+
+    def test_share_engine_is_keyword_only(self):
+        import inspect
+        for cls in (ez_alchemy.EZDB, ez_alchemy.EZOracle):
+            # positional arguments after the named ones are still engine_args
+            self.assertEqual(inspect.Parameter.KEYWORD_ONLY,
+                             inspect.signature(cls).parameters['share_engine'].kind)
+
+    def test_login_failure_keeps_shared_engine(self):
+        shared = ez_alchemy.get_engine(self.url)
+        db = ez_alchemy.EZDB(hosts = 'sqlite', user = 'user', pw = 'pw',
+                             login_on_instantiate = False,
+                             dialect = 'sqlite', sql_driver = 'pysqlite')
+        db._engine = shared
+        db._dispose_engine()
+        self.assertIsNone(db._engine)
+        self.assertIs(ez_alchemy.get_engine(self.url), shared)
+
+
+
+class TestEZQueryMany(unittest.TestCase):
+    """ ez_query_many with each host's query replaced, so no database login is needed. """
+    def test_host_column_clash(self):
+        from unittest import mock
+
+        def query_host(sql, host, user, pw):
+            if host == 'CLASH':
+                return pd.DataFrame({'host': ['x'], 'n': [1]})
+            return pd.DataFrame({'n': [1]})
+
+        with mock.patch.object(ez_alchemy, '_query_host', query_host):
+            r = ez_alchemy.ez_query_many('select 1 as n from dual', hosts = ['OK', 'CLASH'],
+                                         user = 'me', pw = 'pw')
+        # the clash is reported for its host; the other hosts' results are kept
+        self.assertEqual(['CLASH'], list(r.errors))
+        self.assertIsInstance(r.errors['CLASH'], ValueError)
+        self.assertEqual([['OK', 1]], r.result.values.tolist())
+        self.assertEqual({'OK', 'CLASH'}, set(r.timings))
+
+
+class SqliteTestCase(unittest.TestCase):
+    """ An EZDB on a sqlite database with table t (a integer, b text) of 25 rows. """
+    def setUp(self):
+        self.file = os.path.join(os.environ['temp'], 'test_ez_alchemy_t.db')
+        if os.path.exists(self.file):
+            os.remove(self.file)
+        self.engine = ez_alchemy.get_engine('sqlite:///' + self.file)
+        self.engine.execute('create table t (a integer, b text)')
+        self.engine.execute('insert into t values ' +
+                            ','.join(f"({i}, 'x{i}')" for i in range(25)))
+        self.db = ez_alchemy.EZDB(hosts = 'sqlite', user = 'user', pw = 'pw',
+                                  login_on_instantiate = False,
+                                  dialect = 'sqlite', sql_driver = 'pysqlite')
+        self.db._engine = self.engine
+
+    def tearDown(self):
+        ez_alchemy.dispose_engines()
+        os.remove(self.file)
+
+
+class TestStream(SqliteTestCase):
+    def test_stream_dataframes(self):
+        chunks = list(self.db.stream('select * from t', chunksize = 10))
+        self.assertEqual([len(df) for df in chunks], [10, 10, 5])
+        self.assertEqual(list(chunks[-1].index), list(range(20, 25)))
+        self.assertEqual(list(chunks[0].columns), ['a', 'b'])
+
+    def test_stream_rows(self):
+        chunks = list(self.db.stream('select a from t', chunksize = 7, as_dataframe = False))
+        self.assertEqual([len(rows) for rows in chunks], [7, 7, 7, 4])
+        self.assertEqual(chunks[0][0], (0,))
+
+    def test_lazy_itertuples(self):
+        self.db.chunksize = 10
+        self.db.sql = 'select * from t'
+        rows = list(self.db.itertuples(index = True))
+        self.assertEqual(len(rows), 25)
+        self.assertEqual(rows[-1], (24, 24, 'x24'))
+        self.assertEqual(sum(1 for _ in self.db.iterrows()), 25)
+
+    def test_stream_sql_is_not_bound(self):
+        # ':b' is not a bind parameter, as it is not in execute
+        sql = "select 'at :b' as c from t where a < 3"
+        chunks = list(self.db.stream(sql, as_dataframe = False))
+        self.assertEqual([[('at :b',)] * 3], chunks)
+
+    def test_chunksize_is_keyword_only(self):
+        import inspect
+        for cls in (ez_alchemy.EZDB, ez_alchemy.EZOracle):
+            self.assertEqual(inspect.Parameter.KEYWORD_ONLY,
+                             inspect.signature(cls).parameters['chunksize'].kind)
+
+    def test_stream_executes_before_returning(self):
+        with self.assertRaises(Exception):
+            self.db.stream('select * from no_such_table')
+        self.db.chunksize = 10
+        with self.assertRaises(Exception):
+            self.db.execute('select * from no_such_table')
+        chunks = self.db.execute('select * from t')
+        self.assertEqual(sum(len(df) for df in chunks), 25)
+
+
+class TestBulkInsert(SqliteTestCase):
+    def test_bulk_insert_dataframe(self):
+        df = pd.DataFrame({'a': range(100), 'b': [None] + ['y'] * 99})
+        batches = []
+        stats = self.db.bulk_insert('t', df, batch_size = 30, callback = batches.append)
+        self.assertEqual((stats.rows, stats.batches), (100, 4))
+        self.assertEqual([s.rows for s in batches], [30, 60, 90, 100])
+        self.assertGreater(stats.rows_per_second, 0)
+        self.assertEqual(self.engine.execute('select count(*), sum(b is null) from t').fetchall(),
+                         [(125, 1)])
+
+    def test_bulk_insert_rows(self):
+        stats = self.db.bulk_insert('t', [(100, 'z'), (101, 'z')], columns = ['a', 'b'])
+        self.assertEqual(stats.rows, 2)
+        stats = self.db.bulk_insert('t', [{'a': 102, 'b': 'z'}])
+        self.assertEqual(stats.rows, 1)
+        self.assertEqual(self.engine.execute("select count(*) from t where b = 'z'").scalar(), 3)
+
+
+@unittest.skipIf(ez_alchemy.pa is None, 'pyarrow is not installed')
+class TestArrow(SqliteTestCase):
+    def test_fetch_arrow(self):
+        table = self.db.fetch_arrow('select * from t', chunksize = 10)
+        self.assertEqual(table.num_rows, 25)
+        self.assertEqual(table.column_names, ['a', 'b'])
+        df = self.db.fetch_arrow('select * from t', to_pandas = True)
+        self.assertEqual(str(df['b'].dtype), 'string[pyarrow]')
+        self.assertEqual(self.db.execute('select a from t', as_arrow = True).num_rows, 25)
+
+    def test_null_column_typed_by_later_batch(self):
+        sql = "select a, case when a < 12 then null else b end as b from t"
+        table = self.db.fetch_arrow(sql, chunksize = 10)
+        self.assertEqual(str(table.schema.field('b').type), 'string')
+
+    def test_integer_batches_promoted_to_float(self):
+        sql = "select case when a < 12 then a else a + 0.5 end as c from t"
+        table = self.db.fetch_arrow(sql, chunksize = 10)
+        self.assertEqual(str(table.schema.field('c').type), 'double')
+        self.assertEqual(table.column('c')[-1].as_py(), 24.5)
+
+    def test_arrow_type_from_description(self):
+        def column(type_name, precision = None, scale = None):
+            return ('C', SimpleNamespace(name = type_name), None, None, precision, scale, True)
+        arrow_type = ez_alchemy._arrow_type
+        self.assertEqual(str(arrow_type(column('DB_TYPE_NUMBER', 10, 0))), 'int64')
+        self.assertEqual(str(arrow_type(column('DB_TYPE_NUMBER', 38, 0))), 'decimal128(38, 0)')
+        self.assertEqual(str(arrow_type(column('DB_TYPE_NUMBER', 0, -127))), 'double')
+        self.assertEqual(str(arrow_type(column('DB_TYPE_VARCHAR'))), 'string')
+        self.assertEqual(str(arrow_type(column('DB_TYPE_DATE'))), 'timestamp[us]')
+        self.assertIsNone(arrow_type(('C', None, None, None, None, None, None)))
+
+    def test_to_parquet(self):
+        path = os.path.join(os.environ['temp'], 'test_ez_alchemy_t.parquet')
+        sql = "select a, case when a < 12 then null else b end as b from t"
+        self.assertEqual(self.db.to_parquet(path, sql, chunksize = 10), 25)
+        df = pd.read_parquet(path)
+        self.assertEqual(len(df), 25)
+        self.assertEqual(df['b'].iloc[-1], 'x24')
+        os.remove(path)
+
+    def test_to_parquet_widens_inferred_types(self):
+        import pyarrow.parquet as pq
+        path = os.path.join(os.environ['temp'], 'test_ez_alchemy_t.parquet')
+        sql = ("select case when a < 12 then a else a + 0.5 end as c, "
+               "case when a < 12 then null else a end as d from t")
+        self.assertEqual(self.db.to_parquet(path, sql, chunksize = 10), 25)
+        table = pq.read_table(path)
+        self.assertEqual(str(table.schema.field('c').type), 'double')
+        self.assertEqual(table.column('c')[-1].as_py(), 24.5)
+        # all NULL in the first batch, integers later: not written as strings
+        self.assertEqual(str(table.schema.field('d').type), 'int64')
+        self.assertEqual(table.column('d')[-1].as_py(), 24)
+        os.remove(path)
+
+    def test_to_parquet_error_leaves_no_file(self):
+        folder = os.path.join(os.environ['temp'], 'test_ez_alchemy_parquet')
+        os.makedirs(folder, exist_ok = True)
+        path = os.path.join(folder, 't.parquet')
+        # text in the last batch cannot be cast to the integers of the first
+        sql = "select case when a < 20 then a else 'text' end as c from t"
+        with self.assertRaises(Exception):
+            self.db.to_parquet(path, sql, chunksize = 10)
+        self.assertEqual([], os.listdir(folder))
+        os.rmdir(folder)
+
+
+
+class TestQueryCache(unittest.TestCase):
+    def setUp(self):
+        folder = os.path.join(os.environ['temp'], 'test_ez_query_cache')
+        self.cache = ez_alchemy.QueryCache(folder = folder, ttl = 60)
+        self.cache.clear()
+        self.df = pd.DataFrame({'a': range(1000), 'b': ['x' * 10] * 1000})
+
+    def tearDown(self):
+        self.cache.clear()
+
+    def test_get_put(self):
+        self.assertIsNone(self.cache.get('MYPRD', 'me', 'select * from t'))
+        self.cache.put('MYPRD', 'me', 'select *\n  from t;', self.df)
+        # host and user are case insensitive; whitespace and ";" are normalized
+        pd.testing.assert_frame_equal(self.cache.get('myprd', 'ME', 'select * from t'), self.df)
+        self.assertIsNone(self.cache.get('MYSTG', 'me', 'select * from t'))
+        # expired
+        self.assertIsNone(self.cache.get('MYPRD', 'me', 'select * from t', ttl = 0))
+        self.assertIsNone(self.cache.get('MYPRD', 'me', 'select * from t'))
+
+    def test_normalize_sql_keeps_quoted_whitespace(self):
+        normalize = ez_alchemy.QueryCache.normalize_sql
+        self.assertEqual(normalize("select *\n  from t where s = 'a  b' ;"),
+                         "select * from t where s = 'a  b'")
+        self.assertEqual(normalize('select "A  B",  \'it\'\'s  ok\' from t'),
+                         'select "A  B", \'it\'\'s  ok\' from t')
+        self.cache.put('MYPRD', 'me', "select * from t where s = 'a  b'", self.df)
+        self.assertIsNone(self.cache.get('MYPRD', 'me', "select * from t where s = 'a b'"))
+
+    def test_lru_eviction(self):
+        self.cache.put('MYPRD', 'me', 'select 1', self.df)
+        one_result_mb = self.cache._read_index()[self.cache.key('MYPRD', 'me', 'select 1')]['bytes'] / 2 ** 20
+        self.cache.max_mb = 2.5 * one_result_mb
+        self.cache.put('MYPRD', 'me', 'select 2', self.df)
+        self.cache.get('MYPRD', 'me', 'select 1')  # select 1 is now the most recently used
+        self.cache.put('MYPRD', 'me', 'select 3', self.df)
+        self.assertIsNotNone(self.cache.get('MYPRD', 'me', 'select 1'))
+        self.assertIsNone(self.cache.get('MYPRD', 'me', 'select 2'))
+        self.assertIsNotNone(self.cache.get('MYPRD', 'me', 'select 3'))
+
+    def test_invalidate(self):
+        self.cache.put('MYPRD', 'me', 'select 1', self.df)
+        self.cache.put('MYSTG', 'me', 'select 1', self.df)
+        self.assertEqual(self.cache.invalidate(host = 'myprd'), 1)
+        self.assertIsNone(self.cache.get('MYPRD', 'me', 'select 1'))
+        self.assertIsNotNone(self.cache.get('MYSTG', 'me', 'select 1'))
+
+
 if __name__ == '__main__':
     ### 2 - invoke the framework ###
     # invoke the unittest framework
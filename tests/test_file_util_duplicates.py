@@ -0,0 +1,97 @@
+# 1 - Import unittest (find 2 under "if __name__ == '__main__'")
+import unittest
+from toolbox.file_util import duplicates as d
+import os
+import tempfile
+
+
+class TestDuplicates(unittest.TestCase):
+    def setUp(self):
+        print('')
+        print(r"Calling .setUp()...")
+
+    def tearDown(self):
+        print('')
+        print(r"Calling .tearDown()...")
+
+    def test_find_duplicates(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            def write(name, content):
+                fn = os.path.join(tmp, name)
+                os.makedirs(os.path.dirname(fn), exist_ok = True)
+                with open(fn, 'wb') as writer:
+                    writer.write(content)
+                return fn
+
+            big = os.urandom(d.HEAD_SIZE * 3)
+            # same size and head, different tail: only a full hash tells them apart
+            big_tail = big[:-1] + bytes([big[-1] ^ 0xFF])
+            a = write('a/big.bin', big)
+            b = write('b/c/big_copy.bin', big)
+            write('b/big_tail.bin', big_tail)
+            s1 = write('a/small.txt', b'hello world')
+            s2 = write('b/small.txt', b'hello world')
+            write('b/other.txt', b'bye-bye world')
+            write('b/unique.txt', b'hi')
+            write('a/empty1.txt', b'')
+            write('b/empty2.txt', b'')
+            links = [a]
+            if hasattr(os, 'link'):
+                try:
+                    # a hard link is the same file, not a duplicate
+                    os.link(a, os.path.join(tmp, 'a', 'big_link.bin'))
+                    links.append(os.path.join(tmp, 'a', 'big_link.bin'))
+                except OSError:
+                    pass
+
+            sizes = d.scan_sizes(tmp)
+            self.assertNotIn(0, sizes)
+            self.assertEqual([b'hi'], [open(f, 'rb').read() for f in sizes[2]])
+
+            result = d.find_duplicates([os.path.join(tmp, 'a'), os.path.join(tmp, 'b')],
+                                       use_index = False)
+            self.assertEqual(d.DUPLICATE_COLUMNS, list(result.columns))
+            groups = result.groupby('group')['path'].apply(sorted).tolist()
+            # only one of the hard links to big.bin is reported
+            big_group = [f for f in groups[0] if f != b]
+            self.assertEqual(1, len(big_group))
+            self.assertIn(big_group[0], links)
+            self.assertIn(b, groups[0])
+            self.assertEqual(sorted([s1, s2]), groups[1])
+            self.assertEqual([len(big)] * 2 + [11] * 2, result['size'].tolist())
+
+            # empty files are included if min_size = 0
+            result = d.find_duplicates(tmp, min_size = 0, use_index = False)
+            self.assertEqual(3, result['group'].nunique())
+
+            out = os.path.join(tmp, 'duplicates.csv')
+            d.find_duplicates(tmp, output_file = out, use_index = False)
+            import pandas as pd
+            self.assertEqual(4, len(pd.read_csv(out)))
+
+    def test_find_duplicates_hashes_all_sizes_at_once(self):
+        from unittest import mock
+        with tempfile.TemporaryDirectory() as tmp:
+            for i in range(5):
+                content = bytes([i]) * (d.HEAD_SIZE + 1 + i)
+                for copy in 'ab':
+                    with open(os.path.join(tmp, f'{i}{copy}.bin'), 'wb') as writer:
+                        writer.write(content)
+            with mock.patch.object(d, 'hash_many', wraps = d.hash_many) as hash_many, \
+                    mock.patch.object(d.hash_index, 'save') as save:
+                save_every = d.hash_index.save_every
+                result = d.find_duplicates(tmp, use_index = True)
+            self.assertEqual(1, hash_many.call_count)
+            self.assertEqual(10, len(hash_many.call_args[0][0]))
+            self.assertEqual(1, save.call_count)
+            self.assertEqual(save_every, d.hash_index.save_every)
+            self.assertEqual(5, result['group'].nunique())
+            self.assertEqual(sorted(result['size'], reverse = True), result['size'].tolist())
+
+
+if __name__ == '__main__':
+    ### 2 - invoke the framework ###
+    # invoke the unittest framework
+    # unittest.main() will capture all fo the tests
+    # and run them 1-by-1.
+    unittest.main()
@@ -85,6 +85,16 @@ class TestFTP(unittest.TestCase):
         self.assertTrue(isinstance(x, dtdt))
         # self.assertEqual(x, cbm.modified)
 
+    def test_modified_exact(self):
+        # ftp.pjm.com only supports LIST, whose times are only to the minute, so
+        # modified() must come from MDTM, not from the listing
+        ftp = ez_ftp.FTP(cbm_url)
+        ftp.listing(cbm.dirname, refresh = True)
+        self.assertFalse(ftp.listing_times_exact())
+        mdtm = dtdt.strptime(ftp.voidcmd(f'MDTM {cbm.path}')[4:].strip()[:14], '%Y%m%d%H%M%S')
+        self.assertEqual(mdtm, ftp.modified(cbm_url))
+        ftp.quit()
+
     def test_size(self):
         x = ez_ftp.FTP().size(cbm_url)
         self.assertTrue(x > 100000)
@@ -125,6 +135,83 @@ class TestFTP(unittest.TestCase):
         ftp.download(cbm_url, tgt_folder = 'c:/temp')
         ftp.download(cbm.netloc + cbm.path, tgt_folder = 'c:/temp')
 
+    def test_download_stale_part(self):
+        import json
+        import os
+        import tempfile
+        with tempfile.TemporaryDirectory() as tmp:
+            part_file = os.path.join(tmp, cbm.basename + '.part')
+            # a .part file left by a download of an older version of the file
+            with open(part_file, 'wb') as f:
+                f.write(b'x' * 1000)
+            with open(part_file + '.json', 'w') as f:
+                json.dump({'url': cbm_url, 'size': cbm.size, 'modified': '2000-01-01T00:00:00'}, f)
+            ftp = ez_ftp.FTP(cbm_url)
+            result = ftp.download(cbm_url, tgt_folder = tmp)
+            ftp.quit()
+            # the download started over instead of appending to the stale .part file
+            self.assertEqual(result.size, os.path.getsize(result.target_filename))
+            with open(result.target_filename, 'rb') as f:
+                self.assertNotEqual(b'x' * 1000, f.read(1000))
+            self.assertEqual([cbm.basename], os.listdir(tmp))
+
+    def test_download_rest_refused(self):
+        import ftplib
+        import json
+        import os
+        import tempfile
+        with tempfile.TemporaryDirectory() as tmp:
+            ftp = ez_ftp.FTP(cbm_url)
+            stats = ftp.stats(cbm_url)
+            part_file = os.path.join(tmp, cbm.basename + '.part')
+            # a .part file of this same version, which the server will not resume
+            with open(part_file, 'wb') as f:
+                f.write(b'x' * 1000)
+            with open(part_file + '.json', 'w') as f:
+                json.dump({'url': cbm_url, 'size': stats.size,
+                           'modified': stats.modified.isoformat()}, f)
+            sendcmd = ftp.sendcmd
+
+            def no_rest(cmd):
+                if cmd.startswith('REST'):
+                    raise ftplib.error_perm('502 Command not implemented.')
+                return sendcmd(cmd)
+
+            ftp.sendcmd = no_rest
+            result = ftp.download(cbm_url, tgt_folder = tmp)
+            ftp.quit()
+            # the download started over from the first byte
+            self.assertEqual(stats.size, os.path.getsize(result.target_filename))
+            with open(result.target_filename, 'rb') as f:
+                self.assertNotEqual(b'x' * 1000, f.read(1000))
+            self.assertEqual([cbm.basename], os.listdir(tmp))
+
+    def test_download_many(self):
+        progress = []
+        results = ez_ftp.download_many([cbm_url, 'ftp://ftp.pjm.com/oasis/no_such_file.pdf'],
+                                       tgt_folder = 'c:/temp', callback = progress.append)
+        self.assertEqual(len(results), 2)
+        self.assertEqual(results[0].size, cbm.size)
+        self.assertTrue(ez_ftp.compare_to_local(results[0].target_filename, cbm_url).size_match)
+        self.assertIsInstance(results[1], Exception)
+        self.assertTrue(progress[-1].done)
+        self.assertEqual(progress[-1].received, cbm.size)
+
+    def test_same_as_local(self):
+        ftp = ez_ftp.FTP(host_or_url='ftp.pjm.com')
+        good = ftp.download(cbm_url, tgt_folder = 'c:/temp').target_filename
+        self.assertTrue(ftp.same_as_local(cbm_url, good))
+        # same size, different first block: the transfer stops early
+        bad = good + '.bad'
+        with open(good, 'rb') as f:
+            data = bytearray(f.read())
+        data[0] ^= 1
+        with open(bad, 'wb') as f:
+            f.write(data)
+        self.assertFalse(ftp.same_as_local(cbm_url, bad))
+        # and the connection can still be used
+        self.assertEqual(ftp.size(cbm_url), cbm.size)
+
     def test_stats(self):
         stats = ez_ftp.stats('ftp://ftp.pjm.com/oasis/CBMID.pdf')
         self.assertEqual(stats.scheme, 'ftp', f'scheme should be "ftp", but is "{stats.scheme}"')
@@ -201,8 +288,56 @@ class TestFTP(unittest.TestCase):
         self.assertEqual(tpl.is_dir, False)
 
     def test_walk(self):
-        # TODO: write FTP.walk() test script
-        pass
+        ftp = ez_ftp.FTP(host_or_url='ftp.pjm.com')
+        tree = list(ftp.walk('ftp://ftp.pjm.com/oasis', max_depth = 0))
+        self.assertEqual(len(tree), 1)
+        dirpath, dirs, files = tree[0]
+        self.assertEqual(dirpath, '/oasis')
+        self.assertIn(cbm.basename, [f.name for f in files])
+        self.assertEqual([f.size for f in files if f.name == cbm.basename], [cbm.size])
+        # include / exclude globs
+        tree = list(ftp.walk('/oasis', max_depth = 0, include = ['*.pdf'], exclude = ['CBM*']))
+        self.assertTrue(all(f.name.endswith('.pdf') for f in tree[0][2]))
+        self.assertNotIn(cbm.basename, [f.name for f in tree[0][2]])
+        # one level down: every subdirectory of /oasis is listed
+        tree = list(ftp.walk('/oasis', max_depth = 1))
+        self.assertEqual(sorted(d for d, _, _ in tree[1:]),
+                         sorted('/oasis/' + name for name in dirs))
+
+    def test_listdir_get_stats(self):
+        ftp = ez_ftp.FTP(host_or_url='ftp.pjm.com')
+        stats = ftp.listdir(cbm_url, get_stats = True)
+        self.assertEqual(len(stats), 1)
+        self.assertEqual(stats[0].path, cbm.path)
+        self.assertEqual(stats[0].size, cbm.size)
+
+    def test_session_reuse(self):
+        ftp = ez_ftp.FTP()
+        ftp.session(cbm_url)
+        sock = ftp.sock
+        ftp.size(cbm_url)
+        ftp.stats(cbm_url)
+        self.assertIs(sock, ftp.sock)
+        ftp.quit()
+        ftp.session(cbm_url)
+        self.assertIsNot(sock, ftp.sock)
+        ftp.quit()
+
+    def test_ftp_pool(self):
+        pool = ez_ftp.FTPPool(max_idle = 1)
+        with pool.connection(cbm_url) as ftp:
+            self.assertEqual(cbm.size, ftp.size(cbm_url))
+            ftp.cwd(cbm.dirname)
+        with pool.connection(cbm_url) as ftp2:
+            self.assertIs(ftp, ftp2)
+            self.assertEqual(ftp.home, ftp2.pwd())
+            # the pool is empty while ftp2 is out, so this is a new connection
+            ftp3 = pool.acquire(cbm_url)
+            self.assertIsNot(ftp2, ftp3)
+        pool.release(ftp3)
+        self.assertIsNone(ftp3.sock)  # max_idle = 1, so closed instead of kept
+        pool.close()
+        self.assertIsNone(ftp.sock)
 
 class TestFunctions(unittest.TestCase):
     def setUp(self):
@@ -347,6 +482,77 @@ class TestFunctions(unittest.TestCase):
         self.assertTrue(ez_ftp.exists('ftp://ftp.pjm.com/oasis/'))
         # self.assertRaises(AssertionError, ez_ftp.exists('/oasis/'))
 
+    def test_mirror(self):
+        local_dir = 'c:/temp/ez_ftp_mirror'
+        result = ez_ftp.mirror('ftp://ftp.pjm.com/oasis', local_dir, max_depth = 0,
+                               include = [cbm.basename])
+        self.assertFalse(result.failed)
+        self.assertEqual(len(result.downloaded) + len(result.unchanged), 1)
+        # nothing changed, so nothing is downloaded the second time
+        result = ez_ftp.mirror('ftp://ftp.pjm.com/oasis', local_dir, max_depth = 0,
+                               include = [cbm.basename])
+        self.assertEqual(result.downloaded, [])
+        self.assertEqual(len(result.unchanged), 1)
+
+    def test_mirror_delete_outside_filters(self):
+        import os
+        import tempfile
+        with tempfile.TemporaryDirectory() as local_dir:
+            result = ez_ftp.mirror('ftp://ftp.pjm.com/oasis', local_dir, max_depth = 0,
+                                   include = [cbm.basename])
+            self.assertFalse(result.failed)
+            # cbm is still on the server; it is only outside this run's include
+            result = ez_ftp.mirror('ftp://ftp.pjm.com/oasis', local_dir, max_depth = 0,
+                                   include = ['*.no_such_extension'], delete = True)
+            self.assertEqual(result.deleted, [])
+            self.assertTrue(os.path.exists(os.path.join(local_dir, cbm.basename)))
+            result = ez_ftp.mirror('ftp://ftp.pjm.com/oasis', local_dir, max_depth = 0,
+                                   exclude = [cbm.basename], delete = True)
+            self.assertEqual(result.deleted, [])
+            self.assertTrue(os.path.exists(os.path.join(local_dir, cbm.basename)))
+
+    def test_url_split_special_characters(self):
+        # '#' and '?' are legal in ftp file names; they are not a fragment or query
+        parts = ez_ftp.url_split('ftp://ftp.pjm.com/oasis/a#1?.csv')
+        self.assertEqual(parts.path, '/oasis/a#1?.csv')
+        self.assertEqual(parts.basename, 'a#1?.csv')
+        self.assertEqual(parts.url, 'ftp://ftp.pjm.com/oasis/a#1?.csv')
+
+    def test_parse_list_line(self):
+        now = dtdt(2021, 11, 19, 12)
+        # unix: recent entries are listed without a year
+        entry = ez_ftp.parse_list_line(
+            '-rw-r--r--   1 owner    group      150000 Nov 02 09:05 CBMID.pdf', now)
+        self.assertEqual(entry, ez_ftp.ListTuple('CBMID.pdf', dtdt(2021, 11, 2, 9, 5), 150000, False))
+        entry = ez_ftp.parse_list_line(
+            '-rw-r--r--   1 owner    group      150000 Dec 18 04:32 CBMID.pdf', now)
+        self.assertEqual(entry.modified, dtdt(2020, 12, 18, 4, 32))
+        entry = ez_ftp.parse_list_line(
+            'drwxr-xr-x   1 owner    group        4096 Dec 18  2019 my dir', now)
+        self.assertEqual(entry, ez_ftp.ListTuple('my dir', dtdt(2019, 12, 18), None, True))
+        entry = ez_ftp.parse_list_line('lrwxrwxrwx   1 owner group 7 Jan 01  2020 link -> target', now)
+        self.assertEqual(entry.name, 'link')
+        # windows
+        entry = ez_ftp.parse_list_line('11-02-21  09:05AM               150000 CBMID.pdf')
+        self.assertEqual(entry, ez_ftp.ListTuple('CBMID.pdf', dtdt(2021, 11, 2, 9, 5), 150000, False))
+        entry = ez_ftp.parse_list_line('12-10-21  01:47PM       <DIR>          oasis')
+        self.assertEqual(entry, ez_ftp.ListTuple('oasis', dtdt(2021, 12, 10, 13, 47), None, True))
+        # not an entry
+        self.assertIsNone(ez_ftp.parse_list_line('total 12'))
+
+    def test_listing_cache(self):
+        cache = ez_ftp.ListingCache(ttl = 60)
+        key = ('ftp.pjm.com', 21, '/oasis')
+        listing = {'CBMID.pdf': ez_ftp.ListTuple('CBMID.pdf', None, 150000, False)}
+        self.assertIsNone(cache.get(key))
+        cache.put(key, listing)
+        self.assertEqual(cache.get(key), listing)
+        cache.invalidate('FTP.PJM.COM')
+        self.assertIsNone(cache.get(key))
+        cache.ttl = 0
+        cache.put(key, listing)
+        self.assertIsNone(cache.get(key))
+
 
 
 if __name__ == '__main__':
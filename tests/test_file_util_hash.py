@@ -60,6 +60,162 @@ class TestHash(unittest.TestCase):
             self.assertFalse(h.hash_match(files[1], files[2], hash_method = 1))
 
 
+    def test_hash_index(self):
+        import tempfile
+        import time
+        with tempfile.TemporaryDirectory() as tmp:
+            index = h.HashIndex(file = os.path.join(tmp, 'index.json'))
+            fn = os.path.join(tmp, 'known_good.txt')
+            with open(fn, 'wb') as writer:
+                writer.write(b'hello world')
+            # files modified within the racy window are hashed but not indexed
+            self.assertEqual(h._sha256(fn), index.hash(fn, 'sha256', h._sha256))
+            self.assertEqual(0, index.stats.entries)
+
+            old = time.time() - 60
+            os.utime(fn, (old, old))
+            expect = h._sha256(fn)
+            self.assertEqual(expect, index.hash(fn, 'sha256', h._sha256))
+            self.assertEqual(expect, index.hash(fn, 'sha256', lambda f: 'not called'))
+            self.assertEqual(h.IndexStats(1, 2, 1), index.stats)
+
+            # persisted to disk and reloaded
+            index.save()
+            index2 = h.HashIndex(file = index.file)
+            self.assertEqual(expect, index2.get(fn, 'sha256'))
+
+            # a changed stat signature forces a rehash
+            with open(fn, 'wb') as writer:
+                writer.write(b'bye-bye world')
+            os.utime(fn, (old, old + 1))
+            self.assertEqual(h._sha256(fn), index2.hash(fn, 'sha256', h._sha256))
+            self.assertNotEqual(expect, index2.get(fn, 'sha256'))
+
+    def test_hash_index_prune_and_cap(self):
+        import tempfile
+        import time
+        with tempfile.TemporaryDirectory() as tmp:
+            index = h.HashIndex(file = os.path.join(tmp, 'index.json'), max_entries = 2)
+            old = time.time() - 60
+            files = []
+            for i in range(3):
+                fn = os.path.join(tmp, f'file{i}.txt')
+                with open(fn, 'wb') as writer:
+                    writer.write(b'hello world %d' % i)
+                os.utime(fn, (old, old))
+                files.append(fn)
+            index.hash(files[0], 'sha256', h._sha256)
+            index.hash(files[1], 'sha256', h._sha256)
+            index.save()
+
+            # pruned entries are not restored from disk by the next save
+            os.remove(files[0])
+            self.assertEqual(1, index.prune())
+            index.save()
+            self.assertEqual(1, h.HashIndex(file = index.file).stats.entries)
+
+            # past max_entries, the least recently used entries are dropped
+            index.max_entries = 1
+            index.entries[os.path.realpath(files[1])]['used'] = 0
+            index.hash(files[2], 'sha256', h._sha256)
+            index.save()
+            index2 = h.HashIndex(file = index.file)
+            self.assertEqual(1, index2.stats.entries)
+            self.assertIsNotNone(index2.get(files[2], 'sha256'))
+
+    def test_hash_many(self):
+        import hashlib
+        import tempfile
+        with tempfile.TemporaryDirectory() as tmp:
+            contents = [b'', b'hello world', os.urandom(h.BUF_SIZE * 2 + 17)]
+            files = []
+            for i, content in enumerate(contents):
+                fn = os.path.join(tmp, f'file{i}.bin')
+                with open(fn, 'wb') as writer:
+                    writer.write(content)
+                files.append(fn)
+            missing = os.path.join(tmp, 'missing.bin')
+
+            for algorithm in ('sha256', 'md5', 'blake2b'):
+                hashes = h.hash_many(files + [missing], algorithm, workers = 3, use_index = False)
+                self.assertEqual(files + [missing], list(hashes.keys()))
+                for fn, content in zip(files, contents):
+                    self.assertEqual(hashlib.new(algorithm, content).hexdigest(), hashes[fn])
+                    self.assertEqual(hashes[fn], h.hash_file(fn, algorithm, use_index = False))
+                self.assertIsInstance(hashes[missing], OSError)
+
+            # process pool gives the same answer
+            self.assertEqual(h.hash_many(files, 'blake2b', use_index = False),
+                             h.hash_many(files, 'blake2b', use_index = False, processes = True))
+            self.assertTrue(h.hash_match(files[1], files[1], hash_method = 2))
+            self.assertFalse(h.hash_match(files[1], files[2], hash_method = 'blake2b'))
+            with self.assertRaises(OSError):
+                h.hash_match(files[1], missing)
+            if h.xxhash is None:
+                with self.assertRaises(ImportError):
+                    h.hash_many(files, 'xxh64')
+
+    def test_compare_files(self):
+        import tempfile
+        with tempfile.TemporaryDirectory() as tmp:
+            def write(name, content):
+                fn = os.path.join(tmp, name)
+                with open(fn, 'wb') as writer:
+                    writer.write(content)
+                return fn
+
+            size = h.SAMPLE_SIZE * 5 + 3
+            content = os.urandom(size)
+            # a difference outside the head, middle and tail samples
+            middle = bytearray(content)
+            middle[h.SAMPLE_SIZE + 1] ^= 0xFF
+            tail = bytearray(content)
+            tail[-1] ^= 0xFF
+            a = write('a.bin', content)
+            b = write('b.bin', content)
+            c = write('c.bin', bytes(middle))
+            d = write('d.bin', bytes(tail))
+            e = write('e.bin', content + b'!')
+            empty1, empty2 = write('empty1.bin', b''), write('empty2.bin', b'')
+
+            for mode in h.COMPARE_MODES:
+                self.assertTrue(h.compare_files(a, a, mode))
+                self.assertTrue(h.compare_files(a, b, mode))
+                self.assertTrue(h.compare_files(empty1, empty2, mode))
+                self.assertFalse(h.compare_files(a, e, mode))
+            self.assertTrue(h.compare_files(a, d, 'size'))
+            self.assertFalse(h.compare_files(a, d, 'quick'))
+            self.assertTrue(h.compare_files(a, c, 'quick'))
+            self.assertFalse(h.compare_files(a, c, 'full'))
+            self.assertFalse(h.compare_files(a, c, blocksize = 1000))
+            self.assertTrue(h.compare_files(a, b, blocksize = 1000))
+            # same answer as hash_match
+            self.assertEqual(h.hash_match(a, c, use_index = False), h.compare_files(a, c))
+            with self.assertRaises(ValueError):
+                h.compare_files(a, b, 'fast')
+
+    def test_same_blocks_short_reads(self):
+        import io
+
+        class ShortReads(io.BytesIO):
+            # like a raw file on a network share: at most `most` bytes per read
+            def __init__(self, content, most):
+                super().__init__(content)
+                self.most = most
+
+            def readinto(self, buf):
+                return super().readinto(memoryview(buf)[:self.most])
+
+        content = os.urandom(1000)
+        # a difference in the last byte
+        tail = bytearray(content)
+        tail[-1] ^= 0xFF
+        self.assertTrue(h._same_blocks(ShortReads(content, 7), ShortReads(content, 100),
+                                       bytearray(64), bytearray(64)))
+        self.assertFalse(h._same_blocks(ShortReads(content, 7), ShortReads(bytes(tail), 100),
+                                        bytearray(64), bytearray(64)))
+
+
 if __name__ == '__main__':
     ### 2 - invoke the framework ###
     # invoke the unittest framework
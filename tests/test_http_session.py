@@ -0,0 +1,59 @@
+# 1 - Import unittest (find 2 under "if __name__ == '__main__'")
+import unittest
+from toolbox import http_session
+
+
+class TestHttpSession(unittest.TestCase):
+    def setUp(self):
+        print('')
+        print(r"Calling .setUp()...")
+
+    def tearDown(self):
+        print('')
+        print(r"Calling .tearDown()...")
+        http_session.set_session(None)
+
+    def test_new_session(self):
+        session = http_session.new_session(pool_connections = 3, pool_maxsize = 7,
+                                           max_retries = 4)
+        for prefix in ['http://', 'https://']:
+            adapter = session.get_adapter(prefix + 'www.pjm.com')
+            self.assertEqual(7, adapter._pool_maxsize)
+            self.assertEqual(3, adapter._pool_connections)
+            self.assertEqual(4, adapter.max_retries.total)
+        session.close()
+
+    def test_get_and_set_session(self):
+        shared = http_session.get_session()
+        self.assertIs(shared, http_session.get_session())
+        mine = http_session.new_session()
+        http_session.set_session(mine)
+        self.assertIs(mine, http_session.get_session())
+        http_session.set_session(None)
+        self.assertIsNot(mine, http_session.get_session())
+
+    def test_http_cache_forget(self):
+        import os
+        import tempfile
+        from types import SimpleNamespace
+        with tempfile.TemporaryDirectory() as tmp:
+            cache = http_session.HTTPCache(file = os.path.join(tmp, 'http_cache.json'))
+            response = SimpleNamespace(status_code = 200, headers = {'ETag': '"abc"'})
+            for url in ['http://a.com/1', 'http://a.com/2']:
+                cache.store(url, response, 'f' * 64, 10)
+            cache.save()
+
+            # a forgotten url is not restored from disk by the next save
+            cache.forget('http://a.com/1')
+            cache.save()
+            reloaded = http_session.HTTPCache(file = cache.file)
+            self.assertIsNone(reloaded.get('http://a.com/1'))
+            self.assertEqual(10, reloaded.get('http://a.com/2')['size'])
+
+
+if __name__ == '__main__':
+    ### 2 - invoke the framework ###
+    # invoke the unittest framework
+    # unittest.main() will capture all fo the tests
+    # and run them 1-by-1.
+    unittest.main()
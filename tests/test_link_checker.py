@@ -447,6 +447,161 @@ class TestCheckLinksFromFile(unittest.TestCase):
         pass
 
 
+class TestWebPageSession(unittest.TestCase):
+    def test_webpage_session(self):
+        from toolbox.http_session import get_session, new_session
+        page = WebPage('www.pjm.com')
+        self.assertIs(get_session(), page.http)
+        session = new_session()
+        page = WebPage('www.pjm.com', session = session)
+        self.assertIs(session, page.http)
+        session.close()
+
+
+class LocalServerTestCase(unittest.TestCase):
+    """ Serves a temp folder over http://127.0.0.1 for the duration of the test class. """
+    @classmethod
+    def setUpClass(cls):
+        import functools
+        import tempfile
+        import threading
+        from http.server import SimpleHTTPRequestHandler, ThreadingHTTPServer
+        cls.tmp = tempfile.TemporaryDirectory()
+        cls.body = os.urandom(200000)
+        cls.local_file = os.path.join(cls.tmp.name, 'known_good.bin')
+        with open(cls.local_file, 'wb') as f:
+            f.write(cls.body)
+        os.mkdir(os.path.join(cls.tmp.name, 'www'))
+        with open(os.path.join(cls.tmp.name, 'www', 'posted.bin'), 'wb') as f:
+            f.write(cls.body)
+        handler = functools.partial(SimpleHTTPRequestHandler,
+                                    directory = os.path.join(cls.tmp.name, 'www'))
+        handler.log_message = lambda *args: None
+        cls.server = ThreadingHTTPServer(('127.0.0.1', 0), handler)
+        cls.base_url = f'http://127.0.0.1:{cls.server.server_port}'
+        threading.Thread(target = cls.server.serve_forever, daemon = True).start()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.shutdown()
+        cls.server.server_close()
+        cls.tmp.cleanup()
+
+
+class TestSavePage(LocalServerTestCase):
+    def test_save_page_hash(self):
+        import hashlib
+        expect = hashlib.sha256(self.body).hexdigest()
+        page = WebPage(self.base_url + '/posted.bin')
+        result = page.save_page(hash_only = True)
+        self.assertIsNone(result.filename)
+        self.assertEqual(expect, result.hash)
+        self.assertEqual(len(self.body), result.size)
+
+        save_as = os.path.join(self.tmp.name, 'downloaded.bin')
+        result = WebPage(self.base_url + '/posted.bin').save_page(save_as = save_as)
+        self.assertEqual(expect, result.hash)
+        with open(save_as, 'rb') as f:
+            self.assertEqual(self.body, f.read())
+
+    def test_deep_link_check_http_hash_only(self):
+        working_dir = os.path.join(self.tmp.name, 'work')
+        res = deep_link_check_http(url = self.base_url + '/posted.bin',
+                                   local_file_path = self.local_file,
+                                   working_dir = working_dir, keep_download = False)
+        self.assertTrue(res['success'], res['reason'])
+        self.assertEqual(len(self.body), res['downloaded file size'])
+        self.assertFalse(os.path.exists(working_dir))
+
+    def test_revalidate(self):
+        from toolbox.http_session import HTTPCache
+        url = self.base_url + '/posted.bin'
+        cache = HTTPCache(file = os.path.join(self.tmp.name, 'http_cache.json'))
+        page = WebPage(url, http_cache = cache)
+        page.get(revalidate = True)
+        self.assertFalse(page.not_modified)
+        result = page.save_page(hash_only = True)
+        self.assertEqual(result.hash, cache.get(url)['sha256'])
+        self.assertIn('If-Modified-Since', cache.conditional_headers(url))
+
+        page = WebPage(url, http_cache = cache)
+        self.assertEqual(304, page.get(revalidate = True).status_code)
+        self.assertTrue(page.not_modified)
+        cache.save()
+        self.assertEqual(result.size, HTTPCache(file = cache.file).get(url)['size'])
+
+    def test_deep_link_check_http_head_first(self):
+        from toolbox.http_session import new_session
+        methods = []
+        session = new_session()
+        session.hooks['response'].append(lambda r, *args, **kwargs: methods.append(r.request.method))
+        url = self.base_url + '/posted.bin'
+        res = deep_link_check_http(url = url, local_file_path = self.local_file,
+                                   hash_check = False, session = session)
+        self.assertTrue(res['success'], res['reason'])
+        self.assertEqual(['HEAD'], methods)
+
+        methods.clear()
+        short_file = os.path.join(self.tmp.name, 'short.bin')
+        with open(short_file, 'wb') as f:
+            f.write(self.body[:-1])
+        res = deep_link_check_http(url = url, local_file_path = short_file,
+                                   session = session)
+        self.assertFalse(res['success'])
+        self.assertEqual(['HEAD'], methods)
+
+        methods.clear()
+        res = deep_link_check_http(url = url, local_file_path = self.local_file,
+                                   session = session, keep_download = False,
+                                   revalidate = False)
+        self.assertTrue(res['success'], res['reason'])
+        self.assertEqual(['HEAD', 'GET'], methods)
+
+    def test_deep_link_check_http_child_url_one_get(self):
+        from toolbox.http_session import new_session
+        with open(os.path.join(self.tmp.name, 'www', 'links.html'), 'w') as f:
+            f.write('<html><body><a href="http://www.naesb.org">NAESB</a></body></html>')
+        methods = []
+        session = new_session()
+        session.hooks['response'].append(lambda r, *args, **kwargs: methods.append(r.request.method))
+        res = deep_link_check_http(url = self.base_url + '/links.html',
+                                   check_child_url = 'www.naesb.org', session = session)
+        self.assertTrue(res['success'], res['reason'])
+        self.assertEqual(['GET'], methods)
+
+
+class TestRunBounded(unittest.TestCase):
+    def test_run_bounded_keeps_order(self):
+        def check(url, n):
+            time.sleep(0.001 * (n % 4))
+            return url, n
+
+        jobs = [{'url': f'http://host{i % 3}.com/file{i}', 'n': i} for i in range(20)]
+        expect = [(job['url'], job['n']) for job in jobs]
+        self.assertEqual(expect, lc.run_bounded(check, jobs, max_workers = 1))
+        self.assertEqual(expect, lc.run_bounded(check, jobs, max_workers = 6,
+                                                per_host_limit = 2))
+
+    def test_run_bounded_per_host_limit(self):
+        import threading
+        lock = threading.Lock()
+        in_flight, peak = {}, {}
+
+        def check(url):
+            host = lc.host_key(url)
+            with lock:
+                in_flight[host] = in_flight.get(host, 0) + 1
+                peak[host] = max(peak.get(host, 0), in_flight[host])
+            time.sleep(0.01)
+            with lock:
+                in_flight[host] -= 1
+            return host
+
+        jobs = [{'url': f'http://host{i % 2}.com/{i}'} for i in range(12)]
+        lc.run_bounded(check, jobs, max_workers = 8, per_host_limit = 2)
+        self.assertTrue(all(v <= 2 for v in peak.values()), peak)
+
+
 class TestMain(unittest.TestCase):
     start = None
     stop = None
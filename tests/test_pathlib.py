@@ -197,6 +197,52 @@ class TestPath(unittest.TestCase):
         self.assertEqual(p.folder_part().str, p.parent.str)
         self.assertEqual(r.folder_part().str.replace("/","\\"), self.root_str.replace("/","\\"))
 
+    def test_scan(self):
+        import time
+        root = Path(self.root_str)
+        files = {'mom/a.csv': 10, 'mom/B.CSV': 2000, 'mom/kid/c.txt': 5,
+                 'mom/kid/grandkid/d.csv': 300, 'e.txt': 0}
+        for name, size in files.items():
+            fn = os.path.join(self.root_str, name)
+            os.makedirs(os.path.dirname(fn), exist_ok = True)
+            with open(fn, 'wb') as writer:
+                writer.write(b'x' * size)
+        old = time.time() - 3600
+        os.utime(os.path.join(self.root_str, 'mom/a.csv'), (old, old))
+
+        def rel(entries):
+            return sorted(os.path.relpath(e.path, self.root_str).replace(os.sep, '/')
+                          for e in entries)
+
+        self.assertEqual(sorted(files), rel(root.scan()))
+        self.assertEqual(sorted(files), rel(root.scan_files()))
+        self.assertEqual(['mom', 'mom/kid', 'mom/kid/grandkid'], rel(root.scan_dirs()))
+        self.assertEqual(['e.txt'], rel(root.scan(recursive = False)))
+        self.assertEqual(['e.txt', 'mom/B.CSV', 'mom/a.csv'], rel(root.scan(max_depth = 1)))
+        self.assertEqual(['mom/B.CSV', 'mom/a.csv', 'mom/kid/grandkid/d.csv'],
+                         rel(root.scan(extensions = 'csv')))
+        self.assertEqual(['e.txt', 'mom/a.csv', 'mom/kid/c.txt', 'mom/kid/grandkid/d.csv'],
+                         rel(root.scan(extensions = ['.txt', '.Csv'], max_size = 300, min_size = 0)))
+        self.assertEqual(['mom/B.CSV', 'mom/kid/grandkid/d.csv'],
+                         rel(root.scan(min_size = 11)))
+        self.assertEqual(['mom/a.csv'], rel(root.scan(modified_before = time.time() - 60)))
+        self.assertNotIn('mom/a.csv', rel(root.scan(modified_after = time.time() - 60)))
+
+        entry = next(root.scan(extensions = '.csv', min_size = 1000))
+        self.assertEqual('B.CSV', entry.name)
+        self.assertEqual('.CSV', entry.suffix)
+        self.assertEqual(2000, entry.size)
+        self.assertTrue(entry.is_file())
+        self.assertEqual(1, entry.depth)
+        self.assertEqual(os.path.join(self.root_str, 'mom', 'B.CSV'), os.fspath(entry))
+        self.assertIsInstance(entry.to_path(), Path)
+        self.assertEqual(entry.path, entry.to_path().str)
+
+        errors = []
+        self.assertEqual([], list(Path(os.path.join(self.root_str, 'missing')).scan(
+            onerror = errors.append)))
+        self.assertEqual(1, len(errors))
+
 
 if __name__ == '__main__':
     ### 2 - invoke the framework ###
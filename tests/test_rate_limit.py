@@ -0,0 +1,101 @@
+# 1 - Import unittest (find 2 under "if __name__ == '__main__'")
+import unittest
+import time
+from email.utils import formatdate
+from toolbox import rate_limit
+from toolbox.rate_limit import RateLimiter, TokenBucket
+
+
+class FakeResponse:
+    def __init__(self, status_code, headers = None):
+        self.status_code = status_code
+        self.headers = headers or {}
+
+
+class TestRateLimit(unittest.TestCase):
+    def setUp(self):
+        print('')
+        print(r"Calling .setUp()...")
+
+    def tearDown(self):
+        print('')
+        print(r"Calling .tearDown()...")
+
+    def test_host_key(self):
+        self.assertEqual('www.pjm.com', rate_limit.host_key('https://WWW.pjm.com/a/b.pdf'))
+        self.assertEqual('ftp.pjm.com', rate_limit.host_key('ftp://ftp.pjm.com/oasis'))
+        self.assertEqual('ftp.pjm.com', rate_limit.host_key('ftp.pjm.com'))
+
+    def test_parse_retry_after(self):
+        self.assertEqual(120, rate_limit.parse_retry_after('120'))
+        self.assertIsNone(rate_limit.parse_retry_after('soon'))
+        seconds = rate_limit.parse_retry_after(formatdate(time.time() + 60, usegmt = True))
+        self.assertTrue(55 < seconds <= 60, seconds)
+
+    def test_token_bucket(self):
+        bucket = TokenBucket(rate = 50, burst = 2)
+        self.assertEqual(0, bucket.acquire())
+        self.assertEqual(0, bucket.acquire())
+        self.assertGreater(bucket.delay(), 0)
+        start = time.monotonic()
+        bucket.acquire()
+        self.assertGreater(time.monotonic() - start, 0.01)
+
+        unlimited = TokenBucket(rate = 0, burst = 1)
+        for i in range(100):
+            self.assertEqual(0, unlimited.acquire())
+        unlimited.block(0.05)
+        self.assertGreater(unlimited.delay(), 0.03)
+
+    def test_retry_after(self):
+        limiter = RateLimiter(rate = 0, burst = 1, max_retry_after = 10,
+                              retry_after_default = 5)
+        url = 'https://www.pjm.com/file.pdf'
+        self.assertEqual(0, limiter.retry_after(url, FakeResponse(200)))
+        self.assertEqual(0, limiter.retry_after(url, FakeResponse(503)))
+        self.assertEqual(0, limiter.delay('https://www.pjm.com/other.pdf'))
+        self.assertEqual(10, limiter.retry_after(url, FakeResponse(429, {'Retry-After': '3600'})))
+        self.assertGreater(limiter.delay('https://www.pjm.com/other.pdf'), 9)
+        self.assertEqual(0, limiter.delay('https://ftp.pjm.com/other.pdf'))
+        self.assertEqual(5, limiter.retry_after('https://a.com', FakeResponse(429)))
+
+    def test_run_bounded_skips_blocked_host(self):
+        limiter = RateLimiter(rate = 0, burst = 1)
+        limiter.block('http://slow.com', 0.3)
+        finished = []
+
+        def check(url):
+            finished.append(url)
+            return url
+
+        jobs = [{'url': 'http://slow.com/1'}] + [{'url': f'http://fast.com/{i}'} for i in range(5)]
+        res = rate_limit.run_bounded(check, jobs, max_workers = 2, limiter = limiter)
+        self.assertEqual([job['url'] for job in jobs], res)
+        # fast.com was not held up behind slow.com
+        self.assertEqual('http://slow.com/1', finished[-1])
+
+    def test_run_bounded_host_with_port(self):
+        limiter = RateLimiter(rate = 0, burst = 1)
+        limiter.block('http://slow.com:8080/', 0.3)
+        self.assertGreater(limiter.delay_for_host('slow.com:8080'), 0)
+        self.assertEqual(0, limiter.delay_for_host('fast.com:8080'))
+        finished = []
+
+        def check(url):
+            finished.append(url)
+            return url
+
+        jobs = [{'url': 'http://slow.com:8080/1'}] + \
+               [{'url': f'http://fast.com:8080/{i}'} for i in range(5)]
+        res = rate_limit.run_bounded(check, jobs, max_workers = 2, limiter = limiter)
+        self.assertEqual([job['url'] for job in jobs], res)
+        # the scheduler saw slow.com:8080's block, and fast.com:8080 was not held up
+        self.assertEqual('http://slow.com:8080/1', finished[-1])
+
+
+if __name__ == '__main__':
+    ### 2 - invoke the framework ###
+    # invoke the unittest framework
+    # unittest.main() will capture all fo the tests
+    # and run them 1-by-1.
+    unittest.main()
@@ -3,7 +3,7 @@
 import unittest
 # import the module being tested
 from toolbox.web_crawler import deep_link_check, webpage_contains_url, \
-    get_links_from_webpage, broken_link_finder, check_links_from_file, examples
+    get_links_from_webpage, broken_link_finder, check_links_from_file, examples, crawl
 # from toolbox.swiss_army import make_iterable
 # other imports
 from configparser import ConfigParser  #
@@ -214,6 +214,109 @@ Designated Network Resources,https://www.pjm.com/-/media/etools/capacity-exchang
                            open_results_when_done = False)
 
 
+class LocalSiteTestCase(unittest.TestCase):
+    """ Serves a small temp site over http://127.0.0.1 for the duration of the test class. """
+    pages = {'index.html': '<a href="/a.txt">a</a> <a href="b.txt">b</a> '
+                           '<a href="/missing.txt">missing</a> <a href="mailto:x@y.com">x</a>',
+             'a.txt': 'a',
+             'b.txt': 'b'}
+
+    @classmethod
+    def setUpClass(cls):
+        import functools
+        import tempfile
+        import threading
+        from http.server import SimpleHTTPRequestHandler, ThreadingHTTPServer
+        cls.tmp = tempfile.TemporaryDirectory()
+        for name, content in cls.pages.items():
+            os.makedirs(os.path.dirname(os.path.join(cls.tmp.name, name)), exist_ok = True)
+            with open(os.path.join(cls.tmp.name, name), 'w') as f:
+                f.write(content)
+        handler = functools.partial(SimpleHTTPRequestHandler, directory = cls.tmp.name)
+        handler.log_message = lambda *args: None
+        cls.server = ThreadingHTTPServer(('127.0.0.1', 0), handler)
+        cls.base_url = f'http://127.0.0.1:{cls.server.server_port}'
+        threading.Thread(target = cls.server.serve_forever, daemon = True).start()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.shutdown()
+        cls.server.server_close()
+        cls.tmp.cleanup()
+
+
+class TestBrokenLinkFinderLocal(LocalSiteTestCase):
+    def test_broken_link_finder(self):
+        res = broken_link_finder(urls = self.base_url + '/index.html',
+                                 open_results_when_done = False,
+                                 exclude_prefixes = ['mailto'],
+                                 max_concurrency = 4, per_host_limit = 2, timeout = 5)
+        self.assertEqual(3, len(res.processed_urls))
+        self.assertEqual([self.base_url + '/missing.txt'], [link for link, *_ in res.broken_urls])
+
+    def test_broken_link_finder_in_event_loop(self):
+        import asyncio
+
+        async def in_loop():
+            # e.g., Jupyter, where asyncio.run cannot be called
+            return broken_link_finder(urls = self.base_url + '/index.html',
+                                      open_results_when_done = False,
+                                      exclude_prefixes = ['mailto'],
+                                      max_concurrency = 4, per_host_limit = 2, timeout = 5)
+        res = asyncio.run(in_loop())
+        self.assertEqual(3, len(res.processed_urls))
+        self.assertEqual([self.base_url + '/missing.txt'], [link for link, *_ in res.broken_urls])
+
+
+class TestCrawlLocal(LocalSiteTestCase):
+    pages = {'index.html': '<a href="/a.txt">a</a> <a href="/sub/index.html">sub</a>',
+             'a.txt': 'a',
+             'sub/index.html': '<a href="/sub/deep.html">deep</a> <a href="/index.html#top">top</a>',
+             'sub/deep.html': '<a href="/gone.txt">gone</a>'}
+
+    def test_crawl_depth(self):
+        res = crawl(urls = self.base_url + '/index.html', max_depth = 1,
+                    open_results_when_done = False, timeout = 5)
+        self.assertEqual({'/index.html': 0, '/a.txt': 1, '/sub/index.html': 1},
+                         {link[len(self.base_url):]: depth
+                          for link, success, status, depth in res.processed_urls})
+        self.assertEqual([], res.broken_urls)
+
+        res = crawl(urls = self.base_url + '/index.html', max_depth = 3,
+                    open_results_when_done = False, timeout = 5)
+        # index.html#top is the page already visited, so it is not checked again
+        self.assertEqual(5, len(res.processed_urls))
+        self.assertEqual([(self.base_url + '/gone.txt', 3)],
+                         [(link, depth) for link, success, status, depth in res.broken_urls])
+
+    def test_crawl_requests_each_page_once(self):
+        from urllib.parse import urlsplit
+        from toolbox.http_session import new_session
+        requests_sent = []
+        session = new_session()
+        session.hooks['response'].append(lambda r, *args, **kwargs: requests_sent.append(
+            (r.request.method, urlsplit(r.request.url).path)))
+        res = crawl(urls = self.base_url + '/index.html', max_depth = 2,
+                    open_results_when_done = False, timeout = 5, session = session)
+        self.assertEqual(4, len(res.processed_urls))
+        # urls that may be searched for links are checked by the GET that reads
+        # them (a.txt's body is not read, since it is not html); links at
+        # max_depth are only checked
+        self.assertEqual(sorted([('GET', '/index.html'), ('GET', '/a.txt'),
+                                 ('GET', '/sub/index.html'), ('HEAD', '/sub/deep.html')]),
+                         sorted(requests_sent))
+
+    def test_crawl_max_pages(self):
+        res = crawl(urls = self.base_url + '/index.html', max_depth = 3, max_pages = 2,
+                    open_results_when_done = False, timeout = 5)
+        self.assertEqual(2, len(res.processed_urls))
+
+    def test_crawl_exclude_prefixes_none(self):
+        res = crawl(urls = self.base_url + '/index.html', max_depth = 1,
+                    open_results_when_done = False, timeout = 5, exclude_prefixes = None)
+        self.assertTrue(res.processed_urls)
+
+
 if __name__ == '__main__':
     # -- 2 -- invoke the framework --
     # invoke the unittest framework
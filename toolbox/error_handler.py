@@ -86,7 +86,9 @@ class ErrorHandler(object):
             on_error_return = self.on_error_return
         def wrap(func):
             def wrapper(*args, **kwargs):
-                instance = args[0]
+                # module-level functions called with keyword arguments only
+                # have no positional args (and no instance).
+                instance = args[0] if args else None
                 try:
                     return func(*args, **kwargs)
                 except Exception as ex:
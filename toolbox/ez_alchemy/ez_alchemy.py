@@ -1,16 +1,27 @@
 """
 Functions for Interfacing with databases at PJM using SQLAlchemy
 """
+import atexit
+import hashlib
+import json
 import os
+import re
+import threading
+import time
 import pandas as pd
-from sqlalchemy import engine, __version__ as alch_ver
+from sqlalchemy import engine, event, __version__ as alch_ver
+from sqlalchemy.sql import table as sql_table, column as sql_column
 # from sqlalchemy.engine import Engine
+from sqlalchemy.engine import make_url
 from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import QueuePool
+from toolbox.appdirs import user_cache_dir
 from toolbox.simple_password import get_credentials
 # from toolbox import toolbox_config, pjm_config
 from toolbox import tb_cfg
 from typing import Union
 from collections import deque, namedtuple
+from concurrent.futures import ThreadPoolExecutor
 from contextlib import contextmanager
 import warnings
 try:
@@ -18,23 +29,406 @@ try:
 except Exception as e:
     warnings.warn("Failed to import cx-Oracle.  " 
                   "See https://cx-oracle.readthedocs.io/en/latest/user_guide/installation.html")
+try:
+    # optional: EZDB.fetch_arrow, .iter_arrow and .to_parquet
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = pq = None
 
-alch_ver = [int(s) for s in alch_ver.split('.')]
+alch_ver = [int(s) for s in alch_ver.split('.')[:3] if s.isdigit()]
 default_user = os.environ['username']
 
+default_config = {
+    'EZ_ALCHEMY': {
+        # connections kept open per engine, and extra connections allowed under load
+        "POOL_SIZE": 5,
+        "MAX_OVERFLOW": 10,
+        # seconds to wait for a pooled connection before giving up
+        "POOL_TIMEOUT": 30,
+        # replace pooled connections older than this many seconds (-1 = never)
+        "POOL_RECYCLE": 3600,
+        # test each pooled connection (a cheap round trip) before handing it out
+        "POOL_PRE_PING": True,
+        # SQLAlchemy compiled statement cache entries per engine
+        "QUERY_CACHE_SIZE": 500,
+        # driver statement cache per connection (e.g., cx_Oracle stmtcachesize)
+        "STMT_CACHE_SIZE": 50,
+        # rows per chunk yielded by EZDB.stream, and rows fetched per round trip
+        "CHUNKSIZE": 10000,
+        "ARRAYSIZE": 1000,
+        # rows per executemany (and commit) in EZDB.bulk_insert
+        "BULK_BATCH_SIZE": 10000,
+        # ez_query(cache = True): seconds a cached result is used, and the max
+        # size of the cache folder before least recently used results are evicted
+        "QUERY_CACHE_TTL": 3600,
+        "QUERY_CACHE_MAX_MB": 512,
+        }
+    }
+tb_cfg.update_if_none(dict_of_parameters = default_config, recurse = True)
+
 NoneType = type(None)
 cfg = tb_cfg
 default_dialect = cfg['ORACLE']['DIALECT']
 default_sql_driver = cfg['ORACLE']['DRIVER']
 default_hosts = tb_cfg["DEFAULT_HOSTS"]
 CredsTuple = namedtuple('CredsTuple', ['hosts', 'user', 'pw'])
+InsertStats = namedtuple('InsertStats', ['rows', 'batches', 'seconds', 'rows_per_second'])
+QueryManyResult = namedtuple('QueryManyResult', ['result', 'timings', 'errors'])
 global_creds = CredsTuple(tb_cfg["DEFAULT_HOSTS"], '', '')
 
+# ##############################################################################
+# Engine registry
+# ##############################################################################
+# {(dialect, driver, host, user): (engine, password digest, engine_args, engine_kwargs)}
+_engines = {}
+_engines_lock = threading.Lock()
+
+
+def engine_key(url) -> tuple:
+    """
+    Return the registry key, (dialect, driver, host, user), of a SQLAlchemy url.
+    Databases without a host (e.g., sqlite) are keyed by database name instead.
+    """
+    url = make_url(url)
+    return (url.get_backend_name(), url.get_driver_name(),
+            (url.host or url.database or '').lower(), (url.username or '').lower())
+
+
+def get_engine(url, *engine_args, **engine_kwargs) -> engine.Engine:
+    """
+    Return the process-wide engine for url's (dialect, driver, host, user),
+    creating it on first use, so every EZDB (and ez_query call) for the same
+    database and user shares one pool of warm connections.  If the password in
+    url differs from the one the engine was created with, the old engine is
+    disposed of and replaced.  engine_args and engine_kwargs are passed to
+    sqlalchemy.create_engine when the engine is created; pool settings not
+    given there are read from tb_cfg['EZ_ALCHEMY'].  A later call for the same
+    key gets the existing engine; a warning is issued if it passes engine_args
+    or engine_kwargs that differ from the ones the engine was created with.
+    :param url: SQLAlchemy url, e.g., 'oracle+cx_oracle://user:pw@host'
+    :return: sqlalchemy.engine.Engine
+    """
+    url = make_url(url)
+    key = engine_key(url)
+    pw_digest = hashlib.sha256((url.password or '').encode()).hexdigest()
+    with _engines_lock:
+        registered = _engines.get(key)
+        if registered and registered[1] == pw_digest:
+            if (engine_args or engine_kwargs) \
+                    and (engine_args, engine_kwargs) != registered[2:]:
+                warnings.warn(f'get_engine: an engine for {key} already exists; '
+                              f'ignoring engine_args {engine_args} and '
+                              f'engine_kwargs {engine_kwargs}')
+            return registered[0]
+        if registered:
+            registered[0].dispose()
+        new_engine = _create_engine(url, *engine_args, **dict(engine_kwargs))
+        _engines[key] = (new_engine, pw_digest, engine_args, engine_kwargs)
+        return new_engine
+
+
+def _create_engine(url, *engine_args, **engine_kwargs) -> engine.Engine:
+    cfg_ez = tb_cfg['EZ_ALCHEMY']
+    if engine_kwargs.setdefault('poolclass', QueuePool) is QueuePool:
+        engine_kwargs.setdefault('pool_size', cfg_ez['POOL_SIZE'])
+        engine_kwargs.setdefault('max_overflow', cfg_ez['MAX_OVERFLOW'])
+        engine_kwargs.setdefault('pool_timeout', cfg_ez['POOL_TIMEOUT'])
+    engine_kwargs.setdefault('pool_recycle', cfg_ez['POOL_RECYCLE'])
+    engine_kwargs.setdefault('pool_pre_ping', cfg_ez['POOL_PRE_PING'])
+    if alch_ver[:2] >= [1, 4]:
+        engine_kwargs.setdefault('query_cache_size', cfg_ez['QUERY_CACHE_SIZE'])
+    new_engine = engine.create_engine(url, *engine_args, **engine_kwargs)
+
+    stmt_cache_size = cfg_ez['STMT_CACHE_SIZE']
+    if stmt_cache_size:
+        @event.listens_for(new_engine, 'connect')
+        def _set_stmt_cache_size(dbapi_connection, connection_record):
+            if hasattr(dbapi_connection, 'stmtcachesize'):
+                dbapi_connection.stmtcachesize = stmt_cache_size
+
+    return new_engine
+
+
+def dispose_engine(db_engine: engine.Engine):
+    """ Remove db_engine from the registry and close its pooled connections. """
+    with _engines_lock:
+        for key, (registered, *_) in list(_engines.items()):
+            if registered is db_engine:
+                del _engines[key]
+    db_engine.dispose()
+
+
+@atexit.register
+def dispose_engines():
+    """ Close the pooled connections of every registered engine and empty the registry. """
+    with _engines_lock:
+        registered = [e for e, *_ in _engines.values()]
+        _engines.clear()
+    for db_engine in registered:
+        db_engine.dispose()
+
+
+def _require_pyarrow():
+    if pa is None:
+        raise ImportError('pyarrow is required for Arrow and Parquet results.  '
+                          'pip install pyarrow')
+
+
+def _arrow_type(column):
+    """
+    The pyarrow type for a cursor.description column, or None if the driver
+    does not report a type (e.g., sqlite), so it is inferred from the values.
+    Type names are cx_Oracle's, e.g., NUMBER (cx_Oracle < 8) or DB_TYPE_NUMBER.
+    """
+    type_code, precision, scale = column[1], column[4], column[5]
+    name = getattr(type_code, 'name', None) or getattr(type_code, '__name__', '')
+    name = str(name).upper().replace('DB_TYPE_', '')
+    if name == 'NUMBER':
+        # NUMBER(p, 0) holds integers, too large for int64 if p > 18;
+        # NUMBER and NUMBER(p, s) may hold fractions
+        if scale == 0 and precision:
+            return pa.int64() if precision <= 18 else pa.decimal128(precision, 0)
+        return pa.float64()
+    if name in ('BINARY_DOUBLE', 'BINARY_FLOAT', 'NATIVE_FLOAT'):
+        return pa.float64()
+    if name in ('BINARY_INTEGER', 'NATIVE_INT'):
+        return pa.int64()
+    if name == 'BOOLEAN':
+        return pa.bool_()
+    if name in ('VARCHAR', 'NVARCHAR', 'CHAR', 'NCHAR', 'FIXED_CHAR', 'FIXED_NCHAR',
+                'STRING', 'LONG', 'LONG_STRING', 'ROWID'):
+        return pa.string()
+    if name in ('DATE', 'DATETIME', 'TIMESTAMP', 'TIMESTAMP_TZ', 'TIMESTAMP_LTZ'):
+        return pa.timestamp('us')
+    if name in ('RAW', 'LONG_RAW', 'BINARY'):
+        return pa.binary()
+    return None
+
+
+def _unify_schema(schemas:list):
+    """
+    One schema for schemas of the same columns: each column gets the type its
+    schemas agree on, ignoring null types (all-NULL batches), with integers
+    promoted to float64 where another schema has floats for the column.
+    """
+    fields = []
+    for i, field in enumerate(schemas[0]):
+        types = []
+        for schema in schemas:
+            t = schema.field(i).type
+            if not pa.types.is_null(t) and t not in types:
+                types.append(t)
+        if len(types) > 1 and all(pa.types.is_integer(t) or pa.types.is_floating(t)
+                                  for t in types):
+            types = [pa.float64()]
+        fields.append(field.with_type(types[0]) if types else field)
+    return pa.schema(fields)
+
+
+def _rewrite_parquet(source:str, target:str, schema, compression:str):
+    """
+    Copy Parquet file source to target, a row group at a time, casting to
+    schema; return the ParquetWriter, still open on target, for more batches.
+    """
+    writer = pq.ParquetWriter(target, schema, compression = compression)
+    try:
+        with open(source, 'rb') as f:
+            for batch in pq.ParquetFile(f).iter_batches():
+                writer.write_batch(_cast_batch(batch, schema))
+    except BaseException:
+        writer.close()
+        raise
+    return writer
+
+
+def _cast_batch(batch, schema):
+    if batch.schema.equals(schema):
+        return batch
+    arrays = [column.cast(field.type) for column, field in zip(batch.columns, schema)]
+    return pa.RecordBatch.from_arrays(arrays, schema = schema)
+
+
+# ##############################################################################
+# Query result cache
+# ##############################################################################
+
+class QueryCache:
+    """
+    On-disk cache of query results (DataFrames), keyed by (host, user,
+    normalized sql), used by ez_query(cache = True).  Results are stored as
+    Parquet files if pyarrow (or fastparquet) is installed, else as pickles,
+    in folder (by default appdirs.user_cache_dir('toolbox')/ez_query), with an
+    index.json recording each result's host, user, creation and last use.
+    Results older than ttl seconds are not used, and once the folder holds more
+    than max_mb, the least recently used results are deleted.
+    """
+    def __init__(self, folder:str = None, ttl:float = None, max_mb:float = None):
+        """
+        :param folder: folder to store results in
+        :param ttl: seconds a result is used.  Default: tb_cfg['EZ_ALCHEMY']['QUERY_CACHE_TTL']
+        :param max_mb: max cache size.  Default: tb_cfg['EZ_ALCHEMY']['QUERY_CACHE_MAX_MB']
+        """
+        self.folder = str(folder or os.path.join(str(user_cache_dir('toolbox')), 'ez_query'))
+        self.ttl = cfg['EZ_ALCHEMY']['QUERY_CACHE_TTL'] if ttl is None else ttl
+        self.max_mb = cfg['EZ_ALCHEMY']['QUERY_CACHE_MAX_MB'] if max_mb is None else max_mb
+        self._lock = threading.RLock()
+
+    # a 'string literal' (with '' escapes) or a "quoted identifier"
+    _quoted = re.compile(r"""('(?:[^']|'')*'|"[^"]*")""")
+
+    @classmethod
+    def normalize_sql(cls, sql:str) -> str:
+        """
+        Collapse whitespace outside quoted literals and identifiers, and drop
+        any trailing ';', so trivially different sql shares a key.
+        """
+        # re.split with a group alternates unquoted and quoted parts
+        parts = cls._quoted.split(sql.strip().rstrip(';'))
+        parts[::2] = [re.sub(r'\s+', ' ', part) for part in parts[::2]]
+        return ''.join(parts).strip()
+
+    def key(self, host:str, user:str, sql:str) -> str:
+        raw = '\n'.join([host.strip().lower(), user.strip().lower(), self.normalize_sql(sql)])
+        return hashlib.sha256(raw.encode()).hexdigest()
+
+    @property
+    def _index_file(self) -> str:
+        return os.path.join(self.folder, 'index.json')
+
+    def _read_index(self) -> dict:
+        try:
+            with open(self._index_file, 'r') as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return {}
+        except Exception as e:
+            warnings.warn(f'Unable to read query cache index "{self._index_file}".  {e}')
+            return {}
+
+    def _write_index(self, index:dict):
+        os.makedirs(self.folder, exist_ok = True)
+        tmp_file = f'{self._index_file}.{os.getpid()}.tmp'
+        with open(tmp_file, 'w') as f:
+            json.dump(index, f)
+        os.replace(tmp_file, self._index_file)
+
+    def _remove(self, index:dict, key:str):
+        record = index.pop(key, None)
+        if record:
+            try:
+                os.remove(os.path.join(self.folder, record['file']))
+            except FileNotFoundError:
+                pass
+
+    def get(self, host:str, user:str, sql:str, ttl:float = None) -> Union[pd.DataFrame, NoneType]:
+        """ Return the cached result of sql on host as user, or None if not cached or expired. """
+        ttl = self.ttl if ttl is None else ttl
+        key = self.key(host, user, sql)
+        with self._lock:
+            index = self._read_index()
+            record = index.get(key)
+            if not record:
+                return None
+            if time.time() - record['created'] > ttl:
+                self._remove(index, key)
+                self._write_index(index)
+                return None
+            path = os.path.join(self.folder, record['file'])
+            try:
+                if path.endswith('.parquet'):
+                    df = pd.read_parquet(path)
+                else:
+                    df = pd.read_pickle(path)
+            except Exception as e:
+                warnings.warn(f'Unable to read cached query result "{path}".  {e}')
+                self._remove(index, key)
+                self._write_index(index)
+                return None
+            record['last_used'] = time.time()
+            self._write_index(index)
+            return df
+
+    def put(self, host:str, user:str, sql:str, df:pd.DataFrame):
+        """ Cache df as the result of sql on host as user, then evict results over max_mb. """
+        key = self.key(host, user, sql)
+        with self._lock:
+            os.makedirs(self.folder, exist_ok = True)
+            try:
+                file = key + '.parquet'
+                df.to_parquet(os.path.join(self.folder, file))
+            except (ImportError, ValueError, TypeError):
+                # no parquet engine, or columns parquet cannot store
+                file = key + '.pkl'
+                df.to_pickle(os.path.join(self.folder, file))
+            index = self._read_index()
+            if key in index and index[key]['file'] != file:
+                self._remove(index, key)
+            now = time.time()
+            index[key] = {'host': host.strip().lower(), 'user': user.strip().lower(),
+                          'file': file, 'created': now, 'last_used': now,
+                          'bytes': os.path.getsize(os.path.join(self.folder, file))}
+            self._evict(index)
+            self._write_index(index)
+
+    def _evict(self, index:dict):
+        max_bytes = self.max_mb * 1024 * 1024
+        total = sum(record['bytes'] for record in index.values())
+        for key in sorted(index, key = lambda k: index[k]['last_used']):
+            if total <= max_bytes:
+                break
+            total -= index[key]['bytes']
+            self._remove(index, key)
+
+    def invalidate(self, host:str = None, user:str = None, sql:str = None) -> int:
+        """
+        Delete cached results: of sql on host as user if all three are given, else
+        all results matching host and/or user, or, with no arguments, everything.
+        :return: number of results deleted
+        """
+        with self._lock:
+            index = self._read_index()
+            if host and user and sql:
+                keys = [k for k in [self.key(host, user, sql)] if k in index]
+            else:
+                keys = [k for k, record in index.items()
+                        if (not host or record['host'] == host.strip().lower())
+                        and (not user or record['user'] == user.strip().lower())]
+            for key in keys:
+                self._remove(index, key)
+            self._write_index(index)
+            return len(keys)
+
+    def clear(self):
+        """ Delete every cached result. """
+        self.invalidate()
+
+
+# the cache used by ez_query(cache = True)
+query_cache = QueryCache()
+
+
 def ez_query(sql, host:str = global_creds.hosts, user:str = global_creds.user,
-             pw:str = global_creds.pw, as_dataframe:bool = True):
+             pw:str = global_creds.pw, as_dataframe:bool = True,
+             cache:bool = False, ttl:float = None):
+    """
+    Run sql and return the result.
+    :param cache: True: return the result from query_cache if the same sql was
+                  run on the same host as the same user within ttl seconds; else
+                  run it and cache the result.  Only DataFrame results are cached,
+                  and a cached result is only looked up when host and user are given.
+    :param ttl: seconds a cached result is used.  Default: query_cache.ttl
+    """
     global global_creds
-    result = EZOracle(hosts=host, user = user, pw = pw,
-                    sql = sql, as_dataframe = as_dataframe).result
+    if cache and as_dataframe and isinstance(host, str) and host and user:
+        result = query_cache.get(host, user, sql, ttl = ttl)
+        if result is not None:
+            return result
+    db = EZOracle(hosts=host, user = user, pw = pw,
+                  sql = sql, as_dataframe = as_dataframe)
+    result = db.result
+    if cache and isinstance(result, pd.DataFrame) and db.host and db.user:
+        query_cache.put(db.host, db.user, sql, result)
     # If db connected, then save the credentials to global_creds
     global_creds = CredsTuple(host, user, pw)
     return result
@@ -43,6 +437,74 @@ def ez_query(sql, host:str = global_creds.hosts, user:str = global_creds.user,
     #                       sql = sql, as_dataframe = as_dataframe).result
     # return result
 
+def ez_query_many(sql, hosts:Union[list, tuple, set] = None, user:str = '', pw:str = '',
+                  creds:dict = None, max_workers:int = None,
+                  host_column:str = 'host') -> QueryManyResult:
+    """
+    Run the same query against several databases at once, e.g., to compare
+    environments, and combine the results.  Each host is queried in its own
+    thread over its own pooled engine (see get_engine).
+    :param sql: sql statement to execute
+    :param hosts: list-like of hosts (database names).
+                  Default: tb_cfg['DEFAULT_HOSTS']
+    :param user: username, used for every host not in creds
+    :param pw: password, used for every host not in creds
+    :param creds: optional {host: (user, pw)} for hosts with their own credentials
+    :param max_workers: max hosts queried at once.  Default: all of them.
+    :param host_column: name of the column identifying each row's host
+    :return: QueryManyResult(result, timings, errors), where
+             result = one DataFrame of all hosts' rows, with host_column first
+             timings = {host: seconds the query took}
+             errors = {host: exception} for hosts that could not be queried,
+                      or whose result already has a column named host_column
+
+    Example:
+        hosts = tb_cfg['ORACLE_DBS']['MY']
+        r = ez_query_many('select count(*) n from my_table', hosts, user, pw)
+        print(r.result, r.timings, r.errors)
+    """
+    hosts = list(hosts or default_hosts)
+    creds = creds or {}
+    # collect missing credentials up front; login dialogs cannot run in worker threads
+    logins = {}
+    for host in hosts:
+        host_user, host_pw = creds.get(host, (user, pw))
+        if not host_user or not host_pw:
+            login = get_credentials(window_title = f'DB Login: {host}', systems = [host],
+                                    user = host_user or default_user, pw = host_pw or '')
+            host_user, host_pw = login.user.strip(), login.pw.strip()
+        logins[host] = (host_user, host_pw)
+
+    def run(host):
+        started = time.perf_counter()
+        try:
+            df = _query_host(sql, host, *logins[host])
+            # raises ValueError if the result already has a host_column
+            df.insert(0, host_column, host)
+        except Exception as e:
+            return host, None, time.perf_counter() - started, e
+        return host, df, time.perf_counter() - started, None
+
+    frames, timings, errors = [], {}, {}
+    with ThreadPoolExecutor(max_workers = max_workers or max(1, len(hosts))) as pool:
+        for host, df, seconds, error in pool.map(run, hosts):
+            timings[host] = seconds
+            if error is not None:
+                errors[host] = error
+                continue
+            frames.append(df)
+    result = pd.concat(frames, ignore_index = True) if frames else pd.DataFrame()
+    return QueryManyResult(result, timings, errors)
+
+
+def _query_host(sql:str, host:str, user:str, pw:str) -> pd.DataFrame:
+    """ Query one host, without the login retries (and dialogs) of EZDB.execute """
+    db = EZOracle(hosts = host, user = user, pw = pw, login_on_instantiate = False)
+    with db:
+        db.create_engine()
+        return pd.read_sql_query(sql.strip().rstrip(';'), db._engine)
+
+
 class EZDB:
     """
     You can use this class directly, however it is intended as an abstract
@@ -58,6 +520,8 @@ class EZDB:
                  dialect = None,
                  sql_driver = None,
                  *engine_args,
+                 share_engine = True,
+                 chunksize = None,
                  **engine_kwargs):
         """
         EZOracle is a SQLAlchemy wrapper for PJM databases.  It creates an
@@ -87,6 +551,15 @@ class EZDB:
                                   are committed to db.
                             False: prior to exit/destroy, uncommitted sql
                                    statements are rolled back.
+        :param share_engine: True/False (keyword only)
+                             True:  use the process-wide engine (and connection
+                                    pool) for this host and user; see get_engine.
+                                    Exiting does not close its connections.
+                             False: create a private engine, disposed on exit.
+        :param chunksize: None: execute() fetches the whole result into .result
+                          int:  execute() returns a generator of results of up
+                                to chunksize rows (see stream), and itertuples /
+                                iterrows iterate over the chunks lazily
         """
         self._host = ''
         # read arguments
@@ -99,6 +572,8 @@ class EZDB:
         self.login_on_instantiate:bool = login_on_instantiate
         self.result_as_DataFrame:bool = as_dataframe
         self.auto_commit:bool = auto_commit
+        self.share_engine:bool = share_engine
+        self.chunksize = chunksize
         self.engine_args = engine_args
         self.engine_kwargs = engine_kwargs
         if 'host' in engine_kwargs:
@@ -131,8 +606,20 @@ class EZDB:
             self._session.close()
 
         if self._engine:
-            self._engine.dispose()
-            del self._engine
+            # shared engines stay in the registry, connections warm, for reuse
+            if not self.share_engine:
+                self._engine.dispose()
+            self._engine = None
+
+    def _dispose_engine(self):
+        """
+        Discard this instance's engine, e.g., after a login failure.  A shared
+        engine is only dropped from this instance; other EZDBs may still use it.
+        """
+        if self._engine:
+            if not self.share_engine:
+                self._engine.dispose()
+            self._engine = None
 
     @property
     def dialect(self):
@@ -245,9 +732,11 @@ class EZDB:
             args = tuple([engine_path_win_auth]
                          + list(self.engine_args))
             # Call SQLAlchemy's create_engine function.  #Does NOT verify credentials or host
-
-            self._engine = engine.create_engine(*args,
-                                                **self.engine_kwargs)
+            if self.share_engine:
+                self._engine = get_engine(*args, **self.engine_kwargs)
+            else:
+                self._engine = engine.create_engine(*args,
+                                                    **self.engine_kwargs)
         else:
             raise ConnectionError
 
@@ -298,7 +787,13 @@ class EZDB:
         else:
             return 0  # error not yet classified
 
-    def execute(self, sql:str = None):
+    def execute(self, sql:str = None, as_arrow:bool = False):
+        """
+        Execute sql and return the result (also available as .result).  If
+        chunksize is set, return a stream of chunks (see stream); sql is
+        executed before returning, so login errors are retried here as well.
+        :param as_arrow: True: return a pyarrow Table (see fetch_arrow)
+        """
         self._result = None
         self.sql = sql or self.sql
         self.sql = self.sql.strip().rstrip(';')
@@ -309,6 +804,13 @@ class EZDB:
                 if not self.host or not self.user or not self._pw:
                     self.create_engine()
                 try:
+                    if as_arrow:
+                        self._result = self.fetch_arrow(self.sql)
+                        return self._result
+                    if self.chunksize:
+                        chunks = self.stream(chunksize = self.chunksize)
+                        self._execution_history.append(self.sql)
+                        return chunks
                     if self.result_as_DataFrame:
                         self._result = pd.read_sql_query(self.sql, self._engine)
                     else:
@@ -322,10 +824,8 @@ class EZDB:
                     print(f'Oracle error executing SQL statement "{self._sql}".')
                     print(e)
                     attempts += 1
-                    if self._engine:
-                        self._engine.dispose()
-                        self._engine = None
-                        # self.user = ''
+                    self._dispose_engine()
+                    # self.user = ''
                     self._pw = ''
                 except Exception as e:
                     attempts += 1
@@ -351,10 +851,8 @@ class EZDB:
                         # uncategorized error.
                         # consider adding error code in self._ora_error_type
                         raise
-                    if self._engine:
-                        self._engine.dispose()
-                        self._engine = None
-                        # self.user = ''
+                    self._dispose_engine()
+                    # self.user = ''
                     self._pw = ''
             if attempts == 4:
                 print(f'*** Failed to login to {str(self.host)} 3 times. *** ')
@@ -365,7 +863,196 @@ class EZDB:
         return self.execute(sql)
     q = query
 
+    def stream(self, sql:str = None, chunksize:int = None, as_dataframe:bool = None,
+               arraysize:int = None):
+        """
+        Execute sql and return a generator of the result in chunks, so results
+        too large to hold in memory can be processed a chunk at a time.  sql is
+        executed before stream returns, so errors are raised by the call rather
+        than on first iteration.  Rows are read through a server-side cursor
+        (stream_results), arraysize rows per round trip.
+        :param sql: sql statement to execute.  Default: self.sql
+        :param chunksize: max rows per chunk.  Default: self.chunksize, or
+                          tb_cfg['EZ_ALCHEMY']['CHUNKSIZE']
+        :param as_dataframe: True:  yield pandas DataFrames, indexed by row number
+                             False: yield lists of row tuples
+                             Default: self.result_as_DataFrame
+        :param arraysize: rows the driver fetches per round trip (cursor.arraysize).
+                          Default: tb_cfg['EZ_ALCHEMY']['ARRAYSIZE']
+        """
+        as_dataframe = self.result_as_DataFrame if as_dataframe is None else as_dataframe
+        columns, description, chunks = self._stream_rows(sql, chunksize, arraysize)
+        if not as_dataframe:
+            return chunks
+
+        def frames():
+            start = 0
+            for rows in chunks:
+                df = pd.DataFrame.from_records(rows, columns = columns)
+                df.index = pd.RangeIndex(start, start + len(df))
+                yield df
+                start += len(rows)
+        return frames()
+
+    def _stream_rows(self, sql:str = None, chunksize:int = None, arraysize:int = None):
+        """
+        Execute sql and return (column names, cursor.description, a generator
+        of chunks of the result as lists of row tuples).  The connection is
+        closed when the generator is exhausted or closed.  See stream.
+        """
+        sql = (sql or self.sql).strip().rstrip(';')
+        assert len(sql) > 0, 'sql statement is missing or empty'
+        chunksize = chunksize or self.chunksize or cfg['EZ_ALCHEMY']['CHUNKSIZE']
+        arraysize = arraysize or cfg['EZ_ALCHEMY']['ARRAYSIZE']
+        if not self._engine:
+            self.create_engine()
+
+        def set_arraysize(conn, cursor, statement, parameters, context, executemany):
+            if hasattr(cursor, 'arraysize'):
+                cursor.arraysize = arraysize
+
+        conn = self._engine.connect()
+        try:
+            event.listen(conn, 'before_cursor_execute', set_arraysize)
+            streaming = conn.execution_options(stream_results = True,
+                                               max_row_buffer = chunksize)
+            # sql is passed to the driver as is, as execute does, so ':name' is
+            # not taken for a bind parameter
+            if alch_ver[:2] >= [1, 4]:
+                result = streaming.exec_driver_sql(sql)
+            else:
+                result = streaming.execute(sql)
+        except BaseException:
+            conn.close()
+            raise
+
+        def chunks():
+            with conn:
+                while True:
+                    rows = result.fetchmany(chunksize)
+                    if not rows:
+                        break
+                    yield [tuple(row) for row in rows]
+        return list(result.keys()), result.cursor.description, chunks()
+
+    def iter_arrow(self, sql:str = None, chunksize:int = None, arraysize:int = None):
+        """
+        Execute sql and return a generator of the result as pyarrow RecordBatches
+        of up to chunksize rows, built column by column from the cursor's row
+        batches, so no pandas DataFrame (or per-row Python objects beyond one
+        batch) is created.  Column types come from the cursor's description;
+        where the driver does not report one (e.g., sqlite), the type is
+        inferred per batch, and a column that is all NULL in a batch has
+        pyarrow's null type in that batch.  Requires pyarrow.
+        See stream for chunksize and arraysize.
+        """
+        schema, batches = self._arrow_batches(sql, chunksize, arraysize)
+        return batches
+
+    def _arrow_batches(self, sql:str = None, chunksize:int = None, arraysize:int = None):
+        """
+        Execute sql and return (schema, a generator of RecordBatches).  Columns
+        whose type the driver does not report have the null type in schema.
+        See iter_arrow.
+        """
+        _require_pyarrow()
+        columns, description, chunks = self._stream_rows(sql, chunksize, arraysize)
+        types = [_arrow_type(column) for column in description]
+        schema = pa.schema([pa.field(name, t or pa.null()) for name, t in zip(columns, types)])
+
+        def batches():
+            for rows in chunks:
+                arrays = [pa.array(values, type = t) for values, t in zip(zip(*rows), types)]
+                yield pa.RecordBatch.from_arrays(arrays, names = columns)
+        return schema, batches()
+
+    def fetch_arrow(self, sql:str = None, chunksize:int = None, arraysize:int = None,
+                    to_pandas:bool = False):
+        """
+        Execute sql and return the result as a pyarrow Table.  Requires pyarrow.
+        Where batches infer different types for a column (drivers that do not
+        report column types), integers are promoted to float64.
+        :param to_pandas: True: return a pandas DataFrame backed by the Arrow
+                          columns (pd.ArrowDtype, pandas >= 1.5), without
+                          converting values to numpy or Python objects.  Much
+                          faster and smaller than object dtype for wide string
+                          results.  Older pandas get a plain conversion.
+        See stream for sql, chunksize and arraysize.
+        """
+        schema, batches = self._arrow_batches(sql, chunksize, arraysize)
+        batches = list(batches)
+        schema = _unify_schema([schema] + [batch.schema for batch in batches])
+        table = pa.Table.from_batches([_cast_batch(b, schema) for b in batches],
+                                      schema = schema)
+        self._execution_history.append(sql or self.sql)
+        if to_pandas:
+            return table.to_pandas(types_mapper = getattr(pd, 'ArrowDtype', None))
+        return table
+
+    def to_parquet(self, path:str, sql:str = None, chunksize:int = None,
+                   arraysize:int = None, compression:str = 'snappy') -> int:
+        """
+        Execute sql and write the result to a Parquet file, a batch at a time, so
+        results larger than memory can be exported.  Requires pyarrow.  The
+        file's schema comes from the cursor's description.  Where the driver
+        does not report a column's type (e.g., sqlite), it is inferred from the
+        batches, as in fetch_arrow; if a later batch needs a wider type (a
+        column that was all NULL, or integers promoted to float64), the rows
+        written so far are rewritten with it.  The file is written under a
+        temporary name and renamed to path when complete.
+        :param path: the Parquet file to write
+        :param compression: Parquet compression codec, e.g., 'snappy', 'zstd' or None
+        See stream for sql, chunksize and arraysize.
+        :return: number of rows written
+        """
+        schema, batches = self._arrow_batches(sql, chunksize, arraysize)
+        n_rows = 0
+        # rewriting with a wider schema writes the next temporary file
+        tmp_files = [f'{path}.{os.getpid()}.0.tmp']
+        writer = None
+        try:
+            for batch in batches:
+                wider = _unify_schema([schema, batch.schema])
+                if writer is None:
+                    writer = pq.ParquetWriter(tmp_files[-1], wider, compression = compression)
+                elif not wider.equals(schema):
+                    writer.close()
+                    tmp_files.append(f'{path}.{os.getpid()}.{len(tmp_files)}.tmp')
+                    writer = _rewrite_parquet(tmp_files[-2], tmp_files[-1], wider, compression)
+                    os.remove(tmp_files[-2])
+                schema = wider
+                writer.write_batch(_cast_batch(batch, schema))
+                n_rows += batch.num_rows
+            if writer is None:
+                writer = pq.ParquetWriter(tmp_files[-1], schema, compression = compression)
+            writer.close()
+            os.replace(tmp_files[-1], path)
+        except BaseException:
+            if writer is not None:
+                writer.close()
+            for tmp_file in tmp_files:
+                if os.path.exists(tmp_file):
+                    os.remove(tmp_file)
+            raise
+        finally:
+            batches.close()
+        self._execution_history.append(sql or self.sql)
+        return n_rows
+
+    def _chunks(self):
+        """ DataFrame chunks of the result: self.result, or, if chunksize is set, a stream """
+        if isinstance(self._result, pd.DataFrame):
+            yield self._result
+        elif self.chunksize and self.sql:
+            yield from self.stream(chunksize = self.chunksize, as_dataframe = True)
+        else:
+            yield pd.DataFrame(self._result)
+
     def itertuples(self, index=False, name=None):
+        if self.chunksize and not isinstance(self._result, pd.DataFrame):
+            # lazily, one chunk at a time
+            return (row for df in self._chunks()
+                    for row in df.itertuples(index=index, name=name))
         if isinstance(self._result, pd.DataFrame):
             return self._result.itertuples(index=index, name=name)
         else:
@@ -379,8 +1066,72 @@ class EZDB:
         return self._result.iteritems()
 
     def iterrows(self):
+        if self.chunksize and not isinstance(self._result, pd.DataFrame):
+            # lazily, one chunk at a time
+            return (row for df in self._chunks() for row in df.iterrows())
         return self._result.iterrows()
 
+    def bulk_insert(self, table:str, data, batch_size:int = None, columns:list = None,
+                    callback = None) -> InsertStats:
+        """
+        Insert many rows into table, batch_size rows per executemany (array
+        binding with cx_Oracle), each batch committed as one transaction.  If a
+        batch fails, it is rolled back, the batches before it stay committed and
+        the error is raised.
+        :param table: table name, optionally schema qualified ('schema.table')
+        :param data: a pandas DataFrame, or a list-like of row tuples or dicts
+        :param batch_size: rows per batch.  Default: tb_cfg['EZ_ALCHEMY']['BULK_BATCH_SIZE']
+        :param columns: column names of tuple rows.  Default: the DataFrame's
+                        columns, or the keys of the first dict
+        :param callback: optional, callback(InsertStats), called after each batch
+        :return: InsertStats(rows, batches, seconds, rows_per_second)
+
+        Example:
+            db = EZOracle(hosts = 'MYTST', user = 'me', pw = pw)
+            stats = db.bulk_insert('my_schema.my_table', df, batch_size = 50000)
+            print(f'{stats.rows} rows at {stats.rows_per_second:,.0f} rows/s')
+        """
+        batch_size = batch_size or cfg['EZ_ALCHEMY']['BULK_BATCH_SIZE']
+        if isinstance(data, pd.DataFrame):
+            columns = columns or [str(c) for c in data.columns]
+            # NaN/NaT -> NULL
+            rows = data.astype(object).where(data.notna(), None).itertuples(index = False,
+                                                                             name = None)
+        else:
+            rows = iter(data)
+        if not self._engine:
+            self.create_engine()
+
+        schema, _, table_name = table.rpartition('.')
+        insert = None
+        started = time.perf_counter()
+        n_rows = n_batches = 0
+        stats = InsertStats(0, 0, 0.0, 0.0)
+        with self._engine.connect() as conn:
+            while True:
+                batch = [row for _, row in zip(range(batch_size), rows)]
+                if not batch:
+                    break
+                if insert is None:
+                    if isinstance(batch[0], dict):
+                        columns = columns or list(batch[0].keys())
+                    assert columns, 'columns are required to insert tuple rows'
+                    insert = sql_table(table_name, *[sql_column(c) for c in columns],
+                                       schema = schema or None).insert()
+                if not isinstance(batch[0], dict):
+                    batch = [dict(zip(columns, row)) for row in batch]
+                with conn.begin():
+                    conn.execute(insert, batch)
+                n_rows += len(batch)
+                n_batches += 1
+                seconds = time.perf_counter() - started
+                stats = InsertStats(n_rows, n_batches, seconds,
+                                    n_rows / seconds if seconds else 0.0)
+                if callback:
+                    callback(stats)
+        self._execution_history.append(f'bulk_insert {table} ({n_rows} rows)')
+        return stats
+
     @contextmanager
     def atomic(self):
         """Run queries as atomic transactions.  Context manager.
@@ -439,6 +1190,8 @@ class EZOracle(EZDB):
                  auto_commit = False,
                  # max_identifier_length: int = 128,
                  *engine_args,
+                 share_engine = True,
+                 chunksize = None,
                  **engine_kwargs):
 
         # This if...else statement added in version 2021.08.6
@@ -455,6 +1208,8 @@ class EZOracle(EZDB):
                          auto_commit = auto_commit,
                          dialect = cfg['ORACLE']['DIALECT'],
                          sql_driver = cfg['ORACLE']['DRIVER'],
+                         share_engine = share_engine,
+                         chunksize = chunksize,
                          *engine_args,
                          **engine_kwargs)
 
@@ -1,21 +1,32 @@
 #!/usr/bin/env python
 
+import atexit
+import fnmatch
 import ftplib
+import hashlib
+import json
 import os
-import tempfile
+import posixpath
+import re
+import threading
+import time
 from collections import namedtuple
+from contextlib import contextmanager
 from typing import Union
-from datetime import datetime as dtdt
+from datetime import datetime as dtdt, timedelta
 from urllib.parse import urlsplit
 
 from dateutil import parser
 
 from toolbox import pathlib
-from toolbox.file_util.hash import hash_match
+from toolbox.rate_limit import rate_limiter, run_bounded
 # from toolbox import tb_cfg
 
 NoneType = type(None)
 
+# seconds between progress callbacks during a download
+PROGRESS_INTERVAL = 0.5
+
 # create a named tuple for results
 StatsTuple = namedtuple(typename='StatsTuple',
                         field_names=('scheme', 'netloc', 'path', 'dirname',
@@ -32,6 +43,22 @@ CompareTuple = namedtuple(typename='CompareTuple',
                           field_names=['match', 'base_match', 'size_match',
                                        'modified_match', 'hash_match']
                           )
+# progress of a download, passed to download callbacks.  size is None if unknown.
+DownloadProgress = namedtuple('DownloadProgress',
+                              ['url', 'target_filename', 'received', 'size',
+                               'seconds', 'bytes_per_second', 'done'])
+# what mirror() did: lists of local paths, and (url, exception) for failed downloads
+MirrorResult = namedtuple('MirrorResult', ['downloaded', 'unchanged', 'deleted', 'failed'])
+# one entry of a directory listing.  modified and size are None if unknown.
+ListTuple = namedtuple('ListTuple', ['name', 'modified', 'size', 'is_dir'])
+
+# LIST line formats.  Which one a server uses depends on the server, not the client.
+#   unix:    drwxr-xr-x   1 owner    group        4096 Oct 18 04:32 name
+#   windows: 12-10-21  01:47PM       <DIR>          name
+_UNIX_LIST_LINE = re.compile(r'^([\-dlbcps])\S{9,}\s+\d+\s+\S+(?:\s+\S+)?\s+(\d+)\s+'
+                             r'([A-Za-z]{3}\s+\d{1,2}\s+(?:\d{1,2}:\d{2}|\d{4}))\s(.+)$')
+_WINDOWS_LIST_LINE = re.compile(r'^(\d{1,2}-\d{1,2}-\d{2,4})\s+(\d{1,2}:\d{2}\s*[AaPp][Mm])\s+'
+                                r'(<DIR>|\d+)\s+(.+)$')
 
 
 def url_join(scheme, netloc, path='') -> str:
@@ -66,7 +93,10 @@ def url_split(host_or_url, source_address: tuple = None) -> FTPPathParts:
     :returns:  FTPPathParts
     """
     # (scheme='ftp', netloc='ftp.pjm.com', path='/oasis/CBMID.pdf', query='', fragment='')
-    scheme, host, path, query, fragment = urlsplit(host_or_url)
+    # ftp paths have no query or #fragment, so '?' and '#' are part of the path
+    scheme, host, path, query, fragment = urlsplit(host_or_url, allow_fragments=False)
+    if query or host_or_url.rstrip().endswith('?'):
+        path += '?' + query
     if not host:
         s = path.split('/')
         if s[0].count('.') >= 2 or (len(s) > 1 and s[0].count('.') >= 1):
@@ -89,6 +119,121 @@ def url_split(host_or_url, source_address: tuple = None) -> FTPPathParts:
     return FTPPathParts(scheme, host, path, _dirname, _basename, url)
 
 
+def parse_list_line(line: str, now: dtdt = None) -> Union[ListTuple, NoneType]:
+    """
+    Parse one line of a LIST response in Unix (ls -l) or Windows (IIS/DOS) format.
+    Unix listings give modified times to the minute (or, for older files, the day),
+    in the server's time zone.
+    :param line: a line of a LIST response
+    :param now: the current time, used to fill in the year of recent Unix listings
+    :return: ListTuple, or None if line is not a file or directory entry
+    """
+    line = line.rstrip('\r\n')
+    match = _WINDOWS_LIST_LINE.match(line)
+    if match:
+        date, time_of_day, size_or_dir, name = match.groups()
+        date_format = '%m-%d-%Y' if len(date.split('-')[-1]) == 4 else '%m-%d-%y'
+        try:
+            modified = dtdt.strptime(f'{date} {time_of_day.replace(" ", "").upper()}',
+                                     f'{date_format} %I:%M%p')
+        except ValueError:
+            modified = None
+        if size_or_dir.upper() == '<DIR>':
+            return ListTuple(name, modified, None, True)
+        return ListTuple(name, modified, int(size_or_dir), False)
+
+    match = _UNIX_LIST_LINE.match(line)
+    if match:
+        ls_type, size, date, name = match.groups()
+        name = name.strip()
+        if ls_type == 'l' and ' -> ' in name:
+            # symbolic link: name -> target
+            name = name.split(' -> ')[0]
+        now = now or dtdt.now()
+        try:
+            if ':' in date:
+                # recent files are listed without a year
+                modified = dtdt.strptime(f'{date} {now.year}', '%b %d %H:%M %Y')
+                if modified > now + timedelta(days=1):
+                    modified = modified.replace(year=now.year - 1)
+            else:
+                modified = dtdt.strptime(date, '%b %d %Y')
+        except ValueError:
+            modified = None
+        is_dir = ls_type == 'd'
+        return ListTuple(name, modified, None if is_dir else int(size), is_dir)
+    return None
+
+
+def parse_mlsd_facts(name: str, facts: dict) -> Union[ListTuple, NoneType]:
+    """
+    Make a ListTuple from one entry of an MLSD response (see ftplib.FTP.mlsd).
+    Returns None for the "." and ".." entries.
+    """
+    entry_type = facts.get('type', '').lower()
+    if entry_type in ('cdir', 'pdir') or name in ('.', '..'):
+        return None
+    is_dir = entry_type == 'dir'
+    modified = None
+    if facts.get('modify'):
+        try:
+            modified = dtdt.strptime(facts['modify'][:14], '%Y%m%d%H%M%S')
+        except ValueError:
+            pass
+    size = facts.get('size') or facts.get('sizd')
+    size = int(size) if size is not None and not is_dir else None
+    return ListTuple(name, modified, size, is_dir)
+
+
+class ListingCache:
+    """
+    Directory listings, {name: ListTuple}, keyed by (host, port, directory) and
+    kept for ttl seconds.  Shared by all FTP connections, so one listing answers
+    stats(), size(), modified(), exists() and is_dir() for every entry in it.
+    """
+    def __init__(self, ttl: float = 60):
+        """
+        :param ttl: seconds a listing is used before the directory is listed again.
+                    0 = do not cache.
+        """
+        self.ttl = ttl
+        self._listings = {}
+        self._lock = threading.Lock()
+
+    def get(self, key: tuple) -> Union[dict, NoneType]:
+        with self._lock:
+            cached = self._listings.get(key)
+            if cached is None:
+                return None
+            listed_at, listing = cached
+            if time.monotonic() - listed_at > self.ttl:
+                del self._listings[key]
+                return None
+            return listing
+
+    def put(self, key: tuple, listing: dict):
+        if self.ttl:
+            with self._lock:
+                self._listings[key] = (time.monotonic(), listing)
+
+    def invalidate(self, host: str = None, port: int = None, directory: str = None):
+        """ Forget cached listings: all, or those of host (and port, and directory). """
+        with self._lock:
+            if host is None:
+                self._listings = {}
+                return
+            for key in list(self._listings):
+                if key[0] == host.lower() and port in (None, key[1]) \
+                        and directory in (None, key[2]):
+                    del self._listings[key]
+
+
+# the cache shared by all FTP connections
+listing_cache = ListingCache()
+# {(host, port): whether the server supports MLSD}, so each server is only asked once
+_mlsd_hosts = {}
+
+
 # ##############################################################################
 # API - Class
 # ##############################################################################
@@ -102,6 +247,13 @@ class FTP(ftplib.FTP):
     call login(user, passwd, acct) is made (where passwd and acct default to
     the empty string when not given).
 
+    Connections and data transfers (LIST, NLST, RETR, ...) wait their turn with
+    toolbox.rate_limit.rate_limiter, keyed by host.
+
+    session() reuses the connection if it is still logged in to the same host as
+    the same user.  To share warm connections between many checks (and threads),
+    get them from ftp_pool (see FTPPool).
+
     Examples:
     >>> FTP().listdir(path='ftp://ftp.pjm.com/oasis')
 
@@ -122,6 +274,16 @@ class FTP(ftplib.FTP):
         """
         self.scheme = ''
         self.path = ''
+        # (host, port, user) of the current login; None if not logged in
+        self._login_key = None
+        # time.monotonic() of the last reply from the server
+        self._last_reply = 0.0
+        # the login directory, and whether cwd() has been called since login
+        self.home = None
+        self._cwd_changed = False
+        # the current directory, if known; and whether the server supports MLSD
+        self._cwd_path = None
+        self._mlsd_supported = None
         if host_or_url:
             self.set_url(host_or_url=host_or_url, source_address=source_address)
         super().__init__(host=self.host, user=user, passwd=passwd, acct=acct,
@@ -143,7 +305,12 @@ class FTP(ftplib.FTP):
 
     @property
     def url(self) -> str:
-        return url_join(self.scheme, self.host, self.path)
+        return url_join(self.scheme, self.netloc, self.path)
+
+    @property
+    def netloc(self) -> str:
+        """ host, or host:port if not the default ftp port """
+        return self.host if self.port == ftplib.FTP_PORT else f'{self.host}:{self.port}'
 
     @url.setter
     def url(self, new_url):
@@ -153,14 +320,137 @@ class FTP(ftplib.FTP):
         x = url_split(host_or_url=host_or_url, source_address=source_address)
         assert (x.scheme.lower() in ['ftp', 'ftps', ''])
         self.scheme = x.scheme or self.scheme
-        self.host = x.netloc or self.host
+        host = x.netloc or self.host
+        # connect to the port in a host:port netloc instead of the default (21)
+        if ':' in host and host.rsplit(':', 1)[1].isdigit():
+            host, port = host.rsplit(':', 1)
+            self.port = int(port)
+        self.host = host
         self.path = x.path
 
+    def connect(self, host='', port=0, timeout=-999, source_address=None):
+        """ ftplib.FTP.connect, rate limited per host. """
+        limited_host = host or self.host
+        rate_limiter.wait(limited_host)
+        try:
+            return super().connect(host=host, port=port, timeout=timeout,
+                                   source_address=source_address)
+        except ftplib.error_temp as e:
+            # 421: too many connections / service not available.  Back off this host.
+            if str(e).startswith('421'):
+                rate_limiter.block(limited_host, rate_limiter.retry_after_default)
+            raise
+
+    def ntransfercmd(self, cmd, rest=None):
+        """ ftplib.FTP.ntransfercmd, rate limited per host. """
+        rate_limiter.wait(self.host)
+        return super().ntransfercmd(cmd, rest)
+
+    def getresp(self):
+        resp = super().getresp()
+        self._last_reply = time.monotonic()
+        return resp
+
+    def cwd(self, dirname):
+        if self.home is None:
+            # remember the login directory, so FTPPool can return to it
+            self.home = self.pwd()
+        self._cwd_changed = True
+        self._cwd_path = None
+        return super().cwd(dirname)
+
+    def abspath(self, path: str) -> str:
+        """ Return the absolute path on the server of path (a path or url). """
+        path = url_split(path).path or '.'
+        if not path.startswith('/'):
+            if self._cwd_path is None:
+                self._cwd_path = self.pwd()
+            path = posixpath.join(self._cwd_path, path)
+        return posixpath.normpath(path).replace('//', '/')
+
+    def listing(self, path: str, refresh: bool = False) -> dict:
+        """
+        Return the contents of directory path as {name: ListTuple}.  Listings
+        come from listing_cache if listed within its ttl.  The directory is listed
+        with MLSD, or with LIST if the server does not support MLSD.
+        :param path: the directory's path or url
+        :param refresh: True: list the directory even if it is cached
+        """
+        self.session()
+        path = self.abspath(path)
+        key = (self.host.lower(), self.port, path)
+        listing = None if refresh else listing_cache.get(key)
+        if listing is None:
+            listing = {entry.name: entry for entry in self._list_dir(path)}
+            listing_cache.put(key, listing)
+        return listing
+
+    def _list_dir(self, path: str) -> list:
+        if self._mlsd_supported is None:
+            self._mlsd_supported = _mlsd_hosts.get((self.host.lower(), self.port))
+        if self._mlsd_supported is not False:
+            try:
+                entries = [parse_mlsd_facts(name, facts) for name, facts in self.mlsd(path)]
+                self._mlsd_supported = _mlsd_hosts[(self.host.lower(), self.port)] = True
+                return [entry for entry in entries if entry]
+            except ftplib.error_perm as e:
+                if str(e)[:3] not in ('500', '501', '502', '504'):
+                    raise
+                # PJM ftp servers do not support MLSD, so fall back to LIST
+                self._mlsd_supported = _mlsd_hosts[(self.host.lower(), self.port)] = False
+        lines = []
+        self.retrlines(f'LIST {path}', lines.append)
+        return [entry for entry in map(parse_list_line, lines) if entry]
+
+    def listing_times_exact(self) -> bool:
+        """
+        True if this server's listings come from MLSD, whose modified times are UTC
+        to the second.  LIST times are in the server's time zone, only to the
+        minute (or day), and their year may be guessed, so they are not exact.
+        """
+        if self._mlsd_supported is None:
+            return bool(_mlsd_hosts.get((self.host.lower(), self.port)))
+        return self._mlsd_supported
+
+    def entry(self, path: str) -> Union[ListTuple, NoneType]:
+        """
+        Return the ListTuple of path (a path or url) from its directory's listing,
+        or None if path is not in it.  Raises ftplib.error_perm if the directory
+        cannot be listed.
+        """
+        path = self.abspath(path)
+        if path == '/':
+            return ListTuple('/', None, None, True)
+        dirname, basename = posixpath.split(path)
+        return self.listing(dirname).get(basename)
+
+    def close(self):
+        self._login_key = None
+        self._cwd_path = None
+        super().close()
+
+    def alive(self, user='', noop_after: float = 1.0) -> bool:
+        """
+        Return True if this FTP is connected to self.host and logged in as user.
+        Unless the server replied within the last noop_after seconds, a NOOP is
+        sent to make sure the connection still works.
+        """
+        if self.sock is None or self._login_key != (self.host.lower(), self.port, user):
+            return False
+        if time.monotonic() - self._last_reply < noop_after:
+            return True
+        try:
+            self.voidcmd('NOOP')
+            return True
+        except (OSError, EOFError, ftplib.Error):
+            return False
+
     def session(self, host_or_url='', user='', passwd='', acct='',
                 timeout=None, source_address=None):
         """
         If a session is not already open, create one.  Attempts FTP.connect
-        and FTP.login methods.
+        and FTP.login methods.  An open session that is logged in to the same
+        host as the same user (and answers NOOP) is reused.
         :param host_or_url:
         :param user:
         :param passwd:
@@ -170,6 +460,11 @@ class FTP(ftplib.FTP):
         if host_or_url or source_address:
             # set self.scheme, .host, .path
             self.set_url(host_or_url, source_address)
+        if self.alive(user=user):
+            return self
+        if self.sock is not None:
+            # connected, but to another host or as another user, or gone stale
+            self.close()
         # if self.host
         # if parts.netloc:
         try:
@@ -191,6 +486,9 @@ class FTP(ftplib.FTP):
             self.login(user=user, passwd=passwd, acct=acct)
         else:
             self.login()
+        self._login_key = (self.host.lower(), self.port, user)
+        self.home = None
+        self._cwd_changed = False
 
         return self
 
@@ -223,20 +521,34 @@ class FTP(ftplib.FTP):
         parts = FTPPathParts(self.scheme, parts.netloc or self.host, parts.path or self.path,
                              parts.dirname, parts.basename, parts.url)
 
-        # verify path exists
-        if not self.exists(parts.path):
-            raise FileNotFoundError
+        # look the path up in its directory's (cached) listing
+        _mod_time, _size = None, None
+        try:
+            entry = self.entry(parts.path)
+            if entry is None:
+                raise FileNotFoundError(parts.path)
+        except ftplib.error_perm:
+            # the directory cannot be listed, so ask about the path itself
+            entry = None
+            # verify path exists
+            if not self.exists(parts.path):
+                raise FileNotFoundError
 
         # now that we are logged into the ftp server, let's double check that
         # we split dirname and basename correctly.
-        if self.is_dir(parts.path):
+        if (entry.is_dir if entry else self.is_dir(parts.path)):
             _dirname, _basename = parts.path, ''
         else:
             _dirname, _basename = os.path.split(parts.path)
-
-        # get modified date
-        _mod_time = None
-        if output_option.lower() != 'size_only':
+            if entry:
+                _size = entry.size
+                # only MLSD listings give times as exact as MDTM
+                if self.listing_times_exact():
+                    _mod_time = entry.modified
+
+        # get modified date with MDTM, if the listing did not give an exact one
+        if _mod_time is None and output_option.lower() != 'size_only' \
+                and not (entry and entry.is_dir):
             try:
                 _mod_time = parser.parse(self.voidcmd(f"MDTM {parts.path}")[4:].strip())
             except ftplib.error_perm:
@@ -244,9 +556,9 @@ class FTP(ftplib.FTP):
             except Exception:
                 raise
 
-        # get file size
-        _size = None
-        if output_option.lower != 'modified_only':
+        # get file size, if the listing did not give it
+        if _size is None and output_option.lower() != 'modified_only' \
+                and not (entry and entry.is_dir):
             try:
                 _size = super().size(parts.path)
             except ftplib.error_perm:
@@ -260,7 +572,7 @@ class FTP(ftplib.FTP):
         elif output_option.lower() == 'modified_only':
             return _mod_time
         else:
-            return StatsTuple(self.scheme, self.host, parts.path,
+            return StatsTuple(self.scheme, self.netloc, parts.path,
                               _dirname, _basename, _mod_time, _size)
 
     def modified(self, host_or_url: str = '', user='', passwd='', acct='') -> dtdt:
@@ -276,6 +588,12 @@ class FTP(ftplib.FTP):
         self.session(host_or_url=host_or_url, user=user,
                      passwd=passwd, acct=acct)
         if parts.basename:
+            try:
+                entry = self.entry(parts.path)
+            except ftplib.error_perm:
+                entry = None
+            if entry and entry.size is not None:
+                return entry.size
             return super().size(parts.path)
         else:
             return None
@@ -284,6 +602,11 @@ class FTP(ftplib.FTP):
         # if scheme or host are included in path, we'll strip those out.
         self.session()
         parts = url_split(path)
+        try:
+            if self.entry(parts.path):
+                return True
+        except ftplib.error_perm:
+            pass
         # x = self.voidcmd (f"MDTM {parts.path.rstrip('/')}")
         try:
             x = self.nlst(parts.path.rstrip('/'))
@@ -334,28 +657,173 @@ class FTP(ftplib.FTP):
     #                     stats.basename, stats.modified, stats.size, save_as)
     #
     def download(self, url_or_path: str, user='', passwd='', acct='',
-                 tgt_folder='', overwrite: bool = True) -> GetTuple:
-
+                 tgt_folder='', overwrite: bool = True, resume: bool = True,
+                 callback=None, blocksize: int = 65536) -> GetTuple:
+        """
+        Download a file.  The file is written to "<target>.part" and renamed to
+        its target name once complete, so an interrupted download never leaves a
+        truncated file under the target name.
+        :param url_or_path: the file's url, or its path on the connected server
+        :param tgt_folder: folder to save the file in (created if missing).
+                           Default: the current directory.
+        :param overwrite: False: raise FileExistsError if the target file exists
+        :param resume: True: if a .part file from an interrupted download of this
+                       same version of the file exists, continue from where it
+                       stopped (REST) instead of starting over.  The remote file's
+                       size and modified time are recorded next to the .part file
+                       (in "<target>.part.json"); if the remote file has changed
+                       since, or its modified time is unknown, the download starts
+                       over.
+        :param callback: optional, callback(DownloadProgress), called as the file
+                         downloads (at most every PROGRESS_INTERVAL seconds) and once
+                         when it is complete
+        :param blocksize: max bytes read from the data connection at a time
+        :return: GetTuple
+        """
         # get file stats from server before downloading
         result = self.stats(url_or_path=url_or_path, user=user, passwd=passwd, acct=acct)
         # download file from ftp server to disk
         save_as = pathlib.Path(result.path).name
         if tgt_folder:
+            os.makedirs(tgt_folder, exist_ok=True)
             save_as = os.path.join(tgt_folder, result.basename)
         if not overwrite and os.path.exists(save_as):
             raise FileExistsError(f'File "{save_as}" already exists. ')
 
-        with open(save_as, "wb") as file:
-            # use FTP's RETR command to download the file: https://docs.python.org/3/library/ftplib.html#ftplib.FTP.retrbinary
-            _global_ftp.retrbinary(f"RETR {result.path}", file.write)
+        part_file = save_as + '.part'
+        url = url_join(result.scheme, result.netloc, result.path)
+        part_info = {'url': url, 'size': result.size,
+                     'modified': result.modified.isoformat() if result.modified else None}
+        rest = 0
+        if resume and result.size and result.modified and os.path.exists(part_file) \
+                and _read_part_info(part_file) == part_info:
+            rest = os.path.getsize(part_file)
+            if rest > result.size:
+                rest = 0
+        if not rest:
+            # starting over: record which version of the file the .part file holds
+            with open(part_file + '.json', 'w') as f:
+                json.dump(part_info, f)
+        received = rest
+        started = last_report = time.monotonic()
+
+        def report(done=False):
+            seconds = time.monotonic() - started
+            bytes_per_second = (received - rest) / seconds if seconds else None
+            callback(DownloadProgress(url, save_as, received, result.size,
+                                      seconds, bytes_per_second, done))
+
+        def write(block):
+            nonlocal received, last_report
+            file.write(block)
+            received += len(block)
+            if callback and time.monotonic() - last_report >= PROGRESS_INTERVAL:
+                last_report = time.monotonic()
+                report()
+
+        while True:
+            try:
+                with open(part_file, 'ab' if rest else 'wb') as file:
+                    if not result.size or rest < result.size:
+                        # use FTP's RETR command to download the file: https://docs.python.org/3/library/ftplib.html#ftplib.FTP.retrbinary
+                        self.retrbinary(f"RETR {result.path}", write, blocksize=blocksize,
+                                        rest=rest or None)
+                break
+            except ftplib.error_perm:
+                if not rest:
+                    raise
+                # the server refused to resume (e.g., 502 REST not implemented):
+                # discard the .part file and start over from the first byte
+                os.remove(part_file)
+                rest = received = 0
+                with open(part_file + '.json', 'w') as f:
+                    json.dump(part_info, f)
+
+        if result.size is not None and received != result.size:
+            # keep the .part file, so the next attempt can resume; and list the
+            # directory again next time, in case the file changed since it was listed
+            listing_cache.invalidate(self.host, self.port, result.dirname)
+            raise EOFError(f'Download of "{url}" incomplete: received {received} '
+                           f'of {result.size} bytes.')
+        os.replace(part_file, save_as)
+        try:
+            os.remove(part_file + '.json')
+        except FileNotFoundError:
+            pass
+        if callback:
+            report(done=True)
 
         return GetTuple(result.scheme, result.netloc, result.path, result.dirname,
                         result.basename, result.modified, result.size, save_as)
 
+    def hash(self, path: str, algorithm: str = 'sha256', blocksize: int = 65536) -> str:
+        """
+        Return the hexdigest of a file on the server.  The file is hashed as it
+        downloads; nothing is written to disk.
+        :param path: the file's url, or its path on the connected server
+        :param algorithm: any hashlib algorithm, e.g., 'sha256' or 'md5'
+        """
+        self.session()
+        h = hashlib.new(algorithm)
+        self.retrbinary(f'RETR {url_split(path).path}', h.update, blocksize=blocksize)
+        return h.hexdigest()
+
+    def same_as_local(self, path: str, local_path: str, blocksize: int = 65536) -> bool:
+        """
+        Return True if a file on the server has the same contents as local_path.
+        Each block is compared with the same bytes of the local file as it
+        downloads, and the transfer is aborted at the first block that differs,
+        so files that differ early (or in size) are not downloaded in full.
+        :param path: the file's url, or its path on the connected server
+        :param local_path: the local file
+        :param blocksize: max bytes read from the data connection at a time
+        """
+        self.session()
+        remote_size = self.size(path)
+        if remote_size is not None and remote_size != os.path.getsize(local_path):
+            return False
+
+        with open(local_path, 'rb') as local:
+            def compare(block):
+                if local.read(len(block)) != block:
+                    raise _BlockMismatch
+
+            try:
+                self.retrbinary(f'RETR {url_split(path).path}', compare, blocksize=blocksize)
+            except _BlockMismatch:
+                self._end_aborted_transfer()
+                return False
+            # the local file may be longer than the remote one
+            return not local.read(1)
+
+    def _end_aborted_transfer(self, timeout: float = 10):
+        """
+        Read the server's reply to a transfer whose data connection was closed
+        early, so the connection can be used again.  Closes the connection if
+        the server does not reply.
+        """
+        old_timeout = self.sock.gettimeout()
+        try:
+            self.sock.settimeout(timeout)
+            self.voidresp()
+        except ftplib.Error:
+            # e.g., 426 Connection closed; transfer aborted
+            pass
+        except (OSError, EOFError):
+            self.close()
+            return
+        self.sock.settimeout(old_timeout)
+
     def is_dir(self, path: str) -> bool:
         # self.session()
         # if scheme or host are included in path, we'll strip those out.
         path = urlsplit(path).path
+        try:
+            entry = self.entry(path)
+            if entry:
+                return entry.is_dir
+        except ftplib.error_perm:
+            pass
         if not self.exists(path=path):
             return False
         try:
@@ -376,80 +844,221 @@ class FTP(ftplib.FTP):
         :param user: username
         :param passwd: password
         :param acct: ftp account
-        :param get_stats:
-        :return: namedtuple(is_dir, dirs, nondirs), where
-                is_dir = True if ftp_path is a dir (not a file or other)
-                         False if ftp_path is not a dir
-                dirs = list of directories in ftp_path
-                non_dirs = list of non-directory items in ftp_path
-        """
-        ListTuple = namedtuple('ListTuple', ['name', 'modified',
-                                             'size', 'is_dir'])
+        :param get_stats: True: return StatsTuples instead of ListTuples
+        :return: list of ListTuple(name, modified, size, is_dir), one per item in
+                 directory path, or [ListTuple] of path itself if path is a file.
+                 The listing is cached in listing_cache.
+        """
         # open and log into ftp
         try:
             self.session()
         except:
             self.session(host_or_url=path, user=user, passwd=passwd, acct=acct)
+
+        path = self.abspath(path)
+        entry = self.entry(path)
+        if entry and not entry.is_dir:
+            dirname, entries = posixpath.dirname(path), [entry]
+        else:
+            dirname, entries = path, list(self.listing(path).values())
         if get_stats:
-            raise NotImplementedError
-
-        file_list, dirs, non_dirs = [], [], []
-        res = []
-
-        parts = urlsplit(path)
-
-        self.retrlines(f'LIST {parts.path}',
-                       lambda s: file_list.append(s.split()))
-        # PJM ftp servers do not support mlsd, so this substandard workaround
-        # is necessary.
-        for info in file_list:
-            if os.name == 'nt':
-                # info[1] = date
-                # info[2] = time
-                # info[-2] = type or size
-                # info[-1] = name
-                mod_time = info[0] + ' ' + info[1]
-                mod_time = dtdt.strptime(mod_time, '%m-%d-%y %I:%M%p')
-                if info[-2].upper() in ['<DIR>']:
-                    # info[-2] = type
-                    #           [name,     modified, size]
-                    # ['name', 'modified','size', 'is_dir']
-                    res.append(ListTuple(info[-1], mod_time, None, True))
-                elif info[-2].isnumeric:
-                    # info[-2] = size
-                    #               [name,     modified, size    ]
-                    res.append(ListTuple(info[-1], mod_time,
-                                         int(info[-2]), False))
-                else:
-                    #               [name,     modified, size    ]
-                    res.append(ListTuple(info[-1], mod_time, None, None))
-            else:
-                # Not tested on non-NT systems.
-                # info[0] = type
-                # info[-1] = name
-                ls_type, name = info[0], info[-1]
-                _is_dir = False
-                if ls_type.startswith('d'):
-                    _is_dir = True
-                res.append(ListTuple(name, None, None, _is_dir))
-
-        return res
-
-    def walk(self, top, path=''):
-        raise NotImplementedError
-        # TODO: this fails on at "self.retrlines (f'LIST {parts.path}',
-        # # lambda s: file_list.append (s.split ()))" in self.listdir
-        contents = self.listdir(top)
-        dirs = [x.name for x in contents if x.is_dir()]
-        nondirs = [x.name for x in contents if not x.is_dir()]
-        yield (path or top), dirs, nondirs
-        path = top
-        for name in dirs:
-            path = os.path.join(path, name)
-            for x in self.walk(name, path):
-                yield x
-            self.cwd('..')
-            path = os.path.dirname(path)
+            return [self._stats_tuple(dirname, entry) for entry in entries]
+        return entries
+
+    def _stats_tuple(self, dirname: str, entry: ListTuple) -> StatsTuple:
+        path = posixpath.join(dirname, entry.name)
+        if entry.is_dir:
+            return StatsTuple(self.scheme or 'ftp', self.netloc, path, path, '',
+                              entry.modified, entry.size)
+        return StatsTuple(self.scheme or 'ftp', self.netloc, path, dirname, entry.name,
+                          entry.modified, entry.size)
+
+    def walk(self, top: str, max_depth: int = None, include: list = None,
+             exclude: list = None, max_workers: int = 4, onerror=None,
+             user='', passwd='', acct='', pool: 'FTPPool' = None):
+        """
+        Directory tree generator, like os.walk.  For each directory in the tree
+        rooted at top (including top itself), yields (dirpath, dirs, files), where
+        dirpath is the directory's path on the server, dirs is a list of the names
+        of its subdirectories and files is a list of ListTuple(name, modified,
+        size, is_dir) of the other entries.
+
+        Directories are walked breadth first: all the directories at one depth
+        are listed, max_workers at a time over connections from pool, before any
+        at the next depth.  As with os.walk, removing names from dirs before the
+        next directory is yielded keeps walk() from descending into them.
+        :param top: url or path of the directory to walk
+        :param max_depth: do not descend more than this many levels below top
+                          (0 = list top only).  None = no limit.
+        :param include: glob patterns (e.g., ['*.csv', '*.zip']); only files that
+                        match at least one are included in files.  None = all files.
+        :param exclude: glob patterns of files and directories to leave out (and
+                        not descend into).  Patterns are matched against entry
+                        names, or, if they contain a '/', against full paths.
+        :param max_workers: max directories listed at once.  1 = list them one at
+                            a time over this connection.
+        :param onerror: optional, onerror(dirpath, exception), called for a directory
+                        that cannot be listed.  By default, such directories are skipped.
+        :param user: username
+        :param passwd: password
+        :param acct: ftp account
+        :param pool: the FTPPool to take connections from.  Default: ftp_pool.
+
+        Examples:
+        >>> ftp = FTP('ftp://ftp.pjm.com')
+        >>> for dirpath, dirs, files in ftp.walk('/oasis', max_depth=1, include=['*.pdf']):
+        ...     print(dirpath, len(dirs), sum(f.size for f in files))
+        """
+        parts = url_split(top)
+        if parts.netloc:
+            self.session(top, user=user, passwd=passwd, acct=acct)
+        else:
+            self.session(user=user, passwd=passwd, acct=acct)
+        pool = pool or ftp_pool
+        netloc_url = url_join(self.scheme or 'ftp', self.netloc)
+
+        def list_dir(url):
+            dirpath = url_split(url).path
+            try:
+                if max_workers <= 1:
+                    return self.listing(dirpath)
+                with pool.connection(url, user=user, passwd=passwd, acct=acct) as ftp:
+                    return ftp.listing(dirpath)
+            except (OSError, EOFError, ftplib.Error) as e:
+                return e
+
+        level = [self.abspath(parts.path)]
+        depth = 0
+        while level:
+            jobs = [dict(url=netloc_url + dirpath) for dirpath in level]
+            listings = run_bounded(list_dir, jobs, max_workers=max_workers,
+                                   per_host_limit=max_workers)
+            next_level = []
+            for dirpath, listing in zip(level, listings):
+                if isinstance(listing, Exception):
+                    if onerror:
+                        onerror(dirpath, listing)
+                    continue
+                dirs, files = [], []
+                for entry in sorted(listing.values()):
+                    path = posixpath.join(dirpath, entry.name)
+                    if exclude and _glob_match(entry.name, path, exclude):
+                        continue
+                    if entry.is_dir:
+                        dirs.append(entry.name)
+                    elif not include or _glob_match(entry.name, path, include):
+                        files.append(entry)
+                yield dirpath, dirs, files
+                if max_depth is None or depth < max_depth:
+                    next_level.extend(posixpath.join(dirpath, name) for name in dirs)
+            level = next_level
+            depth += 1
+
+
+# ##############################################################################
+# Connection pool
+# ##############################################################################
+
+class FTPPool:
+    """
+    Logged-in FTP connections, kept warm for reuse and keyed by (host, port, user).
+
+    Examples:
+    >>> with ftp_pool.connection('ftp://ftp.pjm.com/oasis/CBMID.pdf') as ftp:
+    ...     ftp.size('ftp://ftp.pjm.com/oasis/CBMID.pdf')
+    """
+    def __init__(self, max_idle: int = 4, idle_timeout: float = 60):
+        """
+        :param max_idle: max idle connections kept per (host, port, user)
+        :param idle_timeout: idle connections older than this many seconds are closed
+                             instead of reused
+        """
+        self.max_idle = max_idle
+        self.idle_timeout = idle_timeout
+        self._idle = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _key(ftp: FTP, user: str) -> tuple:
+        return ftp.host.lower(), ftp.port, user
+
+    def acquire(self, host_or_url: str, user='', passwd='', acct='', timeout=None) -> FTP:
+        """
+        Return a logged-in FTP for host_or_url's host: an idle connection that
+        passes a health check (NOOP), or else a new one.  Give it back with release().
+        """
+        ftp = FTP()
+        ftp.set_url(host_or_url)
+        key = self._key(ftp, user)
+        while True:
+            with self._lock:
+                idle = self._idle.get(key)
+                pooled, released = idle.pop() if idle else (None, None)
+            if pooled is None:
+                break
+            if time.monotonic() - released <= self.idle_timeout and pooled.alive(user):
+                pooled.set_url(host_or_url)
+                return pooled
+            _quietly_close(pooled)
+        return ftp.session(user=user, passwd=passwd, acct=acct, timeout=timeout)
+
+    def release(self, ftp: FTP):
+        """ Return ftp to the pool, or close it if the pool is full or ftp is not logged in. """
+        if ftp.sock is None or ftp._login_key is None:
+            _quietly_close(ftp)
+            return
+        if ftp._cwd_changed and ftp.home:
+            try:
+                ftp.cwd(ftp.home)
+                ftp._cwd_changed = False
+            except (OSError, EOFError, ftplib.Error):
+                _quietly_close(ftp)
+                return
+        with self._lock:
+            idle = self._idle.setdefault(ftp._login_key, [])
+            if len(idle) < self.max_idle:
+                idle.append((ftp, time.monotonic()))
+                return
+        _quietly_close(ftp)
+
+    @contextmanager
+    def connection(self, host_or_url: str, user='', passwd='', acct='', timeout=None):
+        """ Context manager: acquire() a connection and release() it when done. """
+        ftp = self.acquire(host_or_url, user=user, passwd=passwd, acct=acct, timeout=timeout)
+        try:
+            yield ftp
+        finally:
+            self.release(ftp)
+
+    def close(self):
+        """ Close all idle connections. """
+        with self._lock:
+            idle, self._idle = self._idle, {}
+        for connections in idle.values():
+            for ftp, released in connections:
+                _quietly_close(ftp)
+
+
+def _glob_match(name: str, path: str, patterns: list) -> bool:
+    """ True if name (or, for patterns containing a '/', path) matches any of patterns """
+    return any(fnmatch.fnmatchcase(path if '/' in pattern else name, pattern)
+               for pattern in patterns)
+
+
+class _BlockMismatch(Exception):
+    """ Raised in a retrbinary callback to stop a transfer early. """
+
+
+def _quietly_close(ftp: FTP):
+    try:
+        ftp.quit()
+    except Exception:
+        ftp.close()
+
+
+# the pool shared by toolbox's ftp link checks
+ftp_pool = FTPPool()
+atexit.register(ftp_pool.close)
 
 
 # ##############################################################################
@@ -537,12 +1146,228 @@ def size(url: str, user='', passwd='', acct='') -> int:
 
 
 def download(url_or_path: str, user='', passwd='', acct='',
-             tgt_folder='', overwrite: bool = True) -> GetTuple:
+             tgt_folder='', overwrite: bool = True, resume: bool = True,
+             callback=None) -> GetTuple:
     # open ftp session
     global _global_ftp
     return _global_ftp.download(url_or_path=url_or_path,
                                 user=user, passwd=passwd, acct=acct,
-                                tgt_folder=tgt_folder, overwrite=overwrite)
+                                tgt_folder=tgt_folder, overwrite=overwrite,
+                                resume=resume, callback=callback)
+
+
+def download_many(urls: list, tgt_folder='', user='', passwd='', acct='',
+                  overwrite: bool = True, max_workers: int = 4, per_host_limit: int = 4,
+                  retries: int = 2, callback=None, pool: FTPPool = None) -> list:
+    """
+    Download many files in parallel over pooled connections.  A download that
+    fails part way (dropped connection, timeout, 4xx reply) is retried on a fresh
+    connection and resumes from the bytes already received.
+    :param urls: list of file urls
+    :param tgt_folder: folder to save the files in.  Default: the current directory.
+    :param overwrite: False: a file whose target already exists is not downloaded
+                      (its result is a FileExistsError)
+    :param max_workers: max number of files downloaded at once
+    :param per_host_limit: max number of connections to any one server.  0 = no limit.
+    :param retries: times to retry a download that fails part way
+    :param callback: optional, callback(DownloadProgress); called from the
+                     downloading threads.  See FTP.download.
+    :param pool: the FTPPool to take connections from.  Default: ftp_pool.
+    :return: list of GetTuple, in the same order as urls.  A file that could not
+             be downloaded has the exception raised by its last attempt in its
+             place instead.
+
+    Examples:
+    >>> results = download_many(['ftp://ftp.pjm.com/oasis/CBMID.pdf',
+    ...                          'ftp://ftp.pjm.com/oasis/ATCID.pdf'], tgt_folder='c:/temp')
+    >>> failed = [r for r in results if isinstance(r, Exception)]
+    """
+    pool = pool or ftp_pool
+    jobs = [dict(url=url, tgt_folder=tgt_folder, user=user, passwd=passwd, acct=acct,
+                 overwrite=overwrite, retries=retries, callback=callback, pool=pool)
+            for url in urls]
+    return run_bounded(_download_one, jobs, max_workers=max_workers,
+                       per_host_limit=per_host_limit)
+
+
+def _download_one(url, tgt_folder, user, passwd, acct, overwrite, retries, callback,
+                  pool: FTPPool) -> Union[GetTuple, Exception]:
+    attempt = 0
+    while True:
+        ftp = None
+        try:
+            ftp = pool.acquire(url, user=user, passwd=passwd, acct=acct)
+            result = ftp.download(url, tgt_folder=tgt_folder, overwrite=overwrite,
+                                  resume=True, callback=callback)
+        except (FileExistsError, FileNotFoundError, ftplib.error_perm) as e:
+            # retrying will not help
+            if ftp is not None:
+                pool.release(ftp)
+            return e
+        except (OSError, EOFError, ftplib.Error) as e:
+            # the connection may be mid-transfer, so do not reuse it
+            if ftp is not None:
+                ftp.close()
+            attempt += 1
+            if attempt > retries:
+                return e
+        else:
+            pool.release(ftp)
+            return result
+
+
+def _read_part_info(part_file: str) -> Union[dict, NoneType]:
+    """ The remote file info FTP.download recorded for part_file, or None. """
+    try:
+        with open(part_file + '.json', 'r') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+MIRROR_MANIFEST = '.ez_ftp_mirror.json'
+
+
+def mirror(remote_url: str, local_dir: str, user='', passwd='', acct='',
+           delete: bool = False, max_depth: int = None, include: list = None,
+           exclude: list = None, max_workers: int = 4, retries: int = 2,
+           callback=None, manifest_file: str = None) -> MirrorResult:
+    """
+    Mirror an ftp directory tree to local_dir, downloading only files that are
+    new or have changed since the last mirror.
+
+    The remote tree is listed with FTP.walk.  A remote file is unchanged if its
+    listed size and modified time match those recorded in the manifest when it
+    was last downloaded, and the local copy's size and mtime still match the
+    manifest too.  Files not in the manifest (e.g., on the first run) are
+    unchanged if the local file's size matches and its mtime equals the remote
+    modified time.  Downloaded files are given the remote modified time as their
+    mtime.  New and changed files are downloaded in parallel (see download_many).
+    :param remote_url: url of the remote directory, e.g., 'ftp://ftp.pjm.com/oasis'
+    :param local_dir: local directory to mirror into (created if missing)
+    :param user: username
+    :param passwd: password
+    :param acct: ftp account
+    :param delete: True: delete local files recorded in the manifest that are no
+                   longer on the server.  Files the mirror did not download are
+                   never deleted, nor are files outside this run's scope: files
+                   in remote directories that were not listed (could not be, or
+                   are excluded or below max_depth), or that include or exclude
+                   leave out.
+    :param max_depth: see FTP.walk
+    :param include: see FTP.walk
+    :param exclude: see FTP.walk
+    :param max_workers: max directories listed, and files downloaded, at once
+    :param retries: times to retry a download that fails part way
+    :param callback: optional, callback(DownloadProgress).  See FTP.download.
+    :param manifest_file: the JSON manifest.  Default: local_dir/.ez_ftp_mirror.json
+    :return: MirrorResult(downloaded, unchanged, deleted, failed)
+
+    Examples:
+    >>> result = mirror('ftp://ftp.pjm.com/oasis', 'c:/temp/oasis', include=['*.pdf'])
+    >>> len(result.downloaded), len(result.failed)
+    """
+    os.makedirs(local_dir, exist_ok=True)
+    manifest_file = manifest_file or os.path.join(local_dir, MIRROR_MANIFEST)
+    try:
+        with open(manifest_file, 'r') as f:
+            manifest = json.load(f)
+    except FileNotFoundError:
+        manifest = {}
+
+    ftp = ftp_pool.acquire(remote_url, user=user, passwd=passwd, acct=acct)
+    netloc_url = url_join(ftp.scheme or 'ftp', ftp.netloc)
+    top = ftp.abspath(url_split(remote_url).path)
+    # relative paths of the directories listed ('.' = top)
+    listed = set()
+    remote = {}
+    try:
+        for dirpath, dirs, files in ftp.walk(top, max_depth=max_depth, include=include,
+                                             exclude=exclude, max_workers=max_workers,
+                                             user=user, passwd=passwd, acct=acct):
+            listed.add(posixpath.relpath(dirpath, top))
+            for entry in files:
+                remote[posixpath.relpath(posixpath.join(dirpath, entry.name), top)] = entry
+    finally:
+        ftp_pool.release(ftp)
+
+    downloaded, unchanged, deleted, failed, jobs = [], [], [], [], []
+    # the relative path of each job's file, as listed (not as parsed back out of its url)
+    job_relpaths = []
+    for relpath, entry in sorted(remote.items()):
+        local_path = os.path.join(local_dir, *relpath.split('/'))
+        if _mirror_unchanged(local_path, entry, manifest.get(relpath)):
+            unchanged.append(local_path)
+            manifest[relpath] = _mirror_record(local_path, entry)
+        else:
+            jobs.append(dict(url=netloc_url + posixpath.join(top, relpath),
+                             tgt_folder=os.path.dirname(local_path), user=user,
+                             passwd=passwd, acct=acct, overwrite=True, retries=retries,
+                             callback=callback, pool=ftp_pool))
+            job_relpaths.append(relpath)
+
+    results = run_bounded(_download_one, jobs, max_workers=max_workers,
+                          per_host_limit=max_workers)
+    for relpath, job, result in zip(job_relpaths, jobs, results):
+        if isinstance(result, Exception):
+            failed.append((job['url'], result))
+            continue
+        entry = remote[relpath]
+        try:
+            if entry.modified:
+                mtime = entry.modified.timestamp()
+                os.utime(result.target_filename, (mtime, mtime))
+            manifest[relpath] = _mirror_record(result.target_filename, entry)
+        except OSError as e:
+            failed.append((job['url'], e))
+            continue
+        downloaded.append(result.target_filename)
+
+    def in_scope(relpath):
+        """ True if this run's walk would have returned relpath, were it on the server """
+        path, name = posixpath.join(top, relpath), posixpath.basename(relpath)
+        if (posixpath.dirname(relpath) or '.') not in listed:
+            return False
+        if exclude and _glob_match(name, path, exclude):
+            return False
+        return not include or _glob_match(name, path, include)
+
+    for relpath in sorted(set(manifest) - set(remote)):
+        if delete and in_scope(relpath):
+            local_path = os.path.join(local_dir, *relpath.split('/'))
+            try:
+                os.remove(local_path)
+            except FileNotFoundError:
+                pass
+            deleted.append(local_path)
+            del manifest[relpath]
+
+    tmp_file = f'{manifest_file}.{os.getpid()}.tmp'
+    with open(tmp_file, 'w') as f:
+        json.dump(manifest, f)
+    os.replace(tmp_file, manifest_file)
+    return MirrorResult(downloaded, unchanged, deleted, failed)
+
+
+def _mirror_record(local_path: str, entry: ListTuple) -> dict:
+    st = os.stat(local_path)
+    return {'size': entry.size,
+            'modified': entry.modified.isoformat() if entry.modified else None,
+            'local_size': st.st_size, 'local_mtime_ns': st.st_mtime_ns}
+
+
+def _mirror_unchanged(local_path: str, entry: ListTuple, record: dict) -> bool:
+    try:
+        st = os.stat(local_path)
+    except FileNotFoundError:
+        return False
+    modified = entry.modified.isoformat() if entry.modified else None
+    if record:
+        return (record['size'] == entry.size and record['modified'] == modified
+                and record['local_size'] == st.st_size
+                and record['local_mtime_ns'] == st.st_mtime_ns)
+    return st.st_size == entry.size and entry.modified is not None \
+        and int(st.st_mtime) == int(entry.modified.timestamp())
 
 
 def compare_to_local(local_path: str, ftp_path: str, user='', passwd='', acct='',
@@ -550,8 +1375,10 @@ def compare_to_local(local_path: str, ftp_path: str, user='', passwd='', acct=''
     """
     Compare a file on an ftp server with a local file.  If hash_check==False,
     then the ftp file does not need to be downloaded.  If hash_check==True, then
-    the ftp file is downloaded in order to perform a hash operation, so execution
-    may take MUCH longer.
+    the ftp file is streamed and compared with the local file block by block
+    (see FTP.same_as_local).  Nothing is written to disk, and the transfer stops
+    at the first block that differs, but a matching file is downloaded in full,
+    so execution may take MUCH longer.
     :param local_path:
     :param ftp_path:
     :param user:
@@ -573,12 +1400,7 @@ def compare_to_local(local_path: str, ftp_path: str, user='', passwd='', acct=''
     size_match = os.path.getsize(lcl_path) == ftp_stats.size
     modified_match = os.path.getmtime(lcl_path) == ftp_stats.modified
     if hash_check:
-        with tempfile.TemporaryDirectory() as fp:
-            tmp_folder = str(fp)
-            download(url_or_path=ftp_path, user=user, passwd=passwd, acct=acct,
-                     tgt_folder=tmp_folder)
-            tmp_path = os.path.join(tmp_folder, ftp_stats.basename)
-            h_match = hash_match(lcl_path, tmp_path)
+        h_match = _global_ftp.same_as_local(ftp_stats.path, lcl_path)
         match = h_match
     else:
         h_match = None
@@ -595,60 +1417,22 @@ def listdir(path: str, user='', passwd='', acct='',
     :param user: username
     :param passwd: password
     :param acct: ftp account
-    :param ftp_session: an active ftp connection that is logged in.
-    :param get_stats:
-    :return: namedtuple(is_dir, dirs, nondirs), where
-            is_dir = True if ftp_path is a dir (not a file or other)
-                     False if ftp_path is not a dir
-            dirs = list of directories in ftp_path
-            non_dirs = list of non-directory items in ftp_path
+    :param ftp_session: an active, logged in FTP connection (this module's FTP).
+    :param get_stats: True: return StatsTuples instead of ListTuples
+    :return: list of ListTuple(name, modified, size, is_dir), one per item in path
     """
-    if get_stats:
-        raise NotImplementedError
-
-    ListTuple = namedtuple('ListTuple', ['name', 'modified', 'size', 'is_dir'])
-    file_list, dirs, non_dirs = [], [], []
-    res = []
-
     # open and log into path
-    ftp = ftp_session
-    if not ftp_session:
-        ftp = new_session(ftp_url=path, user=user, passwd=passwd, acct=acct)
+    ftp = ftp_session or new_session(ftp_url=path, user=user, passwd=passwd, acct=acct)
+    return ftp.listdir(path, get_stats=get_stats)
 
-    parts = urlsplit(path)
 
-    ftp.retrlines(f'LIST {parts.path}', lambda s: file_list.append(s.split()))
-    for info in file_list:
-        if os.name == 'nt':
-            # info[1] = date
-            # info[2] = time
-            # info[-2] = type or size
-            # info[-1] = name
-            mod_time = info[0] + ' ' + info[1]
-            mod_time = dtdt.strptime(mod_time, '%m-%d-%y %I:%M%p')
-            if info[-2].upper() in ['<DIR>']:
-                # info[-2] = type
-                #           [name,     modified, size]
-                # ['name', 'modified','size', 'is_dir']
-                res.append(ListTuple(info[-1], mod_time, None, True))
-            elif info[-2].isnumeric:
-                # info[-2] = size
-                #               [name,     modified, size    ]
-                res.append(ListTuple(info[-1], mod_time, int(info[-2]), False))
-            else:
-                #               [name,     modified, size    ]
-                res.append(ListTuple(info[-1], mod_time, None, None))
-        else:
-            # Not tested on non-NT systems.
-            # info[0] = type
-            # info[-1] = name
-            ls_type, name = info[0], info[-1]
-            is_dir = False
-            if ls_type.startswith('d'):
-                is_dir = True
-            res.append(ListTuple(name, None, None, is_dir))
-
-    return res
+def walk(top: str, user='', passwd='', acct='', max_depth: int = None,
+         include: list = None, exclude: list = None, max_workers: int = 4, onerror=None):
+    """ See FTP.walk """
+    global _global_ftp
+    return _global_ftp.walk(top, max_depth=max_depth, include=include, exclude=exclude,
+                            max_workers=max_workers, onerror=onerror,
+                            user=user, passwd=passwd, acct=acct)
 
 
 def is_dir(path: str, user='', passwd='', acct='',
@@ -0,0 +1,212 @@
+#!/usr/bin/env python3
+"""
+Find duplicate files under one or more folders, reading as little as possible.
+
+Syntax if run as executable script:
+duplicates root [root ...] [--output_file duplicates.csv] [--min_size 1]
+    -o / --output_file: write the duplicates to this .csv or .parquet file
+    -m / --min_size (int): ignore files smaller than this many bytes. default: 1
+    -a / --algorithm: hash algorithm (see toolbox.file_util.hash.new_hash).
+                      default: sha256
+
+find_duplicates() narrows the candidates in three passes, so each byte is only
+read when its file could really be a duplicate:
+    1. group files by size, from the os.scandir stat data; a file with a unique
+       size has no duplicate and is never opened
+    2. hash the first HEAD_SIZE bytes of files whose size collides
+    3. hash the survivors in full with toolbox.file_util.hash.hash_many
+Each hashing pass reads the candidates of every size at once, one thread pool
+per pass.
+"""
+
+__author__ = "Chris Advena"
+__version__ = "0.1.0"
+__license__ = "MIT"
+
+import argparse
+import os
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+import pandas as pd
+from toolbox.file_util.hash import hash_index, hash_many, new_hash
+
+# bytes hashed from the start of each same-size file in the second pass
+HEAD_SIZE = 4096
+DUPLICATE_COLUMNS = ['group', 'size', 'hash', 'path']
+
+
+def scan_sizes(roots, min_size: int = 1, follow_symlinks: bool = False, onerror = None) -> dict:
+    """
+    Walk roots with os.scandir and group the files by size.  Hard links to a
+    file already seen (same device and inode) are skipped; they are the same
+    file, not duplicates.
+    :param roots: a folder or list of folders
+    :param min_size: ignore files smaller than this many bytes
+    :param follow_symlinks: follow symbolic links to files and folders
+    :param onerror: optional callback, onerror(OSError), for folders or files
+                    that cannot be read.  Default: skip them silently.
+    :return: {size: [path, ...]}
+    """
+    if isinstance(roots, (str, os.PathLike)):
+        roots = [roots]
+    sizes = defaultdict(list)
+    seen = set()
+    stack = [os.fspath(root) for root in roots]
+    while stack:
+        folder = stack.pop()
+        try:
+            with os.scandir(folder) as it:
+                for entry in it:
+                    try:
+                        if entry.is_dir(follow_symlinks = follow_symlinks):
+                            stack.append(entry.path)
+                            continue
+                        if not entry.is_file(follow_symlinks = follow_symlinks):
+                            continue
+                        st = entry.stat(follow_symlinks = follow_symlinks)
+                    except OSError as e:
+                        if onerror:
+                            onerror(e)
+                        continue
+                    if st.st_size < min_size:
+                        continue
+                    if st.st_ino:
+                        # st_ino is 0 where scandir does not report it (Windows)
+                        file_id = (st.st_dev, st.st_ino)
+                        if file_id in seen:
+                            continue
+                        seen.add(file_id)
+                    sizes[st.st_size].append(entry.path)
+        except OSError as e:
+            if onerror:
+                onerror(e)
+    return sizes
+
+
+def head_hash(file, algorithm: str = 'sha256', head_size: int = HEAD_SIZE) -> str:
+    """ Return the hexdigest of the first head_size bytes of file. """
+    h = new_hash(algorithm)
+    # buffered, so read() returns head_size bytes (or the whole file) even where
+    # the raw file returns short reads, e.g., on network shares
+    with open(file, 'rb') as f:
+        h.update(f.read(head_size))
+    return h.hexdigest()
+
+
+def _head_hashes(files, algorithm: str, head_size: int, workers: int) -> dict:
+    """ {file: head_hash or OSError} """
+    def _head(file):
+        try:
+            return head_hash(file, algorithm, head_size)
+        except OSError as e:
+            return e
+    with ThreadPoolExecutor(max_workers = workers) as pool:
+        return dict(zip(files, pool.map(_head, files)))
+
+
+def _by_size(hashes: dict, size_of: dict) -> dict:
+    """ {file: (size, hexdigest) or OSError} from {file: hexdigest or OSError} """
+    return {file: hexdigest if isinstance(hexdigest, Exception) else (size_of[file], hexdigest)
+            for file, hexdigest in hashes.items()}
+
+
+def _groups(keyed: dict, onerror) -> list:
+    """ Group the files of {file: key} by key; keep groups of 2 or more. """
+    groups = defaultdict(list)
+    for file, key in keyed.items():
+        if isinstance(key, Exception):
+            if onerror:
+                onerror(key)
+            continue
+        groups[key].append(file)
+    return [(key, files) for key, files in groups.items() if len(files) > 1]
+
+
+def find_duplicates(roots, output_file: str = None, min_size: int = 1,
+                    algorithm: str = 'sha256', workers: int = None,
+                    head_size: int = HEAD_SIZE, use_index: bool = False,
+                    follow_symlinks: bool = False, onerror = None) -> pd.DataFrame:
+    """
+    Find files with identical contents under roots.
+    :param roots: a folder or list of folders
+    :param output_file: optional .csv or .parquet file to which to write the result
+    :param min_size: ignore files smaller than this many bytes.  Default 1, i.e.,
+                     empty files are not reported.
+    :param algorithm: hash algorithm (see toolbox.file_util.hash.new_hash)
+    :param workers: max files read at once.  Default: os.cpu_count()
+    :param head_size: bytes hashed from the start of same-size files before any
+                      is hashed in full
+    :param use_index: look up (and record) full hashes in
+                      toolbox.file_util.hash.hash_index.  The index is saved
+                      once, at the end, rather than every save_every entries.
+    :param follow_symlinks: follow symbolic links to files and folders
+    :param onerror: optional callback, onerror(OSError), for folders or files
+                    that cannot be read.  Default: skip them silently.
+    :return: DataFrame with columns group, size, hash, path; one row per
+             duplicate file, largest files first.  Files with the same group
+             number have the same contents.
+    """
+    workers = workers or os.cpu_count() or 1
+    sizes = scan_sizes(roots, min_size, follow_symlinks, onerror)
+
+    size_of = {file: size for size, files in sizes.items() if len(files) > 1 for file in files}
+
+    groups = []  # (size, hexdigest, files)
+    to_hash = []
+    heads = _head_hashes(list(size_of), algorithm, head_size, workers)
+    for (size, head), same_head in _groups(_by_size(heads, size_of), onerror):
+        if size <= head_size:
+            # the head was the whole file
+            groups.append((size, head, same_head))
+        else:
+            to_hash.extend(same_head)
+
+    if use_index:
+        save_every, hash_index.save_every = hash_index.save_every, 0
+    try:
+        full = hash_many(to_hash, algorithm, workers = workers, use_index = use_index)
+    finally:
+        if use_index:
+            hash_index.save_every = save_every
+            hash_index.save()
+    for (size, hexdigest), same in _groups(_by_size(full, size_of), onerror):
+        groups.append((size, hexdigest, same))
+
+    rows = []
+    groups = [(size, hexdigest, sorted(files)) for size, hexdigest, files in groups]
+    for group, (size, hexdigest, files) in enumerate(sorted(groups, key = lambda g: (-g[0], g[2]))):
+        rows.extend([group, size, hexdigest, file] for file in files)
+    result = pd.DataFrame(rows, columns = DUPLICATE_COLUMNS)
+    if output_file:
+        if str(output_file).lower().endswith('.parquet'):
+            result.to_parquet(output_file, index = False)
+        else:
+            result.to_csv(output_file, index = False)
+    return result
+
+
+def main(args):
+    result = find_duplicates(args.roots, output_file = args.output_file,
+                             min_size = args.min_size, algorithm = args.algorithm)
+    wasted = (result.groupby('group')['size'].first() * (result.groupby('group').size() - 1)).sum()
+    print(f'{len(result)} duplicate files in {result["group"].nunique()} groups; '
+          f'{wasted:,} bytes could be freed.')
+
+
+if __name__ == '__main__':
+    """ This is executed when run from the command line """
+    parser = argparse.ArgumentParser(description = "Find duplicate files")
+    # Required arguements:
+    parser.add_argument("roots", nargs = "+", help = "Folders to search.")
+    # Optional arguments:
+    parser.add_argument("-o", "--output_file", action = "store", default = None)
+    parser.add_argument("-m", "--min_size", action = "store", type = int, default = 1)
+    parser.add_argument("-a", "--algorithm", action = "store", default = "sha256")
+    # Specify output of "--version"
+    parser.add_argument(
+        "--version",
+        action="version",
+        version="%(prog)s (version {version})".format(version=__version__))
+
+    args = parser.parse_args()
+    main(args)
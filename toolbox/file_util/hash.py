@@ -1,79 +1,455 @@
+import atexit
 import hashlib
+import json
+import os
+import threading
+import time
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+from warnings import warn
+from toolbox.appdirs import user_cache_dir
+try:
+    # optional: much faster non-cryptographic hashes ('xxh64', 'xxh3_64', 'xxh128')
+    import xxhash
+except ImportError:
+    xxhash = None
 
-def sha256_hash(file):
+IndexStats = namedtuple('IndexStats', ['hits', 'misses', 'entries'])
+
+# bytes read per readinto() when hashing.  Large reads keep the disk busy and,
+# since hashlib releases the GIL while hashing large buffers, let threads hash
+# several files at once.
+BUF_SIZE = 1024 * 1024
+
+
+# ##############################################################################
+# Persistent hash index
+# ##############################################################################
+
+class HashIndex:
+    """
+    Persistent index of file hashes, so files that have not changed are not
+    rehashed.  Entries are keyed by the file's real path and are only trusted
+    while the file's stat signature (size, mtime_ns, inode) is unchanged.  The
+    index is kept in memory and saved as a JSON sidecar file (by default under
+    appdirs.user_cache_dir('toolbox')) at exit, every save_every new entries,
+    or when save() is called.  When saved, the index is capped at max_entries
+    by dropping the least recently used entries.
+
+    Example:
+        >>> sha256_hash('known_good.pdf')   # miss: reads and hashes the file
+        >>> sha256_hash('known_good.pdf')   # hit: the file is not read
+        >>> hash_index.stats
+        IndexStats(hits=1, misses=1, entries=1)
+    """
+    # Files modified this recently are hashed but not indexed.  Within one
+    # timestamp tick, a second write of the same size would leave the stat
+    # signature unchanged.
+    racy_window_ns = 2 * 10 ** 9
+
+    def __init__(self, file: str = None, save_every: int = 100, max_entries: int = 100000):
+        """
+        :param file: the JSON file in which to persist the index.
+        :param save_every: save to file after this many new entries.  0 = only
+                           save on exit or when save() is called.
+        :param max_entries: max entries kept on save; the least recently used
+                            are dropped.  0 = no limit.
+        """
+        self.file = str(file or os.path.join(str(user_cache_dir('toolbox')), 'hash_index.json'))
+        self.save_every = save_every
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._entries = None
+        self._unsaved = 0
+        # keys removed since the last save, so save() does not restore them from disk
+        self._deleted = set()
+        self._lock = threading.RLock()
+
+    @staticmethod
+    def signature(path) -> tuple:
+        """ Returns (key, signature) for path, where signature = [size, mtime_ns, inode] """
+        st = os.stat(path)
+        return os.path.realpath(path), [st.st_size, st.st_mtime_ns, st.st_ino]
+
+    @property
+    def entries(self) -> dict:
+        """ {real path: {'sig': [size, mtime_ns, inode], 'used': time, algorithm: hexdigest, ...}} """
+        with self._lock:
+            if self._entries is None:
+                self._entries = self._read()
+            return self._entries
+
+    @property
+    def stats(self) -> IndexStats:
+        return IndexStats(self.hits, self.misses, len(self.entries))
+
+    def _read(self) -> dict:
+        try:
+            with open(self.file, 'r') as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return {}
+        except Exception as e:
+            warn(f'Unable to read hash index "{self.file}".  Starting a new index. {e}')
+            return {}
+
+    def get(self, path, algorithm: str):
+        """ Return the indexed hexdigest of path, or None if missing or out of date. """
+        key, sig = self.signature(path)
+        with self._lock:
+            entry = self.entries.get(key)
+            if entry and entry['sig'] == sig and algorithm in entry:
+                self.hits += 1
+                entry['used'] = int(time.time())
+                return entry[algorithm]
+            self.misses += 1
+        return None
+
+    def put(self, path, algorithm: str, hexdigest: str, sig: list = None):
+        """
+        Record the hexdigest of path.  If sig (the signature taken before path was
+        hashed) is given and the file has changed since, nothing is recorded.
+        """
+        key, new_sig = self.signature(path)
+        if sig is not None and sig != new_sig:
+            return
+        if time.time_ns() - new_sig[1] < self.racy_window_ns:
+            return
+        with self._lock:
+            entry = self.entries.get(key)
+            if not entry or entry['sig'] != new_sig:
+                entry = {'sig': new_sig}
+                self.entries[key] = entry
+            entry[algorithm] = hexdigest
+            entry['used'] = int(time.time())
+            self._deleted.discard(key)
+            self._unsaved += 1
+            if self.save_every and self._unsaved >= self.save_every:
+                self.save()
+
+    def hash(self, path, algorithm: str, hash_func) -> str:
+        """ Return the hexdigest of path from the index, or hash_func(path) on a miss. """
+        hexdigest = self.get(path, algorithm)
+        if hexdigest is None:
+            key, sig = self.signature(path)
+            hexdigest = hash_func(path)
+            self.put(path, algorithm, hexdigest, sig)
+        return hexdigest
+
+    def prune(self) -> int:
+        """ Drop entries for files that no longer exist.  Returns the number dropped. """
+        with self._lock:
+            missing = [key for key in self.entries if not os.path.exists(key)]
+            for key in missing:
+                del self.entries[key]
+            self._deleted.update(missing)
+            self._unsaved += len(missing)
+        return len(missing)
+
+    def clear(self):
+        """ Empty the index (in memory and on disk) and reset the hit/miss counters. """
+        with self._lock:
+            self._entries = {}
+            self.hits = self.misses = 0
+            self._unsaved = 0
+            self._deleted = set()
+            try:
+                os.remove(self.file)
+            except FileNotFoundError:
+                pass
+
+    def save(self):
+        """
+        Write the index to self.file.  Entries saved by other processes are kept,
+        except those removed here (e.g., by prune()) and, past max_entries, the
+        least recently used.
+        """
+        with self._lock:
+            if self._entries is None or not self._unsaved:
+                return
+            merged = self._read()
+            merged.update(self._entries)
+            for key in self._deleted:
+                merged.pop(key, None)
+            if self.max_entries and len(merged) > self.max_entries:
+                by_use = sorted(merged, key = lambda k: merged[k].get('used', 0))
+                for key in by_use[:len(merged) - self.max_entries]:
+                    del merged[key]
+            os.makedirs(os.path.dirname(self.file) or '.', exist_ok = True)
+            tmp_file = f'{self.file}.{os.getpid()}.tmp'
+            with open(tmp_file, 'w') as f:
+                json.dump(merged, f)
+            os.replace(tmp_file, self.file)
+            self._entries = merged
+            self._unsaved = 0
+            self._deleted = set()
+
+
+# the index used by sha256_hash, md5_hash and hash_match
+hash_index = HashIndex()
+
+
+@atexit.register
+def _save_hash_index():
+    try:
+        hash_index.save()
+    except Exception as e:
+        warn(f'Unable to save hash index "{hash_index.file}". {e}')
+
+
+# ##############################################################################
+# Hash functions
+# ##############################################################################
+
+def sha256_hash(file, use_index: bool = True):
     """
     Chris Advena
     source: https://www.geeksforgeeks.org/compare-two-files-using-hashing-in-python/
     :param file: path of file_util to hash
+    :param use_index: True: return the hash from hash_index if file is unchanged
+                      since it was last hashed, else hash file and index it.
     :return: sha256 hash of file_util
     """
-    # A arbitrary (but fixed) buffer
-    # size (change accordingly)
-    # 65536 = 65536 bytes = 64 kilobytes
-    BUF_SIZE = 65536
-
-    # Initializing the sha256() method
-    sha256 = hashlib.sha256()
+    if use_index:
+        return hash_index.hash(file, 'sha256', _sha256)
+    return _sha256(file)
 
-    # Opening the file_util provided as
-    # the first commandline arguement
-    with open(file, 'rb') as f:
 
-        while True:
+def _sha256(file):
+    return _hash_file(file, 'sha256')
 
-            # reading data = BUF_SIZE from
-            # the file_util and saving it in a
-            # variable
-            data = f.read(BUF_SIZE)
 
-            # True if eof = 1
-            if not data:
-                break
+def md5_hash(file_path, use_index: bool = True):
+    """
+    :param file_path:
+    :param use_index: True: return the hash from hash_index if file is unchanged
+                      since it was last hashed, else hash file and index it.
+    :return:
+    """
+    if use_index:
+        return hash_index.hash(file_path, 'md5', _md5)
+    return _md5(file_path)
 
-            # Passing that data to that sh256 hash
-            # function (updating the function with
-            # that data)
-            sha256.update(data)
 
-            # sha256.hexdigest() hashes all the input
-    # data passed to the sha256() via sha256.update()
-    # Acts as a finalize method, after which
-    # all the input data gets hashed hexdigest()
-    # hashes the data, and returns the output
-    # in hexadecimal format
-    return sha256.hexdigest()
+def _md5(file_path):
+    return _hash_file(file_path, 'md5')
 
 
-def md5_hash(file_path):
+def new_hash(algorithm: str = 'sha256'):
     """
-    :param file_path:
-    :return:
+    Return a new hash object for algorithm: any hashlib algorithm (e.g.,
+    'sha256', 'md5', 'blake2b') or, if the xxhash package is installed, 'xxh64',
+    'xxh3_64' or 'xxh128'.
     """
-    with open(file_path, 'rb') as file:
-        md5_obj = hashlib.md5()
+    algorithm = algorithm.lower()
+    if algorithm.startswith('xxh'):
+        if xxhash is None:
+            raise ImportError(f'Hash algorithm "{algorithm}" requires xxhash.  pip install xxhash')
+        return getattr(xxhash, algorithm)()
+    return hashlib.new(algorithm)
+
+
+_buffers = threading.local()
+
+
+def _hash_file(file, algorithm: str = 'sha256') -> str:
+    """ Hash file with readinto() a reusable (per thread) buffer of BUF_SIZE bytes. """
+    h = new_hash(algorithm)
+    buf = getattr(_buffers, 'buf', None)
+    if buf is None:
+        buf = _buffers.buf = bytearray(BUF_SIZE)
+    view = memoryview(buf)
+    with open(file, 'rb', buffering = 0) as f:
         while True:
-            buffer = file.read(8096)
-            if not buffer:
+            n = f.readinto(buf)
+            if not n:
                 break
-            md5_obj.update(buffer)
-        hash_code = md5_obj.hexdigest()
-    md5 = str(hash_code).lower()
-    return md5
+            h.update(view[:n])
+    return h.hexdigest().lower()
+
+
+def hash_file(file, algorithm: str = 'sha256', use_index: bool = True) -> str:
+    """
+    Return the hexdigest of file.
+    :param file: path of the file to hash
+    :param algorithm: see new_hash
+    :param use_index: True: return the hash from hash_index if file is unchanged
+                      since it was last hashed, else hash file and index it.
+    """
+    algorithm = algorithm.lower()
+    if use_index:
+        return hash_index.hash(file, algorithm, lambda f: _hash_file(f, algorithm))
+    return _hash_file(file, algorithm)
+
+
+def hash_many(files, algorithm: str = 'sha256', workers: int = None,
+              use_index: bool = True, processes: bool = False) -> dict:
+    """
+    Hash many files in parallel.
+    :param files: list-like of file paths
+    :param algorithm: see new_hash
+    :param workers: max files hashed at once.  Default: os.cpu_count()
+    :param use_index: True: files unchanged since they were last hashed are looked
+                      up in hash_index instead of read, and new hashes are indexed
+    :param processes: False: hash in a thread pool.  hashlib releases the GIL while
+                             it hashes, so threads use several cores; best for
+                             most files and algorithms.
+                      True:  hash in a process pool, for hash functions that hold
+                             the GIL (e.g., xxhash on small reads)
+    :return: {file: hexdigest}, in the order of files.  A file that could not be
+             read has the OSError raised in its place.
+    """
+    algorithm = algorithm.lower()
+    new_hash(algorithm)  # fail fast on an unknown or unavailable algorithm
+    files = list(files)
+    results = {}
+    todo = []
+    for file in files:
+        try:
+            hexdigest = hash_index.get(file, algorithm) if use_index else None
+        except OSError as e:
+            results[file] = e
+            continue
+        if hexdigest is None:
+            todo.append(file)
+        else:
+            results[file] = hexdigest
+
+    if todo:
+        sigs = {}
+        if use_index:
+            for file in todo:
+                try:
+                    sigs[file] = hash_index.signature(file)[1]
+                except OSError:
+                    pass
+        workers = max(1, min(workers or os.cpu_count() or 1, len(todo)))
+        pool_class = ProcessPoolExecutor if processes and workers > 1 else ThreadPoolExecutor
+        with pool_class(max_workers = workers) as pool:
+            futures = [(file, pool.submit(_hash_file, file, algorithm)) for file in todo]
+            for file, future in futures:
+                try:
+                    results[file] = future.result()
+                except OSError as e:
+                    results[file] = e
+                    continue
+                if use_index and file in sigs:
+                    try:
+                        hash_index.put(file, algorithm, results[file], sigs[file])
+                    except OSError:
+                        pass
+    return {file: results[file] for file in files}
+
+
+def hash_match(filename1, filename2, hash_method = 0, use_index: bool = True):
+    """
+    Hash both files, at the same time, and compare the hashes.
+    :param filename1:
+    :param filename2:
+    :param hash_method: 0 = sha256, 1 = md5, 2 = blake2b, or an algorithm name
+                        (see new_hash)
+    :param use_index: look up unchanged files in hash_index instead of rehashing them
+    :return: boolean - True is match, False if mismatch
+    """
+    # hash_methods maps the numeric hash_method codes to algorithm names
+    hash_methods = {0: 'sha256', 1: 'md5', 2: 'blake2b'}
+    algorithm = hash_methods.get(hash_method, hash_method)
+    hashes = hash_many([filename1, filename2], algorithm, workers = 2, use_index = use_index)
+    for hexdigest in hashes.values():
+        if isinstance(hexdigest, Exception):
+            raise hexdigest
+    return hashes[filename1] == hashes[filename2]
+
+
+COMPARE_MODES = ('size', 'quick', 'full')
+# bytes compared at each of the head, middle and tail of the files in 'quick' and 'full' modes
+SAMPLE_SIZE = 64 * 1024
 
 
-def hash_match(filename1, filename2, hash_method: int = 0):
+def _sample_offsets(size: int, sample_size: int) -> list:
+    """ Offsets of the head, middle and tail samples of a file of size bytes. """
+    if size <= sample_size:
+        return [0]
+    return sorted({0, (size - sample_size) // 2, size - sample_size})
+
+
+def _read_full(f, buf: bytearray) -> int:
     """
+    Fill buf from unbuffered file f, which may return short reads (e.g., on
+    network shares), until it is full or at EOF; return the bytes read.
+    """
+    view = memoryview(buf)
+    n = 0
+    while n < len(buf):
+        read = f.readinto(view[n:])
+        if not read:
+            break
+        n += read
+    return n
+
 
+def _same_blocks(f1, f2, buf1: bytearray, buf2: bytearray) -> bool:
+    """ Read f1 and f2 in lockstep from their current positions; False at the first difference. """
+    while True:
+        n1 = _read_full(f1, buf1)
+        n2 = _read_full(f2, buf2)
+        if n1 != n2:
+            return False
+        if not n1:
+            return True
+        # comparing whole bytearrays is a memcmp; only the last, short block is sliced
+        if n1 == len(buf1):
+            if buf1 != buf2:
+                return False
+        elif buf1[:n1] != buf2[:n2]:
+            return False
+
+
+def compare_files(filename1, filename2, mode: str = 'full',
+                  sample_size: int = SAMPLE_SIZE, blocksize: int = BUF_SIZE) -> bool:
+    """
+    Compare two files' contents, doing no more I/O than it takes to find a
+    difference.  Unlike hash_match, which reads both files completely, files of
+    different sizes are told apart by a stat and most other mismatches by
+    reading a few small samples.
     :param filename1:
     :param filename2:
-    :param hash_method:
+    :param mode: 'size':  True if the files are the same size
+                 'quick': True if the files are the same size and their head,
+                          middle and tail sample_size bytes match
+                 'full':  'quick', then both files are read in lockstep, block by
+                          block, stopping at the first block that differs
+    :param sample_size: bytes compared at each sample point
+    :param blocksize: bytes read from each file per block in 'full' mode
     :return: boolean - True is match, False if mismatch
     """
-    # hash_methods is a dictionary of file_util-hashing functions that are defined above
-    # in this module.
-    hash_methods = {0: sha256_hash, 1: md5_hash}
-    func = hash_methods[hash_method]
-    return func(filename1) == func(filename2)
+    if mode not in COMPARE_MODES:
+        raise ValueError(f'mode must be one of {COMPARE_MODES}, not "{mode}".')
+    st1, st2 = os.stat(filename1), os.stat(filename2)
+    if os.path.samestat(st1, st2):
+        return True
+    if st1.st_size != st2.st_size:
+        return False
+    if mode == 'size' or not st1.st_size:
+        return True
+
+    with open(filename1, 'rb', buffering = 0) as f1, open(filename2, 'rb', buffering = 0) as f2:
+        sample_size = min(sample_size, st1.st_size)
+        buf1, buf2 = bytearray(sample_size), bytearray(sample_size)
+        for offset in _sample_offsets(st1.st_size, sample_size):
+            f1.seek(offset)
+            f2.seek(offset)
+            if _read_full(f1, buf1) != _read_full(f2, buf2) or buf1 != buf2:
+                return False
+        if mode == 'quick':
+            return True
+        if st1.st_size <= sample_size:
+            # the one sample was the whole file
+            return True
+        f1.seek(0)
+        f2.seek(0)
+        return _same_blocks(f1, f2, bytearray(blocksize), bytearray(blocksize))
 
 
 def main():
@@ -0,0 +1,277 @@
+"""
+Shared, pooled HTTP sessions.
+
+Module level requests.get/head/post open a new TCP (and TLS) connection for
+every call.  A requests.Session keeps connections alive in per-host pools, so
+checking hundreds of URLs on the same host only pays the handshake once per
+pooled connection.
+
+    get_session():  the shared session used by toolbox.link_checker.WebPage (and
+                    anything else that does not bring its own session)
+    set_session():  replace the shared session, e.g., with one from new_session()
+    new_session():  build a session with its own pool size and retry settings
+
+Default pool and retry settings are read from tb_cfg['HTTP_SESSION'].  Every
+request sent through these sessions first waits its turn with
+toolbox.rate_limit.rate_limiter, and a 429/503 Retry-After holds back the host
+for all requests through them.
+
+HTTPCache (and the shared instance, http_cache) remembers each URL's ETag /
+Last-Modified validators with the sha256 and size of the body they describe,
+so a later request can be made conditional (If-None-Match / If-Modified-Since)
+and a 304 Not Modified response can stand in for downloading and hashing the
+body again.
+"""
+import atexit
+import json
+import os
+import threading
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from toolbox import tb_cfg
+from toolbox.appdirs import user_cache_dir
+from toolbox.rate_limit import RateLimiter, rate_limiter as default_rate_limiter
+from warnings import warn
+try:
+    from pjmlib import requests
+except ImportError as e:
+    import requests
+
+default_config = {
+    'HTTP_SESSION': {
+        # number of per-host connection pools to keep
+        "POOL_CONNECTIONS": 10,
+        # max number of keep-alive connections kept in each host's pool
+        "POOL_MAXSIZE": 10,
+        # retries for connection errors and 429/5xx responses to HEAD/GET
+        "MAX_RETRIES": 2,
+        "BACKOFF_FACTOR": 0.5,
+        }
+    }
+tb_cfg.update_if_none(dict_of_parameters = default_config, recurse = True)
+
+RETRY_STATUS_CODES = (429, 500, 502, 503, 504)
+RETRY_METHODS = frozenset(['HEAD', 'GET', 'OPTIONS'])
+
+_session = None
+_session_lock = threading.Lock()
+
+
+def _retry(max_retries: int, backoff_factor: float) -> Retry:
+    kwargs = dict(total = max_retries, backoff_factor = backoff_factor,
+                  status_forcelist = RETRY_STATUS_CODES, raise_on_status = False)
+    try:
+        return Retry(allowed_methods = RETRY_METHODS, **kwargs)
+    except TypeError:
+        # urllib3 < 1.26
+        return Retry(method_whitelist = RETRY_METHODS, **kwargs)
+
+
+class RateLimitedAdapter(HTTPAdapter):
+    """ HTTPAdapter that waits on a RateLimiter before sending each request. """
+    def __init__(self, *args, rate_limiter: RateLimiter = None, **kwargs):
+        self.rate_limiter = rate_limiter
+        super().__init__(*args, **kwargs)
+
+    def send(self, request, **kwargs):
+        limiter = self.rate_limiter or default_rate_limiter
+        limiter.wait(request.url)
+        response = super().send(request, **kwargs)
+        limiter.retry_after(request.url, response)
+        return response
+
+
+def new_session(pool_connections: int = None,
+                pool_maxsize: int = None,
+                max_retries: int = None,
+                backoff_factor: float = None,
+                rate_limiter: RateLimiter = None) -> requests.Session:
+    """
+    Create a requests.Session with keep-alive connection pools and retries
+    mounted for http:// and https://.  Arguments left as None are read from
+    tb_cfg['HTTP_SESSION'].
+    :param pool_connections: number of host pools to cache
+    :param pool_maxsize: max number of connections to keep open per host.  Set
+                         this to at least the number of threads that may hit
+                         the same host at once.
+    :param max_retries: number of retries on connection errors and on 429/5xx
+                        responses to idempotent requests.  0 = no retries.
+    :param backoff_factor: retry sleep = backoff_factor * 2 ** (retry number - 1).
+                           A Retry-After header from the server takes precedence.
+    :param rate_limiter: the toolbox.rate_limit.RateLimiter requests wait on.
+                         Default: toolbox.rate_limit.rate_limiter.
+    :return: requests.Session
+    """
+    cfg = tb_cfg['HTTP_SESSION']
+    pool_connections = pool_connections or cfg['POOL_CONNECTIONS']
+    pool_maxsize = pool_maxsize or cfg['POOL_MAXSIZE']
+    max_retries = cfg['MAX_RETRIES'] if max_retries is None else max_retries
+    backoff_factor = cfg['BACKOFF_FACTOR'] if backoff_factor is None else backoff_factor
+
+    session = requests.Session()
+    adapter = RateLimitedAdapter(pool_connections = pool_connections,
+                                 pool_maxsize = pool_maxsize,
+                                 max_retries = _retry(max_retries, backoff_factor),
+                                 rate_limiter = rate_limiter)
+    session.mount('http://', adapter)
+    session.mount('https://', adapter)
+    return session
+
+
+def get_session() -> requests.Session:
+    """ Return the shared session, creating it on first use. """
+    global _session
+    if _session is None:
+        with _session_lock:
+            if _session is None:
+                _session = new_session()
+    return _session
+
+
+def set_session(session: requests.Session = None) -> requests.Session:
+    """
+    Replace the shared session.  The old session's connections are closed.
+    :param session: the new shared session.  If None, a new session is built
+                    from tb_cfg['HTTP_SESSION'] the next time get_session() is called.
+    :return: the new shared session (or None)
+    """
+    global _session
+    with _session_lock:
+        old, _session = _session, session
+    if old is not None and old is not session:
+        try:
+            old.close()
+        except Exception as e:
+            warn(f'Unable to close old HTTP session. {e}')
+    return session
+
+
+# ##############################################################################
+# Conditional request (revalidation) cache
+# ##############################################################################
+
+class HTTPCache:
+    """
+    On-disk store of HTTP validators and body digests, keyed by URL:
+        {url: {'etag': ..., 'last_modified': ..., 'sha256': ..., 'size': ...}}
+    The store is kept in memory and saved as a JSON file (by default under
+    appdirs.user_cache_dir('toolbox')) at exit, every save_every new records,
+    or when save() is called.
+    """
+    def __init__(self, file: str = None, save_every: int = 100):
+        """
+        :param file: the JSON file in which to persist the cache.
+        :param save_every: save to file after this many new records.  0 = only
+                           save on exit or when save() is called.
+        """
+        self.file = str(file or os.path.join(str(user_cache_dir('toolbox')), 'http_cache.json'))
+        self.save_every = save_every
+        self._records = None
+        self._unsaved = 0
+        # urls forgotten since the last save, so save() does not restore them from disk
+        self._forgotten = set()
+        self._lock = threading.RLock()
+
+    @property
+    def records(self) -> dict:
+        with self._lock:
+            if self._records is None:
+                self._records = self._read()
+            return self._records
+
+    def _read(self) -> dict:
+        try:
+            with open(self.file, 'r') as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return {}
+        except Exception as e:
+            warn(f'Unable to read HTTP cache "{self.file}".  Starting a new cache. {e}')
+            return {}
+
+    def get(self, url: str) -> dict:
+        """ Return the record for url, or None. """
+        with self._lock:
+            return self.records.get(url)
+
+    def conditional_headers(self, url: str) -> dict:
+        """
+        Return If-None-Match / If-Modified-Since headers for url.  Empty if url
+        has no record, since a 304 is only useful if the body digest is known.
+        """
+        record = self.get(url)
+        headers = {}
+        if record and record.get('sha256'):
+            if record.get('etag'):
+                headers['If-None-Match'] = record['etag']
+            if record.get('last_modified'):
+                headers['If-Modified-Since'] = record['last_modified']
+        return headers
+
+    def store(self, url: str, response, sha256: str, size: int):
+        """
+        Record the validators from a 200 response to url along with the sha256 and
+        size of its body.  Responses without an ETag or Last-Modified header are
+        not cached (they cannot be revalidated).
+        """
+        etag = response.headers.get('ETag')
+        last_modified = response.headers.get('Last-Modified')
+        if response.status_code != 200 or not (etag or last_modified):
+            return
+        with self._lock:
+            self.records[url] = {'etag': etag, 'last_modified': last_modified,
+                                 'sha256': sha256, 'size': size}
+            self._forgotten.discard(url)
+            self._unsaved += 1
+            if self.save_every and self._unsaved >= self.save_every:
+                self.save()
+
+    def forget(self, url: str):
+        with self._lock:
+            if self.records.pop(url, None) is not None:
+                self._forgotten.add(url)
+                self._unsaved += 1
+
+    def clear(self):
+        """ Empty the cache (in memory and on disk). """
+        with self._lock:
+            self._records = {}
+            self._unsaved = 0
+            self._forgotten = set()
+            try:
+                os.remove(self.file)
+            except FileNotFoundError:
+                pass
+
+    def save(self):
+        """
+        Write the cache to self.file.  Records saved by other processes are kept,
+        except those forgotten here.
+        """
+        with self._lock:
+            if self._records is None or not self._unsaved:
+                return
+            merged = self._read()
+            merged.update(self._records)
+            for url in self._forgotten:
+                merged.pop(url, None)
+            os.makedirs(os.path.dirname(self.file) or '.', exist_ok = True)
+            tmp_file = f'{self.file}.{os.getpid()}.tmp'
+            with open(tmp_file, 'w') as f:
+                json.dump(merged, f)
+            os.replace(tmp_file, self.file)
+            self._records = merged
+            self._unsaved = 0
+            self._forgotten = set()
+
+
+# the cache used by toolbox.link_checker.WebPage unless it is given its own
+http_cache = HTTPCache()
+
+
+@atexit.register
+def _save_http_cache():
+    try:
+        http_cache.save()
+    except Exception as e:
+        warn(f'Unable to save HTTP cache "{http_cache.file}". {e}')
@@ -1,3 +1,4 @@
+import hashlib
 import os
 import warnings
 
@@ -12,11 +13,13 @@ from requests.models import Response as _Response
 from toolbox import tb_cfg, appdirs
 from toolbox.config import Config
 from toolbox.file_util import backup_file
-from toolbox.ez_ftp import FTP  # , StatsTuple
-from toolbox.file_util.hash import hash_match
+from toolbox.ez_ftp import FTP, ftp_pool  # , StatsTuple
+from toolbox.file_util.hash import hash_match, sha256_hash
+from toolbox.http_session import get_session, http_cache as default_http_cache
+from toolbox.rate_limit import host_key, rate_limiter, run_bounded
 from toolbox.pathlib import Path
 from toolbox.swiss_army import is_iterable
-toolbox import error_handler
+from toolbox.error_handler import ErrorHandler
 from pprint import pprint
 from warnings import warn
 from typing import Union
@@ -43,7 +46,11 @@ except:
 # from toolbox.swiss_army import is_valid_url
 
 WebPageExceptions = namedtuple('WebPageExceptions', ['head_exception', 'get_exception'])
-SaveResult = namedtuple('SaveResult', ['filename', 'exception', 'hash'])
+# hash: sha256 hexdigest of the downloaded body; size: number of bytes downloaded
+SaveResult = namedtuple('SaveResult', ['filename', 'exception', 'hash', 'size'],
+                        defaults = [None])
+# WebPage.save_page streams downloads in chunks of this many bytes
+DOWNLOAD_CHUNK_SIZE = 1024 * 1024
 
 # These are default folders used in the functions below.  However, it is better
 # practice to set pass your own preferred directories in the function calls.
@@ -60,6 +67,10 @@ default_config = {
         "DEFAULT_RESULTS_CSV":
             dir_home.joinpath("outputs").joinpath("links_to_check_results.csv").str,
         "EXCLUDE_LINKS_STARTING_WITH": [""],
+        # check_links_from_file concurrency: total worker threads and the max
+        # number of simultaneous requests to any one host (0 = no host limit).
+        "MAX_WORKERS": 8,
+        "PER_HOST_LIMIT": 4,
         }
     }
 tb_cfg.update_if_none(dict_of_parameters = default_config, recurse = True)
@@ -103,10 +114,24 @@ def clean_url(unclean_url):
 
 
 class WebPage:
-    error_handler = error_handler.ErrorHandler()
+    error_handler = ErrorHandler()
     ignore_errors = error_handler.ignore_errors
 
-    def __init__(self, url: str, cache: bool = True, working_dir = None):
+    def __init__(self, url: str, cache: bool = True, working_dir = None, session = None,
+                 http_cache = None):
+        """
+        :param url: the page's address.  http:// is assumed if no scheme is given.
+        :param cache: True: reuse responses already retrieved by head() and get()
+        :param working_dir: default folder for save_page()
+        :param session: a requests.Session to send requests through.  If None,
+                        the shared keep-alive session from
+                        toolbox.http_session.get_session() is used.  Sessions
+                        from toolbox.http_session are subject to the per-host
+                        toolbox.rate_limit.rate_limiter.
+        :param http_cache: toolbox.http_session.HTTPCache holding the validators
+                           used by get(revalidate=True).  If None, the shared
+                           toolbox.http_session.http_cache is used.
+        """
         self.url = clean_url(url)
         parts = urlparse(url)
         if not parts.scheme:
@@ -118,23 +143,43 @@ class WebPage:
         self._head_exception = None
         self._get_exception = None
         self._get = None
+        # _get_streamed: the cached GET response was requested with stream=True,
+        #                so its body has not been read into memory.
+        # _get_consumed: that streamed body has since been read (by save_page).
+        self._get_streamed = False
+        self._get_consumed = False
+        # not_modified: the cached GET response is a 304 to a conditional request
+        self.not_modified = False
         self._anchors = None
         self._absolute_urls = None
         self.internal_domain = 'pjm.com'
         self.working_dir = working_dir
+        self.session = session
+        self._http_cache = http_cache
+
+    @property
+    def http(self):
+        """ The requests.Session used by this WebPage. """
+        return self.session or get_session()
+
+    @property
+    def http_cache(self):
+        """ The toolbox.http_session.HTTPCache used by this WebPage. """
+        return self._http_cache or default_http_cache
 
     @error_handler.wrap(on_error_return=None)
-    def head(self, cache: bool = None):
+    def head(self, cache: bool = None, **kwargs):
         """
         Gets the response from HEAD.  If HEAD was already retrieved and cache=True,
         then use previously received response.
         :param cache: True: use cache; False: run HEAD even if already cached.
+        :param kwargs: passed to requests.Session.head (e.g., allow_redirects=True)
         :return: response to HEAD (requests.head)
         """
         cache = cache or self.cache
         if self._head is None or not cache:
             try:
-                self._head = requests.head(url = self.url)
+                self._head = self.http.head(url = self.url, **kwargs)
                 self._head_exception = None
             except Exception as e:
                 self._head = None
@@ -165,25 +210,50 @@ class WebPage:
             return False  # self._get_exception and self._head_exception
 
     @error_handler.wrap(on_error_return=None)
-    def get(self, cache: bool = None, execute_js: bool = False, **kwargs) -> Union[_Response, Exception]:
+    def get(self, cache: bool = None, execute_js: bool = False, revalidate: bool = False,
+            **kwargs) -> Union[_Response, Exception]:
         """
         Gets the response from GET.  If a response was already retrieved and cache=True,
         then use previously received response.
         :param cache: True: use cache; False: run GET even if response already cached.
+        :param revalidate: True: if self.http_cache holds validators for self.url, send
+                           a conditional GET (If-None-Match / If-Modified-Since).  If
+                           the server answers 304, self.not_modified is set and
+                           self.http_cache.get(self.url) describes the unchanged body.
+        :param kwargs: passed to requests.Session.get.  With stream=True, only the
+                       headers are read; the body is left on the connection for
+                       save_page() to stream.  A cached streamed response is only
+                       reused by later stream=True calls.
         :return: response to HEAD (requests.head)
         """
         cache = cache or self.cache
-        if self._get is None or not isinstance(self._get, _Response) or not cache:
+        stream = kwargs.get('stream', False)
+        body_unavailable = (self._get_streamed and (not stream or self._get_consumed)) \
+            or (self.not_modified and not revalidate)
+        if self._get is None or not isinstance(self._get, _Response) or not cache \
+                or body_unavailable:
+            if revalidate:
+                headers = dict(kwargs.pop('headers', None) or {})
+                headers.update(self.http_cache.conditional_headers(self.url))
+                kwargs['headers'] = headers
+            if self._get_streamed and isinstance(self._get, _Response):
+                # return the replaced streamed response's connection to the pool
+                self._get.close()
             try:
                 session = None
                 if execute_js:
                     try:
                         session = HTMLSession()
+                        rate_limiter.wait(self.url)
                         self._get = session.get(self.url)
+                        rate_limiter.retry_after(self.url, self._get)
                     except:
                         session = None
                 if session is None:
-                    self._get = requests.get(self.url, **kwargs)
+                    self._get = self.http.get(self.url, **kwargs)
+                self._get_streamed = bool(stream) and session is None
+                self._get_consumed = False
+                self.not_modified = revalidate and self._get.status_code == 304
                 self._get_exception = None
             except Exception as e:
                 self._get = e
@@ -334,53 +404,90 @@ class WebPage:
                     return True
         return False
 
+    def iter_content(self, chunk_size: int = DOWNLOAD_CHUNK_SIZE):
+        """
+        Yield the body of the page in chunks of bytes.  If the full body is already
+        cached, chunks are sliced from memory; otherwise the body is streamed from
+        the server and never held in memory as a whole.
+        :param chunk_size: max bytes per chunk
+        """
+        response = self.get(stream = True)
+        if not isinstance(response, _Response):
+            raise WebPageNotLoadedError(self.url)
+        try:
+            for chunk in response.iter_content(chunk_size = chunk_size):
+                yield chunk
+        finally:
+            if self._get_streamed:
+                self._get_consumed = True
+                response.close()
+
     @error_handler.wrap(on_error_return=[])
-    def save_page(self, save_as: str = None, mode: str = 'wb') -> SaveResult:
+    def save_page(self, save_as: str = None, mode: str = 'wb', hash_only: bool = False,
+                  chunk_size: int = DOWNLOAD_CHUNK_SIZE) -> SaveResult:
         """
-        Save a requests response to disk.
+        Save a requests response to disk.  The body is streamed to disk in chunks
+        and hashed as it is written, so it is never held in memory as a whole and
+        never has to be read back from disk to be hashed.
         :param save_as: download to this location.
                         You may provide a directory and/or filename.
         :param mode: 'wb' or 'w'
-        :return: tuple
-            if success: (0, filename)
-            if fail: (error_code, reason)
+        :param hash_only: True: hash the body without writing it to disk.  The
+                          returned filename is None.
+        :param chunk_size: bytes read from the server per chunk
+        :return: SaveResult(filename, exception, hash, size), where hash is the
+                 sha256 hexdigest of the body and size is its length in bytes.
         """
         excep = None
-        response = self.get()
+        response = self.get(stream = True)
         if isinstance(response, Exception):
             excep = response
 
         if not self.ok():
             try:
-                raise WebPageNotLoadedError
-            except SaveResult as e:
+                raise WebPageNotLoadedError(self.url)
+            except WebPageNotLoadedError as e:
                 excep = e
                 # raise e
-        else:
-            if not save_as:
-                save_as = os.path.split(self.url)[-1]
-                if 'Content-Disposition' in response.headers.keys() and \
-                        'filename' in response.headers['Content-Disposition']:
-                    save_as = response.headers['Content-Disposition']
-                    save_as = save_as[save_as.find('"') + 1:
-                                      save_as.rfind('"')]
-                if self.working_dir:
-                    save_as = Path(self.working_dir).joinpath(save_as)
-                save_as = Path(save_as)
-            try:
-                if not save_as.parent.exists():
-                    save_as.parent.mkdir(parents = True)
-                if not mode.endswith('b') and isinstance(response.content, bytes):
-                    warn(f'"{self.url}" content is bytes.  Saving {save_as} '
-                         f'with mode = "wb" instead of "{mode}".')
-                    mode = 'wb'
-                with open(save_as, mode = mode) as writer:
-                    writer.write(response.content)
-            except Exception as e:
-                excep = e
-                raise e
-            # SaveResult = namedtuple('SaveResult', ['filename', 'exception', 'hash'])
-            return SaveResult(save_as, excep, None)
+            return SaveResult(None, excep, None, None)
+
+        sha256 = hashlib.sha256()
+        size = 0
+        if hash_only:
+            for chunk in self.iter_content(chunk_size = chunk_size):
+                sha256.update(chunk)
+                size += len(chunk)
+            self.http_cache.store(self.url, response, sha256.hexdigest(), size)
+            return SaveResult(None, excep, sha256.hexdigest(), size)
+
+        if not save_as:
+            save_as = os.path.split(self.url)[-1]
+            if 'Content-Disposition' in response.headers.keys() and \
+                    'filename' in response.headers['Content-Disposition']:
+                save_as = response.headers['Content-Disposition']
+                save_as = save_as[save_as.find('"') + 1:
+                                  save_as.rfind('"')]
+            if self.working_dir:
+                save_as = Path(self.working_dir).joinpath(save_as)
+        save_as = Path(save_as)
+        try:
+            if not save_as.parent.exists():
+                save_as.parent.mkdir(parents = True)
+            if not mode.endswith('b'):
+                # iter_content always yields bytes
+                warn(f'"{self.url}" content is bytes.  Saving {save_as} '
+                     f'with mode = "wb" instead of "{mode}".')
+                mode = 'wb'
+            with open(save_as, mode = mode) as writer:
+                for chunk in self.iter_content(chunk_size = chunk_size):
+                    sha256.update(chunk)
+                    size += len(chunk)
+                    writer.write(chunk)
+        except Exception as e:
+            excep = e
+            raise e
+        self.http_cache.store(self.url, response, sha256.hexdigest(), size)
+        return SaveResult(save_as, excep, sha256.hexdigest(), size)
 
     def find(self, string: str, insensitive: bool = False) -> list:
         """
@@ -486,13 +593,13 @@ class WebPage:
         url = urljoin(self.url, form_details["action"])
 
         if form_details["method"] == "post":
-            response = requests.post(url=url, data=data)
+            response = self.http.post(url=url, data=data)
         elif form_details["method"] == "put":
-            response = requests.put(url, data=data)
+            response = self.http.put(url, data=data)
         elif form_details["method"] == "delete":
-            response = requests.delete(url, params=data)
+            response = self.http.delete(url, params=data)
         elif form_details["method"] == "get":
-            response = requests.get(url, params=data)
+            response = self.http.get(url, params=data)
         else:
             raise NotImplementedError(f"method {form_details['method']} not implemented")
 
@@ -506,6 +613,9 @@ class WebPage:
 # Deep Link Check
 # ##############################################################################
 
+# error handler for the module-level functions below
+error_handler = ErrorHandler()
+
 links_to_check_csv_columns: list = ['description', 'url', 'orig_file', 'check_child_url', 'comment']
 # links_to_check_csv_columns = ['description', 'url', 'orig_file', 'check_child_url',
 #                               'permitted_age_days', "permitted_", 'comment']
@@ -539,7 +649,10 @@ def deep_link_check(url, local_file_path = None,
                     check_child_url: str = '',
                     description = '',
                     posted_after: Union[dtdt, None] = None,
-                    working_dir = Path()):
+                    working_dir = Path(),
+                    session = None,
+                    keep_download: bool = True,
+                    revalidate: bool = True):
     parts = urlparse(url)
     if parts.scheme in ['http', 'https']:
         res = deep_link_check_http(url = url, local_file_path = local_file_path,
@@ -547,7 +660,10 @@ def deep_link_check(url, local_file_path = None,
                                    check_child_url = check_child_url,
                                    description = description,
                                    posted_after = posted_after,
-                                   working_dir = working_dir)
+                                   working_dir = working_dir,
+                                   session = session,
+                                   keep_download = keep_download,
+                                   revalidate = revalidate)
     elif parts.scheme in ['ftp', 'ftps']:
         res = deep_link_check_ftp(url = url, local_file_path = local_file_path,
                                   hash_check = hash_check,
@@ -556,7 +672,7 @@ def deep_link_check(url, local_file_path = None,
                                   posted_after = posted_after,
                                   working_dir = working_dir)
     else:
-        res = result_template
+        res = result_template.copy()
         res['success'] = False
         res['reason'] = f'Error: URL Scheme not supported. "{url}" is of scheme {parts.scheme} is ' \
                         f'not supported.'
@@ -569,7 +685,25 @@ def deep_link_check_http(url, local_file_path = '',
                          check_child_url: str = '',
                          description = '',
                          posted_after: Union[dtdt, None] = None,  # ignored
-                         working_dir = Path()):
+                         working_dir = Path(),
+                         session = None,
+                         keep_download: bool = True,
+                         revalidate: bool = True):
+    """
+    Check an http(s) link.  If local_file_path is given, the posted file is
+    compared to it by size and, if hash_check, by sha256 hash.  The posted file
+    is streamed and hashed as it downloads; with keep_download=False it is
+    hashed without ever being written to disk.
+
+    With revalidate=True (and no check_child_url), the GET is conditional on the
+    validators toolbox.http_session.http_cache saved the last time the file was
+    hashed.  A 304 Not Modified means the posted file is unchanged, so its
+    cached size and hash are used and nothing is downloaded.
+
+    Checks run HEAD first.  A GET is only sent when the body is needed (hash_check
+    or check_child_url), when the server gives no usable content-length, or when
+    HEAD fails (some servers refuse it).  A size mismatch fails without a GET.
+    """
     # Initialize from arguments
     url = url.strip()
     local_file_path = local_file_path.strip()
@@ -584,13 +718,26 @@ def deep_link_check_http(url, local_file_path = '',
     res['url'] = url
     res['child url'] = check_child_url
     res['orig file path'] = local_file_path
+    downloaded_file = None
 
-    # Create WebPage object.
+    # Create WebPage object.  Only the headers are read here; a file body is
+    # streamed later, only if it is needed.
     try:
-        page: WebPage = WebPage(url, cache = True, working_dir = working_dir)
-        res['request status'] = page.get().status_code
-        res['reason'] = page.get().reason
-        res['success'] = page.get().ok
+        page: WebPage = WebPage(url, cache = True, working_dir = working_dir,
+                                session = session)
+        # check_child_url needs the page body, which a 304 would not include
+        revalidate = revalidate and bool(local_file_path) and not check_child_url
+        if check_child_url:
+            # the body is parsed for check_child_url, so read it now, with one GET
+            response = page.get()
+        else:
+            response = page.head(allow_redirects = True)
+            if response is None or not response.ok:
+                # some servers refuse (405) or mishandle HEAD, so ask again with GET
+                response = page.get(stream = True, revalidate = revalidate)
+        res['request status'] = response.status_code
+        res['reason'] = response.reason
+        res['success'] = response.ok
     except Exception as e:
         res['success'] = False
         res['reason'] = f'Error: Webpage failed unexpectedly. ("{url}") {e}'
@@ -611,18 +758,26 @@ def deep_link_check_http(url, local_file_path = '',
             res['reason'] = f'Error: File Open Err or.  Cannot open local_file_path "{url}".  {e}'
             raise e
             return res
-        try:
-            remote_file_size = page.get().headers._store['content-length'][-1]
-        except KeyError as e:
-            downloaded_file = page.save_page()
-            if not downloaded_file.exception:
-                try:
-                    remote_file_size = Path(downloaded_file.filename).getsize()
-                except Exception as e:
+        res['orig file size'] = local_file_size
+        record = page.http_cache.get(page.url) if page.not_modified else None
+        if record:
+            # 304 Not Modified: the posted file is the one hashed last time
+            downloaded_file = SaveResult(None, None, record['sha256'], record['size'])
+            remote_file_size = record['size']
+            res['reason'] += ' (not modified since last check)'
+        else:
+            try:
+                remote_file_size = int(response.headers['content-length'])
+            except (KeyError, ValueError) as e:
+                # no usable content-length header, so download (and hash) the file to size it
+                downloaded_file = page.save_page(hash_only = not keep_download)
+                if downloaded_file.exception:
                     res['success'] = False
-                    res['reason'] = f'Error: Get File size failed.  "{url}"  {e}'
-                    raise e
+                    res['reason'] = f'Error: Get File size failed.  "{url}"  ' \
+                                    f'{downloaded_file.exception}'
                     return res
+                remote_file_size = downloaded_file.size
+        res['size on server'] = remote_file_size
 
         if local_file_size != remote_file_size:
             res['success'] = False
@@ -632,21 +787,30 @@ def deep_link_check_http(url, local_file_path = '',
             return res
 
         if hash_check:
+            if not downloaded_file and revalidate:
+                # sizes match; a conditional GET may still spare the download
+                page.get(stream = True, revalidate = True)
+                record = page.http_cache.get(page.url) if page.not_modified else None
+                if record:
+                    downloaded_file = SaveResult(None, None, record['sha256'], record['size'])
+                    res['reason'] += ' (not modified since last check)'
             # download file
             if not downloaded_file:
-                downloaded_file = page.save_page()
+                downloaded_file = page.save_page(hash_only = not keep_download)
             if downloaded_file.exception:
                 res['success'] = False
                 res['reason'] = f'Error: Download Error. "{downloaded_file.filename}" from ' \
                                 f'"{url}".  {downloaded_file.exception}'
                 return res
 
-            # hash check
+            res['downloaded file size'] = downloaded_file.size
+
+            # hash check: save_page hashed the posted file as it downloaded
             try:
-                match = hash_match(downloaded_file.filename, local_file_path)
+                match = downloaded_file.hash == sha256_hash(local_file_path)
             except Exception as e:
                 res['success'] = False
-                res['reason'] = f'Error: Hash Error.  Unexpected failure of hash_match function' \
+                res['reason'] = f'Error: Hash Error.  Unexpected failure of sha256_hash function' \
                                 + f' of "{downloaded_file}" and ' \
                                 + f'"{local_file_path}" modified ' + str(e)
                 raise e
@@ -706,7 +870,6 @@ def deep_link_check_ftp(url, local_file_path = '',
     local_file_path = local_file_path.strip()
     check_child_url = check_child_url.strip()
     description = description.strip()
-    downloaded_file = None
 
     # Initialize result dict
     res = result_template.copy()
@@ -716,14 +879,24 @@ def deep_link_check_ftp(url, local_file_path = '',
     res['orig file path'] = local_file_path
 
     try:
-        ftp = FTP(url)
+        ftp = ftp_pool.acquire(url)
     except Exception as e:
         res['success'] = False
         res['reason'] = f'Error:  FTP Session Error.  Cannot create FTP session: FTP("{url}").'\
                         + str(e)
         raise e
         return res
+    try:
+        return _deep_link_check_ftp(ftp, res, url, local_file_path, hash_check,
+                                    check_child_url, posted_after, working_dir)
+    finally:
+        ftp_pool.release(ftp)
 
+
+def _deep_link_check_ftp(ftp: FTP, res: dict, url, local_file_path, hash_check,
+                         check_child_url, posted_after, working_dir) -> dict:
+    """ The checks of deep_link_check_ftp, made over ftp, a connection from ftp_pool. """
+    downloaded_file = None
     if posted_after:
         try:
             remote_file_date = ftp.modified(host_or_url = url)
@@ -827,7 +1000,10 @@ def deep_link_check_ftp(url, local_file_path = '',
 def check_links_from_file(links_to_check_csv_or_df,
                           output_file: str = tb_cfg['LINK_CHECKER']['DEFAULT_LINKS_CSV'],
                           verbose: bool = True,
-                          hash_check = True) -> pd.DataFrame:
+                          hash_check = True,
+                          max_workers: int = tb_cfg['LINK_CHECKER']['MAX_WORKERS'],
+                          per_host_limit: int = tb_cfg['LINK_CHECKER']['PER_HOST_LIMIT'],
+                          session = None) -> pd.DataFrame:
     """
     Read in links from csv input_file.  For each link, run deep_link_check() and save
     results to csv output_file.
@@ -848,6 +1024,12 @@ def check_links_from_file(links_to_check_csv_or_df,
     :param verbose: If True, print the results of each link check as completed.
     :param hash_check: if True and input_file contains an orig_file, then hash check will
                        be performed between input_file.orig file and input_file.orig file
+    :param max_workers: number of links to check concurrently.  1 checks links one at a
+                        time.  Results are always returned in the input row order.
+    :param per_host_limit: max number of concurrent checks against any one host.
+                           0 = no per-host limit.
+    :param session: requests.Session shared by every http(s) check.  If None, the
+                    shared session from toolbox.http_session.get_session() is used.
     :return: pd.DataFrame containing one row containing results for each link checked
     Creates output_file (defined below) with results.
     Output file columns: are as per result_template dict defined above.
@@ -897,29 +1079,34 @@ def check_links_from_file(links_to_check_csv_or_df,
         input_df[col] = input_df[col].astype(str).replace('nan', '')
         # input_df[col] = input_df[col].replace(None, '')
 
-    res = []
-    row_cnt = input_df.shape[0]
-    fail_cnt = 0
-    for index, row in input_df.iterrows():
-        # collect input information from the input file.
-        d = deep_link_check(url = row['url'],
-                            local_file_path = row['orig_file'],
-                            hash_check = hash_check,
-                            check_child_url = row['check_child_url'],
-                            description = row['description'])
-        res.append(d)
-        if not d['success']:
-            fail_cnt += 1
-
+    # collect input information from the input file.
+    jobs = [{'url': row.url,
+             'local_file_path': row.orig_file,
+             'hash_check': hash_check,
+             'check_child_url': row.check_child_url,
+             'description': row.description,
+             'session': session}
+            for row in input_df.itertuples(index = False)]
+    row_cnt = len(jobs)
+    finished_cnt = 0
+
+    def report(position, d):
+        nonlocal finished_cnt
+        finished_cnt += 1
         if verbose:
-            prt_msg = f"\nFinished {index + 1} of {row_cnt}, {row['description']}: "
+            prt_msg = f"\nFinished {finished_cnt} of {row_cnt} (row {position + 1}), " \
+                      f"{jobs[position]['description']}: "
             print(prt_msg, d['url'])
 
-            if not d['success']:
+            if d['success']:
                 print(f"    - Passed")
             else:
                 print(f"    - Failed: {d['reason']}, {d['child url reason']}")
 
+    res = run_bounded(deep_link_check, jobs, max_workers = max_workers,
+                      per_host_limit = per_host_limit, on_done = report)
+    fail_cnt = sum(1 for d in res if not d['success'])
+
     # convert results to dataframe
     res = pd.DataFrame(res)
     # Rearrange columns: See result_template dict defined above.  All functions must use these
@@ -35,6 +35,164 @@ TYPE_DICT = {
 default_find_implied = True
 default_make_assumptions = True
 
+
+# ##############################################################################
+# Lightweight directory scanning
+# ##############################################################################
+
+class ScanEntry:
+    """
+    A file or folder found by Path.scan().  Wraps the os.DirEntry from
+    os.scandir, so name, type and (on Windows) stat data come from the directory
+    listing itself and cost no extra system calls; elsewhere, stat() is called
+    at most once per entry.  A Path is only built when to_path() is called.
+    """
+    __slots__ = ('_entry', 'depth')
+
+    def __init__(self, entry: os.DirEntry, depth: int = 0):
+        """
+        :param entry: the os.DirEntry
+        :param depth: folder levels below the scanned folder (0 = immediate child)
+        """
+        self._entry = entry
+        self.depth = depth
+
+    @property
+    def path(self) -> str:
+        return self._entry.path
+
+    @property
+    def name(self) -> str:
+        return self._entry.name
+
+    @property
+    def suffix(self) -> str:
+        return os.path.splitext(self._entry.name)[1]
+
+    def is_dir(self, follow_symlinks: bool = True) -> bool:
+        return self._entry.is_dir(follow_symlinks = follow_symlinks)
+
+    def is_file(self, follow_symlinks: bool = True) -> bool:
+        return self._entry.is_file(follow_symlinks = follow_symlinks)
+
+    def is_symlink(self) -> bool:
+        return self._entry.is_symlink()
+
+    def stat(self, follow_symlinks: bool = True) -> os.stat_result:
+        """ The entry's os.stat_result, cached by os.DirEntry after the first call. """
+        return self._entry.stat(follow_symlinks = follow_symlinks)
+
+    @property
+    def size(self) -> int:
+        return self.stat().st_size
+
+    @property
+    def mtime(self) -> float:
+        return self.stat().st_mtime
+
+    @property
+    def modify_time(self) -> datetime.datetime:
+        return datetime.datetime.fromtimestamp(self.mtime)
+
+    def to_path(self) -> 'Path':
+        return Path(self._entry.path)
+
+    def __fspath__(self) -> str:
+        return self._entry.path
+
+    def __str__(self) -> str:
+        return self._entry.path
+
+    def __repr__(self) -> str:
+        return f'{self.__class__.__name__}({self._entry.path!r})'
+
+
+def _timestamp(value) -> float:
+    """ A datetime or a POSIX timestamp as a POSIX timestamp. """
+    if isinstance(value, datetime.datetime):
+        return value.timestamp()
+    return float(value)
+
+
+def scan(folder, files: bool = True, dirs: bool = False, recursive: bool = True,
+         extensions = None, min_size: int = None, max_size: int = None,
+         modified_after = None, modified_before = None, max_depth: int = None,
+         follow_symlinks: bool = False, onerror = None) -> Iterator[ScanEntry]:
+    """
+    Walk folder with os.scandir, yielding a ScanEntry for each file and/or folder
+    that passes the filters.  Filters are applied to the os.DirEntry before
+    anything else is built: extensions only look at the name, and the size and
+    modified filters only stat files whose name passed.  Subfolders are scanned
+    whether or not they are yielded.
+    :param folder: the folder to scan
+    :param files: yield files
+    :param dirs: yield folders
+    :param recursive: scan subfolders
+    :param extensions: only yield files with these extensions (e.g., '.csv' or
+                       ['csv', '.txt']); case insensitive.  None = any.
+    :param min_size: only yield files of at least this many bytes
+    :param max_size: only yield files of at most this many bytes
+    :param modified_after: only yield entries modified at or after this
+                           datetime or POSIX timestamp
+    :param modified_before: only yield entries modified before this datetime
+                            or POSIX timestamp
+    :param max_depth: scan at most this many levels of subfolders.  0 = folder only.
+    :param follow_symlinks: follow symbolic links to files and folders
+    :param onerror: optional callback, onerror(OSError), for folders or entries
+                    that cannot be read (as in os.walk).  Default: skip them.
+    """
+    if extensions is not None:
+        if isinstance(extensions, str):
+            extensions = [extensions]
+        extensions = tuple('.' + e.lower().lstrip('.') for e in extensions)
+    after = None if modified_after is None else _timestamp(modified_after)
+    before = None if modified_before is None else _timestamp(modified_before)
+    if not recursive:
+        max_depth = 0
+
+    stack = [(os.fspath(folder), 0)]
+    while stack:
+        top, depth = stack.pop()
+        try:
+            it = os.scandir(top)
+        except OSError as e:
+            if onerror:
+                onerror(e)
+            continue
+        subdirs = []
+        with it:
+            for entry in it:
+                try:
+                    is_dir = entry.is_dir(follow_symlinks = follow_symlinks)
+                    if is_dir:
+                        if max_depth is None or depth < max_depth:
+                            subdirs.append(entry.path)
+                        if not dirs:
+                            continue
+                    elif not files or not entry.is_file(follow_symlinks = follow_symlinks):
+                        continue
+                    elif extensions is not None and not entry.name.lower().endswith(extensions):
+                        continue
+                    if after is not None or before is not None or \
+                            (not is_dir and (min_size is not None or max_size is not None)):
+                        st = entry.stat(follow_symlinks = follow_symlinks)
+                        if after is not None and st.st_mtime < after:
+                            continue
+                        if before is not None and st.st_mtime >= before:
+                            continue
+                        if not is_dir:
+                            if min_size is not None and st.st_size < min_size:
+                                continue
+                            if max_size is not None and st.st_size > max_size:
+                                continue
+                except OSError as e:
+                    if onerror:
+                        onerror(e)
+                    continue
+                yield ScanEntry(entry, depth)
+        # scan subfolders in listing order
+        stack.extend((d, depth + 1) for d in reversed(subdirs))
+
 # ##############################################################################
 # pathlib.Path wrapper
 # ##############################################################################
@@ -445,6 +603,25 @@ class Path(pathlib.Path):
         for p in self.rglob(pattern = pattern):
             yield Path(p)
 
+    def scan(self, **kwargs) -> Iterator[ScanEntry]:
+        """
+        Walk this folder with os.scandir, yielding a lightweight ScanEntry (with
+        cached stat data) for each file that passes the filters, instead of a
+        Path.  Call entry.to_path() for a Path.  Much cheaper than walk(),
+        walk_files() and walk_dirs() on large trees.
+        See toolbox.pathlib.scan for the filter arguments, e.g.,
+            >>> big_csvs = Path('data').scan(extensions = '.csv', min_size = 2**20)
+        """
+        return scan(self, **kwargs)
+
+    def scan_files(self, **kwargs) -> Iterator[ScanEntry]:
+        """ scan() yielding files only """
+        return scan(self, files = True, dirs = False, **kwargs)
+
+    def scan_dirs(self, **kwargs) -> Iterator[ScanEntry]:
+        """ scan() yielding folders only """
+        return scan(self, files = False, dirs = True, **kwargs)
+
     def walk_files(self) -> Iterator['Path']:
         for root, dirs, files in os.walk(self.str):
             for fn in files:
@@ -0,0 +1,274 @@
+"""
+Per-host rate limiting and a host-interleaving scheduler for link checks.
+
+    rate_limiter:   the shared RateLimiter.  One token bucket per host
+                    (urlparse(url).netloc), shared by every toolbox.http_session
+                    session, toolbox.link_checker.WebPage,
+                    toolbox.web_crawler.link_check and toolbox.ez_ftp.FTP.
+    RateLimiter:    wait(url) before a request; retry_after(url, response) after
+                    one, so a 429/503 Retry-After holds back every request to
+                    that host, not just the one that was refused.
+    run_bounded():  run many checks in a thread pool, interleaving hosts and
+                    skipping hosts that are rate limited, so one slow or
+                    throttled host never ties up the whole batch.
+
+Default limits are read from tb_cfg['LINK_CHECKER'].
+"""
+import threading
+import time
+from collections import OrderedDict, defaultdict, deque
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from datetime import datetime as dtdt, timezone
+from email.utils import parsedate_to_datetime
+from urllib.parse import urlparse
+from toolbox import tb_cfg
+
+default_config = {
+    'LINK_CHECKER': {
+        # requests per second to any one host (0 = no limit), and how many
+        # requests may be sent at once before the rate applies
+        "RATE_LIMIT": 10.0,
+        "RATE_BURST": 10,
+        # never honor a Retry-After longer than this many seconds
+        "MAX_RETRY_AFTER": 300,
+        # seconds to back off a host that answers 429 (or FTP 421) without Retry-After
+        "RETRY_AFTER_DEFAULT": 30,
+        }
+    }
+tb_cfg.update_if_none(dict_of_parameters = default_config, recurse = True)
+
+RETRY_AFTER_STATUS_CODES = (429, 503)
+
+
+def host_key(url: str) -> str:
+    """
+    Return the lower-cased netloc of url; used to group requests by host.
+    A bare host (e.g., 'ftp.pjm.com') is its own key.
+    """
+    parts = urlparse(str(url).strip())
+    return (parts.netloc or parts.path.split('/')[0]).lower()
+
+
+def parse_retry_after(value) -> float:
+    """
+    Return the number of seconds a Retry-After header value asks the client to
+    wait.  The value may be a number of seconds or an HTTP-date.  Returns None
+    if value cannot be parsed.
+    """
+    if value is None:
+        return None
+    value = str(value).strip()
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        retry_at = parsedate_to_datetime(value)
+    except (TypeError, ValueError, IndexError):
+        return None
+    if retry_at.tzinfo is None:
+        retry_at = retry_at.replace(tzinfo = timezone.utc)
+    return max(0.0, (retry_at - dtdt.now(timezone.utc)).total_seconds())
+
+
+class TokenBucket:
+    """
+    Token bucket: up to burst requests at once, refilled at rate requests per
+    second.  block(seconds) holds back all requests (e.g., for a Retry-After).
+    """
+    def __init__(self, rate: float, burst: int = 1):
+        """
+        :param rate: tokens added per second.  0 (or less) = no limit.
+        :param burst: max tokens held, i.e., requests that may be sent at once.
+        """
+        self.rate = rate
+        self.burst = max(1, int(burst))
+        self.tokens = float(self.burst)
+        self.blocked_until = 0.0
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self, now: float):
+        if self.rate > 0:
+            self.tokens = min(self.burst, self.tokens + (now - self._updated) * self.rate)
+        else:
+            self.tokens = float(self.burst)
+        self._updated = now
+
+    def _delay(self, now: float) -> float:
+        self._refill(now)
+        delay = max(0.0, self.blocked_until - now)
+        if self.tokens < 1:
+            delay = max(delay, (1 - self.tokens) / self.rate)
+        return delay
+
+    def delay(self) -> float:
+        """ Seconds until a token is available.  0 = acquire() would not wait. """
+        with self._lock:
+            return self._delay(time.monotonic())
+
+    def acquire(self) -> float:
+        """ Take a token, waiting for one if necessary.  Returns seconds waited. """
+        waited = 0.0
+        while True:
+            with self._lock:
+                delay = self._delay(time.monotonic())
+                if delay <= 0:
+                    self.tokens -= 1
+                    return waited
+            time.sleep(delay)
+            waited += delay
+
+    def block(self, seconds: float):
+        """ Hold back all requests for seconds (from now). """
+        with self._lock:
+            self.blocked_until = max(self.blocked_until, time.monotonic() + seconds)
+
+
+class RateLimiter:
+    """ A TokenBucket per host, created on first use. """
+    def __init__(self, rate: float = None, burst: int = None,
+                 max_retry_after: float = None, retry_after_default: float = None):
+        """
+        Arguments left as None are read from tb_cfg['LINK_CHECKER'].
+        :param rate: requests per second to any one host.  0 = no limit.
+        :param burst: requests that may be sent to a host at once
+        :param max_retry_after: cap, in seconds, on any Retry-After honored
+        :param retry_after_default: seconds to back off a host that answers 429
+                                    without a Retry-After header
+        """
+        cfg = tb_cfg['LINK_CHECKER']
+        self.rate = cfg['RATE_LIMIT'] if rate is None else rate
+        self.burst = cfg['RATE_BURST'] if burst is None else burst
+        self.max_retry_after = cfg['MAX_RETRY_AFTER'] if max_retry_after is None \
+            else max_retry_after
+        self.retry_after_default = cfg['RETRY_AFTER_DEFAULT'] if retry_after_default is None \
+            else retry_after_default
+        self._buckets = {}
+        self._lock = threading.Lock()
+
+    def bucket(self, url: str) -> TokenBucket:
+        """ Return the TokenBucket of url's host. """
+        return self.host_bucket(host_key(url))
+
+    def host_bucket(self, key: str) -> TokenBucket:
+        """ Return the TokenBucket of a host key, as returned by host_key(url). """
+        with self._lock:
+            if key not in self._buckets:
+                self._buckets[key] = TokenBucket(self.rate, self.burst)
+            return self._buckets[key]
+
+    def wait(self, url: str) -> float:
+        """ Wait until a request to url's host is allowed.  Returns seconds waited. """
+        return self.bucket(url).acquire()
+
+    def delay(self, url: str) -> float:
+        """ Seconds until a request to url's host would be allowed. """
+        return self.bucket(url).delay()
+
+    def delay_for_host(self, key: str) -> float:
+        """ Seconds until a request to a host key (see host_key) would be allowed. """
+        return self.host_bucket(key).delay()
+
+    def block(self, url: str, seconds: float):
+        """ Hold back all requests to url's host for seconds (at most max_retry_after). """
+        self.bucket(url).block(min(seconds, self.max_retry_after))
+
+    def retry_after(self, url: str, response) -> float:
+        """
+        If response (a requests.Response) is a 429 or 503 with a Retry-After
+        header, hold back url's host for that long.  A 429 without one holds back
+        the host for retry_after_default seconds.
+        :return: seconds the host is held back (0 = not held back)
+        """
+        if response is None or response.status_code not in RETRY_AFTER_STATUS_CODES:
+            return 0
+        seconds = parse_retry_after(response.headers.get('Retry-After'))
+        if seconds is None:
+            if response.status_code != 429:
+                return 0
+            seconds = self.retry_after_default
+        seconds = min(seconds, self.max_retry_after)
+        self.block(url, seconds)
+        return seconds
+
+    def clear(self):
+        """ Forget all hosts' buckets (e.g., after changing rate or burst). """
+        with self._lock:
+            self._buckets = {}
+
+
+# the rate limiter shared by toolbox's http sessions, link checks and ftp connections
+rate_limiter = RateLimiter()
+
+
+def run_bounded(func, jobs: list, max_workers: int = 1, per_host_limit: int = 0,
+                on_done = None, limiter: RateLimiter = None) -> list:
+    """
+    Call func(**kwargs) for each kwargs dict in jobs using a pool of at most
+    max_workers threads, with at most per_host_limit calls in flight against
+    any single host (host taken from kwargs['url']).  Jobs are dispatched
+    round-robin across hosts, so one slow host cannot tie up every worker, and
+    a host held back by limiter is skipped until it may be sent to again.
+    :param func: the function to call, e.g., toolbox.link_checker.deep_link_check
+    :param jobs: list of kwargs dicts; each must contain a 'url' key
+    :param max_workers: max number of threads.  1 (or less) runs serially in
+                        the calling thread.
+    :param per_host_limit: max concurrent calls per host.  0 = no limit.
+    :param on_done: optional callback, on_done(position, result), called in the
+                    calling thread as each job completes.
+    :param limiter: the RateLimiter that func's requests are subject to.
+                    Default: rate_limiter.
+    :return: list of results in the same order as jobs
+    """
+    limiter = limiter or rate_limiter
+    results = [None] * len(jobs)
+    if max_workers is None or max_workers <= 1:
+        for i, kwargs in enumerate(jobs):
+            results[i] = func(**kwargs)
+            if on_done:
+                on_done(i, results[i])
+        return results
+
+    # queue job positions by host, preserving the original order within a host
+    pending = OrderedDict()
+    for i, kwargs in enumerate(jobs):
+        pending.setdefault(host_key(kwargs['url']), deque()).append(i)
+    in_flight = defaultdict(int)
+    futures = {}
+    with ThreadPoolExecutor(max_workers = max_workers) as pool:
+        while pending or futures:
+            # fill free worker slots, one job per host per pass
+            next_ready = None
+            submitted = True
+            while submitted and len(futures) < max_workers:
+                submitted = False
+                for host in list(pending.keys()):
+                    if len(futures) >= max_workers:
+                        break
+                    if per_host_limit and in_flight[host] >= per_host_limit:
+                        continue
+                    delay = limiter.delay_for_host(host)
+                    if delay > 0:
+                        # rate limited: leave the worker free for another host
+                        next_ready = delay if next_ready is None else min(next_ready, delay)
+                        continue
+                    i = pending[host].popleft()
+                    if not pending[host]:
+                        del pending[host]
+                    in_flight[host] += 1
+                    futures[pool.submit(func, **jobs[i])] = (i, host)
+                    submitted = True
+
+            if not futures:
+                # every remaining host is rate limited
+                time.sleep(next_ready)
+                continue
+            done, _ = wait(futures, timeout = next_ready, return_when = FIRST_COMPLETED)
+            for future in done:
+                i, host = futures.pop(future)
+                in_flight[host] -= 1
+                results[i] = future.result()
+                if on_done:
+                    on_done(i, results[i])
+    return results
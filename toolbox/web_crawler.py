@@ -22,7 +22,14 @@ main functions:
 
     broken_link_finder
         Checks for broken links on a specific web page(s) as specified by the urls argument.
-        This is not a recursive function.
+        This is not a recursive function.  Links are checked concurrently by an
+        asyncio engine (check_links_async) with global and per-host limits, or by
+        a thread pool when already inside an event loop (see check_links).
+
+    crawl
+        Like broken_link_finder, but breadth-first and recursive: pages linked to
+        are searched for links too, within max_depth, max_pages and (optionally)
+        the domains of the starting urls.
 
 Like other toolbox modules, this one gets the most general configruation information
 from the toolbox config file.  You can find its location
@@ -71,6 +78,7 @@ Function call heirarchy:
             clean_url
 """
 
+import asyncio
 import time
 # import ftplib
 from bs4 import BeautifulSoup
@@ -79,6 +87,10 @@ import requests
 import requests.exceptions
 from urllib.parse import urlsplit
 from urllib.parse import urljoin
+from collections import defaultdict, deque
+from concurrent.futures import ThreadPoolExecutor
+import functools
+import hashlib
 import os
 import pandas as pd  # pandas 1.1.5 or higher.
 from toolbox.file_util.hash import hash_match  # from tsd-python repo
@@ -97,6 +109,8 @@ from datetime import datetime as dtdt
 from toolbox import appdirs, tb_cfg, ez_ftp
 from toolbox import temp_file
 from toolbox.swiss_army import is_valid_url
+from toolbox.http_session import get_session
+from toolbox.rate_limit import rate_limiter, run_bounded
 
 from warnings import warn
 
@@ -147,6 +161,11 @@ DEFAULT_RESULTS_CSV = %(DIR_OUT)s\links_to_check_results.csv
 CHECK_LINKS_ON = https://www.pjm.com/markets-and-operations/etools/oasis.aspx
 # CHECK_LINKS_ON = https://www.pjm.com/markets-and-operations/etools/oasis.aspx, https://www.pjm.com/markets-and-operations/etools/oasis/merch-trans-facilities, https://www.pjm.com/markets-and-operations/etools/oasis/special-notices, https://www.pjm.com/markets-and-operations/etools/oasis/system-information, https://www.pjm.com/markets-and-operations/etools/oasis/atc-information, https://www.pjm.com/markets-and-operations/etools/oasis/oasis-reference,https://www.pjm.com/markets-and-operations/etools/oasis/conf-reserv, https://www.pjm.com/markets-and-operations/etools/oasis/outage-accel, https://www.pjm.com/markets-and-operations/etools/oasis/order-890
 
+# Max links checked at once, in total and per host, and per-request timeout (seconds)
+MAX_CONCURRENCY = 16
+PER_HOST_LIMIT = 4
+REQUEST_TIMEOUT = 30
+
 EXCLUDE_LINKS_STARTING_WITH = mailto, http://www.linkedin.com/, https://videos.pjm.com/, https://dataminer2.pjm, https://www.pjm.com/-/media/etools/oasis/ppl-fac-008-facility-list.ashx, https://pjm.force.com, http://www.naesb.org, http://www.youtube.com, http://oasis.pjm.com/system.htm, http://oasis.pjm.com/drate.html, http://twitter.com, http://insidelines.pjm.com, https://urldefense.proofpoint.com,
 """
 
@@ -238,8 +257,12 @@ if len(cfg) > 0:
     # CHECK_LINKS_ON = CHECK_LINKS_ON.split(',')
     EXCLUDE_LINKS_STARTING_WITH = cfg_default('BROKEN_LINKS_FINDER',
                                               'EXCLUDE_LINKS_STARTING_WITH', '')
+    # a trailing comma would add '', which every link starts with
     EXCLUDE_LINKS_STARTING_WITH = [s.strip() for s in
-                                   EXCLUDE_LINKS_STARTING_WITH.split(',')]
+                                   EXCLUDE_LINKS_STARTING_WITH.split(',') if s.strip()]
+    MAX_CONCURRENCY = int(cfg_default('BROKEN_LINKS_FINDER', 'MAX_CONCURRENCY', 16))
+    PER_HOST_LIMIT = int(cfg_default('BROKEN_LINKS_FINDER', 'PER_HOST_LIMIT', 4))
+    REQUEST_TIMEOUT = float(cfg_default('BROKEN_LINKS_FINDER', 'REQUEST_TIMEOUT', 30))
 
     try:
         print('type(cfg): ', type(cfg))
@@ -274,7 +297,8 @@ def clean_url(precleaned_url):
 def get_links_from_webpage(url: str,
                            full_links: bool = True,
                            separate_foreign: bool = False,
-                           exclude_prefixes: Iterable = EXCLUDE_LINKS_STARTING_WITH) -> dict:
+                           exclude_prefixes: Iterable = EXCLUDE_LINKS_STARTING_WITH,
+                           session = None) -> dict:
     """
     Returns unique links contained on a webpage (as a dict of sets)
     :param url: the URL to open and search
@@ -288,15 +312,47 @@ def get_links_from_webpage(url: str,
     :param exclude_prefixes: list-like: list of prefixes.  If any found link
                     starts with a prefix in this list, that link will be
                     excluded from the returned dict.
+    :param session: requests.Session with which to get url.  Default: requests.get
     :return: a dictionary of one or two sets, depending on the value of separate_foreign
     """
+    foreign_urls = set()  # external URLs
+    try:
+        response_txt = (session or requests).get(url).text
+    except requests.exceptions.MissingSchema as e:
+        if separate_foreign:
+            return {'local_urls': set(), 'foreign_urls': set()}
+        else:
+            return {'urls': set()}
+    local_urls = links_from_html(url, response_txt, full_links = full_links,
+                                 exclude_prefixes = exclude_prefixes)
+
+    # return the result, a set of sets
+    if separate_foreign:
+        res = {'local_urls': local_urls, 'foreign_urls': foreign_urls}
+    else:
+        res = {'urls': local_urls | foreign_urls}
+    return res
+
+
+def links_from_html(url: str, response_txt: str, full_links: bool = True,
+                    exclude_prefixes: Iterable = EXCLUDE_LINKS_STARTING_WITH) -> set:
+    """
+    Returns the unique links in response_txt, the html of the page at url.
+    See get_links_from_webpage.
+    :param url: the URL of the page, against which relative links are resolved
+    :param response_txt: the page's html
+    :param full_links: bool: True: return fully qualified links
+                             False: return links exactly as presented
+    :param exclude_prefixes: list-like: links starting with any of these are excluded
+    :return: set of links
+    """
     if type(exclude_prefixes) == type(None):
         exclude_prefixes = []
     elif type(exclude_prefixes) == str:
         exclude_prefixes = [exclude_prefixes]
+    exclude_prefixes = [prefix for prefix in exclude_prefixes if prefix]
 
     local_urls = set()
-    foreign_urls = set()  # external URLs
 
     # get base url
     parts = urlsplit(url)
@@ -304,13 +360,6 @@ def get_links_from_webpage(url: str,
     strip_base = parts.netloc.replace('www.', '')
     path = url[:url.rfind('/') + 1]
 
-    try:
-        response_txt = requests.get(url).text
-    except requests.exceptions.MissingSchema as e:
-        if separate_foreign:
-            return {'local_urls': set(), 'foreign_urls': set()}
-        else:
-            return {'urls': set()}
     try:
         soup = BeautifulSoup(response_txt, features = 'lxml')
     except AttributeError as e:
@@ -358,12 +407,7 @@ def get_links_from_webpage(url: str,
                 anchor = path + anchor
             local_urls.add(anchor)
 
-    # return the result, a set of sets
-    if separate_foreign:
-        res = {'local_urls': local_urls, 'foreign_urls': foreign_urls}
-    else:
-        res = {'urls': local_urls | foreign_urls}
-    return res
+    return local_urls
 
 
 def webpage_contains_url(parent_url: str, child_url: str, absolute_path: bool = False):
@@ -463,45 +507,55 @@ def view_file(filename: str, viewer: str = DEFAULT_CSV_VIEWER):
 # ##############################################################################
 # Main Functions
 # ##############################################################################
-def link_check(link: str):
+def link_check(link: str, session = None, timeout: float = None):
     """
     link_check confirms that when "response = requests.get(link)" is run,
     response.ok == True.  For ftp, verifies the file by attempting to get file size.
     1) attempt to open header
-    2) attempt to get a successful response
-    3) if FTP, attempt to download file
-    4) return a 2-item tuple of success, status424
+    2) if the header is not ok (some servers refuse HEAD), attempt to get a
+       successful response.  The body is not downloaded.
+    3) if FTP, attempt to get the file size
+    4) return a 2-item tuple of success, status
 
     :param link: url (http or ftp) to check.
+    :param session: requests.Session to use.  Default: toolbox.http_session.get_session()
+    :param timeout: seconds to wait for the server to connect and to respond.
+                    None = wait forever.
     :return: tuple(success, status)
         success: True/False
         status: descriptive status
     """
     link = link.strip()
-    try:
-        head = requests.head(link)
-        success = head.ok
-        status = "Retrieved header from: {link}"
+    if not link.startswith('ftp'):
+        http = session or get_session()
         try:
-            response = requests.get(link)
+            response = http.head(link, allow_redirects = True, timeout = timeout)
             success = response.ok
-            status = "Received response from: {link}"
+            status = f"Retrieved header from: {link}"
+            if not success:
+                try:
+                    response = http.get(link, stream = True, timeout = timeout)
+                    response.close()
+                    success = response.ok
+                    status = f"Received response from: {link}"
+                except Exception as e:
+                    success = False
+                    status = f"{e}.  Retrieved header but failed to open page: {link}"
+
         except Exception as e:
             success = False
-            status = f"{e}.  Retrieved header but failed to open page: {link}"
-
-    except Exception as e:
-        success = False
-        status = f"{e}.  Failed to retrieved header from: {link}"
+            status = f"{e}.  Failed to retrieved header from: {link}"
 
-    if link.startswith('ftp'):
+    else:
         # success = ez_ftp.exists(link)
         # if success:
         #     status = f"FTP file found: {link}"
         # else:
         #     status = f"FTP file not found: {link}"
         # get stats from ftp server
-        stats = ez_ftp.stats(link)
+        # a pooled connection: link_check may run in many threads at once
+        with ez_ftp.ftp_pool.connection(link) as ftp:
+            stats = ftp.stats(link)
         basename = stats.basename
         file_size = stats.size
         if not basename:
@@ -1051,14 +1105,125 @@ def check_links_from_file(input_file: str = DEFAULT_LINKS_CSV,
     return res
 
 
+async def check_links_async(links: Iterable,
+                            max_concurrency: int = MAX_CONCURRENCY,
+                            per_host_limit: int = PER_HOST_LIMIT,
+                            timeout: float = REQUEST_TIMEOUT,
+                            session = None,
+                            print_to_console: bool = False,
+                            check_func = None) -> list:
+    """
+    Check links concurrently with link_check.  Each check runs in a worker
+    thread over the shared, pooled session (toolbox.http_session), so
+    connections to the same host are kept alive and reused.  Requests to each
+    host are paced by toolbox.rate_limit.rate_limiter.
+    :param links: the urls to check
+    :param max_concurrency: max number of links checked at once
+    :param per_host_limit: max number of links checked at once on any one host.
+                           0 = no per-host limit.
+    :param timeout: seconds to wait for each request to connect and to respond
+    :param session: requests.Session to use.  Default: toolbox.http_session.get_session()
+    :param print_to_console: True / False -- print each link to console when checked.
+    :param check_func: called as check_func(link, session = session, timeout = timeout)
+                       instead of link_check; must return a (success, status, ...)
+                       tuple.  Any extra items are added to the link's result.
+    :return: list of (link, success, status) tuples, in the order of links
+    """
+    links = list(links)
+    check_func = check_func or link_check
+    max_concurrency = max(1, max_concurrency)
+    per_host_limit = per_host_limit or max_concurrency
+    session = session or get_session()
+    loop = asyncio.get_running_loop()
+    slots = asyncio.Semaphore(max_concurrency)
+    host_slots = defaultdict(lambda: asyncio.Semaphore(per_host_limit))
+    done = 0
+
+    async def check(link):
+        nonlocal done
+        # wait for a host slot (and for the host's rate limit) before taking a
+        # global slot, so links to a busy or throttled host do not keep other
+        # hosts waiting
+        async with host_slots[urlsplit(link).netloc.lower()]:
+            delay = rate_limiter.delay(link)
+            while delay > 0:
+                await asyncio.sleep(delay)
+                delay = rate_limiter.delay(link)
+            async with slots:
+                try:
+                    result = await loop.run_in_executor(
+                        executor, functools.partial(check_func, link, session = session,
+                                                    timeout = timeout))
+                except Exception as e:
+                    result = False, f"{e}.  Unexpected error checking: {link}"
+        done += 1
+        if print_to_console:
+            print(f'Checked link {done} of {len(links)}: {link}')
+        return (link, *result)
+
+    with ThreadPoolExecutor(max_workers = max_concurrency) as executor:
+        return list(await asyncio.gather(*[check(link) for link in links]))
+
+
+def check_links(links: Iterable,
+                max_concurrency: int = MAX_CONCURRENCY,
+                per_host_limit: int = PER_HOST_LIMIT,
+                timeout: float = REQUEST_TIMEOUT,
+                session = None,
+                print_to_console: bool = False,
+                check_func = None) -> list:
+    """
+    Check links concurrently.  Runs check_links_async in a new event loop or, if
+    called from a running event loop (e.g., in Jupyter), where asyncio.run is not
+    allowed, in a thread pool with toolbox.rate_limit.run_bounded.  Arguments and
+    return value are those of check_links_async.
+    """
+    try:
+        asyncio.get_running_loop()
+    except RuntimeError:
+        return asyncio.run(check_links_async(links, max_concurrency = max_concurrency,
+                                             per_host_limit = per_host_limit,
+                                             timeout = timeout, session = session,
+                                             print_to_console = print_to_console,
+                                             check_func = check_func))
+
+    links = list(links)
+    session = session or get_session()
+    check_func = check_func or link_check
+
+    def check(url):
+        try:
+            result = check_func(url, session = session, timeout = timeout)
+        except Exception as e:
+            result = False, f"{e}.  Unexpected error checking: {url}"
+        return (url, *result)
+
+    done = 0
+
+    def on_done(position, result):
+        nonlocal done
+        done += 1
+        if print_to_console:
+            print(f'Checked link {done} of {len(links)}: {result[0]}')
+
+    return run_bounded(check, [{'url': link} for link in links],
+                       max_workers = max(1, max_concurrency), per_host_limit = per_host_limit,
+                       on_done = on_done)
+
+
 def broken_link_finder(urls: Union[str, list, tuple, set],
                        print_to_console: bool = False,
                        file_out = None,
                        viewer = DEFAULT_CSV_VIEWER,
                        open_results_when_done = True,
-                       exclude_prefixes: Iterable = EXCLUDE_LINKS_STARTING_WITH):
+                       exclude_prefixes: Iterable = EXCLUDE_LINKS_STARTING_WITH,
+                       max_concurrency: int = MAX_CONCURRENCY,
+                       per_host_limit: int = PER_HOST_LIMIT,
+                       timeout: float = REQUEST_TIMEOUT,
+                       session = None):
     """
     Checks for broken links on a specific web page(s) as specified by the urls argument.
+    The links found are checked concurrently (see check_links).
     :param urls: the url or urls to check.
     :param print_to_console: True / False -- print each link to console while checking.
     :param file_out: if not None, name of file to which to write broken link
@@ -1066,6 +1231,10 @@ def broken_link_finder(urls: Union[str, list, tuple, set],
     :param viewer: program to use to open and view the results (csv file)
     :param open_results_when_done: True/False
     :param exclude_prefixes: list-like
+    :param max_concurrency: max number of links checked at once
+    :param per_host_limit: max number of links checked at once on any one host
+    :param timeout: seconds to wait for each request to connect and to respond
+    :param session: requests.Session to use.  Default: toolbox.http_session.get_session()
     :return: list of sets of broken_urls, local_urls, foreign_urls, processed_urls
     """
 
@@ -1089,56 +1258,16 @@ def broken_link_finder(urls: Union[str, list, tuple, set],
         links += lst['urls']
 
     # remove duplicates
-    links = set(links)
-
-    tot = len(links)
-    cnt = 0
-    for link in links:
-        if print_to_console:
-            cnt += 1
-            print(f'Checking link {cnt} of {tot}: {link}')
-        try:
-            # TODO: should probably leverage link_check instead of repeating code.
-            # compare the code in this function and link_check to see what's up.
-            head = requests.head(link)
-            success = head.ok
-            status = "Retrieved header from: {link}"
-            try:
-                response = requests.get(link)
-                success = response.ok
-                status = "Received response from: {link}"
-            except Exception as e:
-                success = False
-                status = f"{e}.  Retrieved header but failed to open page: {link}"
-
-        except Exception as e:
-            success = False
-            status = f"{e}.  Failed to retrieved header from: {link}"
-
-        if link.startswith('ftp:'):
-            # get stats from ftp server
-            stats = ez_ftp.stats(link)
-            filename = stats.basename
-            file_size = stats.size
-            # filename, file_size = ftp_file_size(link)
-            if not filename:
-                success = False
-                status = f"FTP file not found: {link}"
-            if type(filename) == str:
-                if file_size > 0:
-                    success = True
-                    status = f"FTP file found: {link}"
-                else:
-                    success = False
-                    status = f"FTP file is empty: {link}"
-            else:
-                success = False
-                status = f"{file_size}.  FTP file: {link}"
+    links = list(dict.fromkeys(links))
 
+    results = check_links(links, max_concurrency = max_concurrency,
+                          per_host_limit = per_host_limit, timeout = timeout,
+                          session = session, print_to_console = print_to_console)
+    for link, success, status in results:
         if success:
-            # found a broken link
             working_urls.append((link, success, status))
         else:
+            # found a broken link
             broken_urls.append((link, success, status))
 
     processed_urls = working_urls + broken_urls
@@ -1164,6 +1293,156 @@ def broken_link_finder(urls: Union[str, list, tuple, set],
     return ReturnTuple(processed_urls, broken_urls, run_time)
 
 
+def url_digest(url: str) -> bytes:
+    """
+    A compact (8 byte) key for url, for sets of many visited urls.  The url is
+    cleaned and its #fragment dropped first, so links to parts of one page match.
+    """
+    url = clean_url(url.split('#', 1)[0])
+    return hashlib.blake2b(url.encode('utf-8', 'surrogatepass'), digest_size = 8).digest()
+
+
+def _check_page(url: str, session, timeout: float, exclude_prefixes: Iterable) -> tuple:
+    """
+    Check url with one GET (no HEAD first) and, if it is an html page, collect its
+    links from the same response.
+    :return: tuple(success, status, links), like link_check plus the set of links
+    """
+    try:
+        response = session.get(url, stream = True, timeout = timeout)
+    except Exception as e:
+        return False, f"{e}.  Failed to open page: {url}", set()
+    with response:
+        success = response.ok
+        status = f"Received response from: {url}"
+        if not success or 'html' not in response.headers.get('content-type', ''):
+            # do not download files (pdf, xlsx, ...) only to find they have no links
+            return success, status, set()
+        try:
+            links = links_from_html(response.url, response.text,
+                                    exclude_prefixes = exclude_prefixes)
+        except Exception as e:
+            warn(f'Unable to get links from "{url}". {e}')
+            links = set()
+    return success, status, links
+
+
+def crawl(urls: Union[str, list, tuple, set],
+          max_depth: int = 2,
+          max_pages: int = 1000,
+          same_domain: bool = True,
+          print_to_console: bool = False,
+          file_out = None,
+          viewer = DEFAULT_CSV_VIEWER,
+          open_results_when_done = True,
+          exclude_prefixes: Iterable = EXCLUDE_LINKS_STARTING_WITH,
+          max_concurrency: int = MAX_CONCURRENCY,
+          per_host_limit: int = PER_HOST_LIMIT,
+          timeout: float = REQUEST_TIMEOUT,
+          session = None):
+    """
+    Crawls a site breadth-first from urls, checking every link found for broken links.
+    Unlike broken_link_finder, the pages linked to are searched for links too, down
+    to max_depth.  Pages that will be searched are checked with the same GET that
+    reads their links, so each is requested once.  Each url is checked once;
+    visited urls are kept as 8-byte digests (see url_digest), so large crawls
+    use little memory.
+    :param urls: the url or urls at which to start (depth 0).
+    :param max_depth: search pages up to this many links away from urls.  Links on
+                      pages at max_depth are checked but not followed.
+                      1 = check the links on urls (like broken_link_finder).
+    :param max_pages: stop after checking this many urls.
+    :param same_domain: True: only search pages on the domains of urls for links.
+                        Links to other domains are checked but not followed.
+    :param print_to_console: True / False -- print each link to console while checking.
+    :param file_out: if not None, name of file to which to write the results
+    :param viewer: program to use to open and view the results (csv file)
+    :param open_results_when_done: True/False
+    :param exclude_prefixes: list-like: links starting with any of these are
+                             neither checked nor followed.
+    :param max_concurrency: max number of links checked at once
+    :param per_host_limit: max number of links checked at once on any one host
+    :param timeout: seconds to wait for each request to connect and to respond
+    :param session: requests.Session to use.  Default: toolbox.http_session.get_session()
+    :return: ReturnTuple(processed_urls, broken_urls, run_time), where
+             processed_urls and broken_urls are lists of (link, success, status, depth)
+    """
+    start_time = time.time()
+    session = session or get_session()
+
+    if type(urls) == str:
+        urls = [urls]
+    if exclude_prefixes is None:
+        exclude_prefixes = []
+    if type(exclude_prefixes) == str:
+        exclude_prefixes = [exclude_prefixes]
+    if 'mailto' not in exclude_prefixes:
+        exclude_prefixes = list(exclude_prefixes)
+        exclude_prefixes.append('mailto')
+
+    def domain(url):
+        return urlsplit(url).netloc.lower().replace('www.', '')
+
+    domains = {domain(url) for url in urls}
+    visited = set()
+    frontier = deque()
+    for url in urls:
+        if url_digest(url) not in visited:
+            visited.add(url_digest(url))
+            frontier.append((url, 0))
+
+    processed_urls = []
+    broken_urls = []
+    while frontier:
+        # breadth-first: check every url at this depth, then follow their links
+        depth = frontier[0][1]
+        level = []
+        while frontier and frontier[0][1] == depth:
+            level.append(frontier.popleft()[0])
+        if print_to_console:
+            print(f'Depth {depth}: checking {len(level)} links')
+        to_search = set() if depth >= max_depth else \
+            {link for link in level if link.startswith('http')
+             and (not same_domain or domain(link) in domains)}
+
+        def check(link, session, timeout):
+            if link in to_search:
+                return _check_page(link, session, timeout, exclude_prefixes)
+            return link_check(link, session = session, timeout = timeout)
+
+        results = check_links(level, max_concurrency = max_concurrency,
+                              per_host_limit = per_host_limit, timeout = timeout,
+                              session = session, print_to_console = print_to_console,
+                              check_func = check)
+        for link, success, status, *page_links in results:
+            processed_urls.append((link, success, status, depth))
+            if not success:
+                broken_urls.append((link, success, status, depth))
+            for child in sorted(page_links[0] if page_links else ()):
+                if len(visited) >= max_pages:
+                    break
+                digest = url_digest(child)
+                if digest not in visited:
+                    visited.add(digest)
+                    frontier.append((child, depth + 1))
+
+    if file_out:
+        df = pd.DataFrame(data = processed_urls, index = None,
+                          columns = ['link', 'success', 'header', 'depth'])
+        df.to_csv(path_or_buf = file_out, sep = ',', header = True)
+        if open_results_when_done:
+            # open result file in viewer text editor).
+            view_file(filename = file_out, viewer = viewer)
+
+    run_time = time.time() - start_time
+    if print_to_console:
+        print(f'\n\nChecked: {len(processed_urls)} links in {run_time} seconds')
+        print(f'\nFound {len(broken_urls)} BROKEN LINKS: \n', broken_urls)
+
+    ReturnTuple = namedtuple('ReturnTuple', 'processed_urls broken_urls run_time')
+    return ReturnTuple(processed_urls, broken_urls, run_time)
+
+
 # ##############################################################################
 # examples
 # ##############################################################################